@@ -0,0 +1,148 @@
+"""
+Sync и async представления каталога под uvicorn.
+
+Заполняет временную SQLite-базу (benchmarks.seed), по очереди запускает uvicorn
+с CATALOG_ASYNC_VIEWS=0 и CATALOG_ASYNC_VIEWS=1 и нагружает список продуктов,
+карточку продукта и карточку версии с разным числом одновременных соединений.
+Для каждого сочетания выводит число запросов в секунду и p50/p95/p99.
+
+    python -m benchmarks.bench_async [--scale small] [--concurrency 1 16 64] [--duration 5] [--workers 1]
+"""
+import argparse
+import asyncio
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import django
+
+DIRECTORY = tempfile.TemporaryDirectory()
+os.environ['NAME_POSTGRES'] = os.path.join(DIRECTORY.name, 'bench.sqlite3')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'skypro_diplom.settings')
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.urls import reverse  # noqa: E402
+
+from benchmarks.seed import SCALES, seed, user_email  # noqa: E402
+from catalog.models import Product, Version  # noqa: E402
+from skypro_diplom.utils import percentile  # noqa: E402
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def fetch(port, path, cookie):
+    """Один GET по отдельному соединению, возвращает код ответа."""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write((f'GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nCookie: {cookie}\r\n'
+                  'Connection: close\r\n\r\n').encode())
+    await writer.drain()
+    status_line = await reader.readline()
+    await reader.read()
+    writer.close()
+    await writer.wait_closed()
+    return int(status_line.split()[1])
+
+
+async def load(port, paths, cookie, concurrency, duration):
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + duration
+
+    async def worker(seed):
+        nonlocal errors
+        rng = random.Random(seed)
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                status = await fetch(port, rng.choice(paths), cookie)
+            except OSError:
+                status = None
+            latencies.append((time.perf_counter() - started) * 1000)
+            errors += status != 200
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        'rps': len(latencies) / elapsed,
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'p99': percentile(latencies, 99),
+        'errors': errors,
+    }
+
+
+def start_uvicorn(async_views, workers):
+    port = free_port()
+    env = {**os.environ, 'CATALOG_ASYNC_VIEWS': '1' if async_views else '0', 'PERFORMANCE_ENABLED': '0'}
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'skypro_diplom.asgi:application', '--port', str(port),
+         '--workers', str(workers), '--log-level', 'warning', '--no-access-log'],
+        env=env,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return process, port
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError('uvicorn не запустился')
+
+
+def prepare(scale):
+    call_command('migrate', verbosity=0)
+    seed(**SCALES[scale])
+    client = Client()
+    client.force_login(get_user_model().objects.get(email=user_email(0)))
+    cookie = f"{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}"
+
+    product_pks = list(Product.objects.values_list('pk', flat=True)[:200])
+    version_pks = list(Version.objects.values_list('pk', flat=True)[:200])
+    home = reverse('catalog:home')
+    return cookie, {
+        'home': [home],
+        'product_detail': [reverse('catalog:product_detail', args=[pk]) for pk in product_pks],
+        'version_detail': [reverse('catalog:version-detail', args=[pk]) for pk in version_pks],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', choices=SCALES, default='small')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 16, 64])
+    parser.add_argument('--duration', type=float, default=5, help='секунд на каждое сочетание')
+    parser.add_argument('--workers', type=int, default=1, help='процессов uvicorn')
+    args = parser.parse_args()
+
+    cookie, scenarios = prepare(args.scale)
+    print(f"масштаб: {args.scale}, процессов uvicorn: {args.workers}, {args.duration} с на замер")
+    print(f"{'сценарий':<16}{'views':<7}{'соедин.':>8}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'ошибок':>8}")
+    for async_views in (False, True):
+        process, port = start_uvicorn(async_views, args.workers)
+        try:
+            for name, paths in scenarios.items():
+                for concurrency in args.concurrency:
+                    stats = asyncio.run(load(port, paths, cookie, concurrency, args.duration))
+                    print(f"{name:<16}{'async' if async_views else 'sync':<7}{concurrency:>8}{stats['rps']:>9.1f}"
+                          f"{stats['p50']:>9.1f}{stats['p95']:>9.1f}{stats['p99']:>9.1f}{stats['errors']:>8}")
+        finally:
+            process.terminate()
+            process.wait()
+    DIRECTORY.cleanup()
+
+
+if __name__ == '__main__':
+    main()
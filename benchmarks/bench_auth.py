@@ -0,0 +1,170 @@
+"""
+Вход и авторизованные запросы до и после настройки сессий, кеша пользователя и хеширования паролей.
+
+Создает отдельную тестовую базу (benchmarks.seed) и через тестовый клиент Django замеряет:
+  - хеширование: время проверки пароля каждым алгоритмом из settings.PASSWORD_HASHERS
+    (argon2 - при установленном argon2-cffi);
+  - вход: POST на страницу входа для пользователя с хешем этого алгоритма;
+  - авторизованные страницы: список и карточка продукта с сессиями в БД без кеша
+    пользователя (до) и с cached_db и кешем пользователя (после).
+Для каждого сценария выводит p50/p95/p99 и число SQL-запросов на запрос.
+
+    python -m benchmarks.bench_auth [--scale small] [--logins 20] [--pages 200] [--output result.json]
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'skypro_diplom.settings')
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.contrib.auth.hashers import get_hasher, make_password  # noqa: E402
+from django.core.cache import cache  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test import Client, override_settings  # noqa: E402
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment  # noqa: E402
+from django.urls import reverse  # noqa: E402
+
+from benchmarks.seed import PASSWORD, SCALES, seed, user_email  # noqa: E402
+from catalog.models import Product  # noqa: E402
+from skypro_diplom.utils import percentile  # noqa: E402
+
+HASHERS = {
+    'pbkdf2': 'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'scrypt': 'django.contrib.auth.hashers.ScryptPasswordHasher',
+    'argon2': 'django.contrib.auth.hashers.Argon2PasswordHasher',
+}
+SESSION_CONFIGS = {
+    'до: db, без кеша пользователя': {'SESSION_ENGINE': 'django.contrib.sessions.backends.db', 'USER_CACHE_TTL': 0},
+    'после: cached_db, кеш пользователя': {'SESSION_ENGINE': 'django.contrib.sessions.backends.cached_db',
+                                          'USER_CACHE_TTL': 300},
+}
+
+
+def available_hashers():
+    names = []
+    for name, path in HASHERS.items():
+        with override_settings(PASSWORD_HASHERS=[path]):
+            try:
+                get_hasher().salt()
+                make_password('check')
+            except (ValueError, ImportError):
+                continue
+        names.append(name)
+    return names
+
+
+def stats(latencies, queries):
+    return {
+        'requests': len(latencies),
+        'p50_ms': percentile(latencies, 50),
+        'p95_ms': percentile(latencies, 95),
+        'p99_ms': percentile(latencies, 99),
+        'queries': percentile(queries, 50),
+    }
+
+
+def timed(call):
+    with CaptureQueriesContext(connection) as context:
+        started = time.perf_counter()
+        status = call()
+        latency = (time.perf_counter() - started) * 1000
+    return status, latency, len(context.captured_queries)
+
+
+def bench_login(name, iterations):
+    """Вход пользователя, чей пароль захеширован алгоритмом name; каждый раз новый клиент."""
+    User = get_user_model()
+    hashers = [HASHERS[name], *(path for other, path in HASHERS.items() if other != name)]
+    with override_settings(PASSWORD_HASHERS=hashers):
+        user = User.objects.get(email=user_email(0))
+        user.set_password(PASSWORD)
+        user.save(update_fields=['password'])
+        latencies, queries, errors = [], [], 0
+        for _ in range(iterations):
+            client = Client()
+            status, latency, count = timed(lambda: client.post(
+                reverse('users:login'), {'username': user.email, 'password': PASSWORD}).status_code)
+            errors += status != 302
+            latencies.append(latency)
+            queries.append(count)
+        hash_latencies = []
+        encoded = User.objects.get(pk=user.pk).password
+        for _ in range(iterations):
+            started = time.perf_counter()
+            get_hasher().verify(PASSWORD, encoded)
+            hash_latencies.append((time.perf_counter() - started) * 1000)
+    return {**stats(latencies, queries), 'errors': errors, 'verify_p50_ms': percentile(hash_latencies, 50)}
+
+
+def bench_pages(config, iterations, product_pks):
+    """Авторизованные запросы списка и карточек продуктов одним клиентом."""
+    User = get_user_model()
+    with override_settings(**config):
+        cache.clear()
+        client = Client()
+        client.force_login(User.objects.get(email=user_email(0)))
+        rng = random.Random(0)
+        paths = [reverse('catalog:home')] + [reverse('catalog:product_detail', args=[pk]) for pk in product_pks]
+        for path in paths[:10]:
+            client.get(path)
+        latencies, queries, errors = [], [], 0
+        for _ in range(iterations):
+            path = rng.choice(paths)
+            status, latency, count = timed(lambda: client.get(path).status_code)
+            errors += status != 200
+            latencies.append(latency)
+            queries.append(count)
+    return {**stats(latencies, queries), 'errors': errors}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', choices=SCALES, default='small')
+    parser.add_argument('--logins', type=int, default=20, help='входов на каждый алгоритм')
+    parser.add_argument('--pages', type=int, default=200, help='авторизованных запросов на каждую настройку')
+    parser.add_argument('--output', help='записать результат в JSON')
+    args = parser.parse_args()
+
+    setup_test_environment()
+    directory = tempfile.TemporaryDirectory()
+    connection.settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(directory.name, 'bench.sqlite3')
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        cache.clear()
+        seed(**SCALES[args.scale])
+        product_pks = list(Product.objects.values_list('pk', flat=True)[:200])
+        result = {
+            'meta': {'scale': args.scale, 'logins': args.logins, 'pages': args.pages,
+                     'default_hasher': settings.PASSWORD_HASHER},
+            'login': {name: bench_login(name, args.logins) for name in available_hashers()},
+            'pages': {name: bench_pages(config, args.pages, product_pks) for name, config in SESSION_CONFIGS.items()},
+        }
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        directory.cleanup()
+        teardown_test_environment()
+
+    print(f"масштаб: {args.scale}")
+    print(f"{'вход':<40}{'проверка':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'SQL':>6}{'ошибок':>8}")
+    for name, row in result['login'].items():
+        print(f"{name:<40}{row['verify_p50_ms']:>9.1f}{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}"
+              f"{row['p99_ms']:>9.1f}{row['queries']:>6.0f}{row['errors']:>8}")
+    print(f"{'авторизованные страницы':<40}{'':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'SQL':>6}{'ошибок':>8}")
+    for name, row in result['pages'].items():
+        print(f"{name:<40}{'':>9}{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}{row['p99_ms']:>9.1f}"
+              f"{row['queries']:>6.0f}{row['errors']:>8}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
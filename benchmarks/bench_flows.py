@@ -0,0 +1,349 @@
+"""
+Нагрузочный прогон основных сценариев каталога и пользователей.
+
+Создает отдельную тестовую базу, заполняет ее синтетическими данными
+(benchmarks.seed) и гоняет сценарии через тестовый клиент Django (client),
+ASGI-обработчик (asgi) или настоящий локальный WSGI-сервер (server).
+Для каждого сценария выводит число запросов в секунду, p50/p95/p99 времени
+ответа и число SQL-запросов (из skypro_diplom.performance).
+
+    python -m benchmarks.bench_flows [--scale small] [--transport client] [--iterations 100]
+    python -m benchmarks.bench_flows --output result.json
+    python -m benchmarks.bench_flows --baseline benchmarks/baseline.json [--tolerance 0.25] [--slack-ms 5]
+
+С --baseline процесс завершается с кодом 1, если число SQL-запросов выросло,
+сценарий вернул неожиданный код ответа или p95 стал хуже базового больше чем
+на tolerance плюс slack-ms. Абсолютный запас нужен быстрым сценариям: у запросов
+в 10 мс p95 между одинаковыми прогонами колеблется на несколько миллисекунд.
+"""
+import argparse
+import asyncio
+import http.cookiejar
+import itertools
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'skypro_diplom.settings')
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.core.cache import cache  # noqa: E402
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler  # noqa: E402
+from django.core.wsgi import get_wsgi_application  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test import AsyncClient, Client  # noqa: E402
+from django.test.utils import setup_test_environment, teardown_test_environment  # noqa: E402
+from django.urls import reverse  # noqa: E402
+
+from benchmarks.seed import PASSWORD, SCALES, seed, user_email  # noqa: E402
+from catalog.models import Category, Product  # noqa: E402
+from catalog.permissions import CHANGE, filter_modifiable  # noqa: E402
+from skypro_diplom import performance  # noqa: E402
+from skypro_diplom.utils import percentile  # noqa: E402
+
+
+class ClientSession:
+    def __init__(self):
+        self.client = Client()
+
+    def login(self, user):
+        self.client.force_login(user)
+
+    def request(self, method, path, data=None):
+        if method == 'POST':
+            return self.client.post(path, data).status_code
+        return self.client.get(path).status_code
+
+    def close(self):
+        pass
+
+
+class AsgiSession:
+    def __init__(self):
+        self.client = AsyncClient()
+        self.loop = asyncio.new_event_loop()
+
+    def login(self, user):
+        self.loop.run_until_complete(self.client.aforce_login(user))
+
+    def request(self, method, path, data=None):
+        if method == 'POST':
+            response = self.loop.run_until_complete(self.client.post(path, data))
+        else:
+            response = self.loop.run_until_complete(self.client.get(path))
+        return response.status_code
+
+    def close(self):
+        self.loop.close()
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class ServerSession:
+    """HTTP-клиент с куками и CSRF-токеном для настоящего сервера."""
+
+    base_url = None
+
+    def __init__(self):
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies), NoRedirect)
+
+    def csrf_token(self):
+        for cookie in self.cookies:
+            if cookie.name == settings.CSRF_COOKIE_NAME:
+                return cookie.value
+        self.request('GET', reverse('users:login'))
+        return self.csrf_token()
+
+    def login(self, user):
+        self.request('POST', reverse('users:login'), {'username': user.email, 'password': PASSWORD})
+
+    def request(self, method, path, data=None):
+        body = None
+        if data is not None:
+            body = urlencode({**data, 'csrfmiddlewaretoken': self.csrf_token()}).encode()
+        request = urllib.request.Request(self.base_url + path, data=body, method=method)
+        try:
+            with self.opener.open(request) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code
+
+    def close(self):
+        pass
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server():
+    server = ThreadedWSGIServer(('127.0.0.1', 0), QuietRequestHandler, allow_reuse_address=False)
+    server.set_app(get_wsgi_application())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    ServerSession.base_url = f'http://127.0.0.1:{server.server_port}'
+    return server
+
+
+TRANSPORTS = {
+    'client': ClientSession,
+    'asgi': AsgiSession,
+    'server': ServerSession,
+}
+
+Flow = namedtuple('Flow', 'name view_name auth expected call')
+registrations = itertools.count()
+
+
+def home(session, ctx, rng):
+    return session.request('GET', reverse('catalog:home'))
+
+
+def product_detail(session, ctx, rng):
+    return session.request('GET', reverse('catalog:product_detail', args=[rng.choice(ctx['product_pks'])]))
+
+
+def product_create(session, ctx, rng):
+    return session.request('POST', reverse('catalog:create_product'), {
+        'name': f'Новый продукт {rng.random()}',
+        'description': 'Описание нового продукта',
+        'category': rng.choice(ctx['category_pks']),
+        'price_per_unit': rng.randint(10, 10000),
+    })
+
+
+def product_update(session, ctx, rng):
+    # Только продукты, которые пользователь сценария может менять, иначе ответ 404
+    return session.request('POST', reverse('catalog:update_product', args=[rng.choice(ctx['editable_pks'])]), {
+        'name': f'Измененный продукт {rng.random()}',
+        'price_per_unit': rng.randint(10, 10000),
+        'is_published': 'on',
+    })
+
+
+def login(session, ctx, rng):
+    return session.request('POST', reverse('users:login'), {
+        'username': user_email(rng.randrange(ctx['users'])), 'password': PASSWORD,
+    })
+
+
+def register(session, ctx, rng):
+    n = next(registrations)
+    return session.request('POST', reverse('users:register'), {
+        'username': f'new{n}', 'email': f'new{n}@example.com', 'phone': '',
+        'password1': PASSWORD, 'password2': PASSWORD,
+    })
+
+
+FLOWS = [
+    Flow('home', 'catalog:home', True, {200}, home),
+    Flow('product_detail', 'catalog:product_detail', True, {200}, product_detail),
+    Flow('product_create', 'catalog:create_product', True, {302}, product_create),
+    Flow('product_update', 'catalog:update_product', True, {302}, product_update),
+    Flow('login', 'users:login', False, {302}, login),
+    Flow('register', 'users:register', False, {302}, register),
+]
+
+
+def run_flow(flow, transport, ctx, iterations, warmup, concurrency):
+    """Возвращает статистику сценария; неожиданный код ответа считается ошибкой."""
+    User = get_user_model()
+    sessions = []
+    for _ in range(concurrency):
+        session = TRANSPORTS[transport]()
+        if flow.auth:
+            session.login(User.objects.get(email=user_email(0)))
+        sessions.append(session)
+
+    rng = random.Random(0)
+    for _ in range(warmup):
+        flow.call(sessions[0], ctx, rng)
+    performance.reset_report()
+
+    def worker(session, count, seed):
+        worker_rng = random.Random(seed)
+        latencies, errors = [], 0
+        for _ in range(count):
+            started = time.perf_counter()
+            status = flow.call(session, ctx, worker_rng)
+            latencies.append((time.perf_counter() - started) * 1000)
+            errors += status not in flow.expected
+        return latencies, errors
+
+    counts = [iterations // concurrency + (i < iterations % concurrency) for i in range(concurrency)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(worker, sessions, counts, range(concurrency)))
+    elapsed = time.perf_counter() - started
+    for session in sessions:
+        session.close()
+
+    latencies = [latency for worker_latencies, _ in results for latency in worker_latencies]
+    queries = performance.get_report().get(flow.view_name, {}).get('queries', {})
+    return {
+        'requests': len(latencies),
+        'errors': sum(errors for _, errors in results),
+        'rps': len(latencies) / elapsed,
+        'p50_ms': percentile(latencies, 50),
+        'p95_ms': percentile(latencies, 95),
+        'p99_ms': percentile(latencies, 99),
+        'queries': queries.get('p50'),
+    }
+
+
+def compare(result, baseline, tolerance, slack_ms=0):
+    """Список регрессий относительно базового прогона."""
+    problems = []
+    for key in ('scale', 'transport'):
+        if result['meta'][key] != baseline['meta'][key]:
+            problems.append(f"{key}: прогон {result['meta'][key]}, базовый {baseline['meta'][key]}")
+    for name, base in baseline['flows'].items():
+        stats = result['flows'].get(name)
+        if stats is None:
+            continue
+        if stats['errors']:
+            problems.append(f"{name}: {stats['errors']} ответов с неожиданным кодом")
+        if base['queries'] is not None and stats['queries'] is not None and stats['queries'] > base['queries']:
+            problems.append(f"{name}: SQL-запросов {stats['queries']}, было {base['queries']}")
+        if stats['p95_ms'] > base['p95_ms'] * (1 + tolerance) + slack_ms:
+            problems.append(f"{name}: p95 {stats['p95_ms']:.1f} мс, было {base['p95_ms']:.1f} мс")
+    return problems
+
+
+def print_result(result):
+    meta = result['meta']
+    print(f"масштаб: {meta['scale']}, транспорт: {meta['transport']}, потоков: {meta['concurrency']}")
+    print(f"{'сценарий':<16}{'запросов':>9}{'ошибок':>8}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'SQL':>6}")
+    for name, stats in result['flows'].items():
+        queries = '' if stats['queries'] is None else f"{stats['queries']:.0f}"
+        print(f"{name:<16}{stats['requests']:>9}{stats['errors']:>8}{stats['rps']:>9.1f}{stats['p50_ms']:>9.1f}"
+              f"{stats['p95_ms']:>9.1f}{stats['p99_ms']:>9.1f}{queries:>6}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', choices=SCALES, default='small')
+    parser.add_argument('--transport', choices=TRANSPORTS, default='client')
+    parser.add_argument('--flows', nargs='+', choices=[flow.name for flow in FLOWS])
+    parser.add_argument('--iterations', type=int, default=100)
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--output', help='записать результат в JSON')
+    parser.add_argument('--baseline', help='сравнить с сохраненным результатом')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='допустимое ухудшение p95, доля')
+    parser.add_argument('--slack-ms', type=float, default=5, help='допустимое ухудшение p95 сверх доли, мс')
+    args = parser.parse_args()
+
+    setup_test_environment()
+    # Файловая база, а не в памяти: ее видят потоки сервера
+    directory = tempfile.TemporaryDirectory()
+    connection.settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(directory.name, 'bench.sqlite3')
+    settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, '127.0.0.1']
+    # Число запросов к БД берется из замеров PerformanceMiddleware
+    settings.PERFORMANCE_ENABLED = True
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    server = start_server() if args.transport == 'server' else None
+    try:
+        cache.clear()
+        scale = SCALES[args.scale]
+        started = time.perf_counter()
+        seed(**scale)
+        print(f'данные созданы за {time.perf_counter() - started:.1f} с')
+        ctx = {
+            'users': scale['users'],
+            'product_pks': list(Product.objects.values_list('pk', flat=True)),
+            'editable_pks': list(filter_modifiable(get_user_model().objects.get(email=user_email(0)), CHANGE)
+                                 .values_list('pk', flat=True)),
+            'category_pks': list(Category.objects.values_list('pk', flat=True)),
+        }
+        flows = [flow for flow in FLOWS if not args.flows or flow.name in args.flows]
+        result = {
+            'meta': {'scale': args.scale, 'transport': args.transport, 'concurrency': args.concurrency,
+                     'iterations': args.iterations},
+            'flows': {
+                flow.name: run_flow(flow, args.transport, ctx, args.iterations, args.warmup, args.concurrency)
+                for flow in flows
+            },
+        }
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        directory.cleanup()
+        teardown_test_environment()
+
+    print_result(result)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            problems = compare(result, json.load(f), args.tolerance, args.slack_ms)
+        for problem in problems:
+            print(f'РЕГРЕССИЯ {problem}')
+        if problems:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
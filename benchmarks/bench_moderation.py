@@ -0,0 +1,55 @@
+"""
+Сравнение проверки на запрещенные слова: прежний цикл по словам и общее регулярное выражение.
+
+    python -m benchmarks.bench_moderation [--size 200000] [--repeat 20]
+"""
+import argparse
+import os
+import random
+import string
+import timeit
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'skypro_diplom.settings')
+django.setup()
+
+from django.conf import settings  # noqa: E402
+
+from catalog.moderation import find_banned_word  # noqa: E402
+
+
+def find_banned_word_loop(text, words):
+    # Прежняя реализация из форм: отдельный проход по тексту на каждое слово
+    for word in words:
+        if word.lower() in text.lower():
+            return word
+    return None
+
+
+def make_text(size):
+    alphabet = string.ascii_lowercase + 'абвгдежзийклмнопрстуфхцчшщэюя' + ' ' * 8
+    return ''.join(random.choice(alphabet) for _ in range(size))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', type=int, default=200_000, help='длина описания в символах')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    random.seed(0)
+    text = make_text(args.size)
+    words = [word for names in settings.BANNED_WORDS.values() for word in names]
+    assert find_banned_word(text) == find_banned_word_loop(text, words)
+
+    loop = min(timeit.repeat(lambda: find_banned_word_loop(text, words), number=1, repeat=args.repeat))
+    regex = min(timeit.repeat(lambda: find_banned_word(text), number=1, repeat=args.repeat))
+    print(f'текст: {args.size} символов, слов: {len(words)}')
+    print(f'цикл по словам:      {loop * 1000:8.2f} мс')
+    print(f'общее выражение:     {regex * 1000:8.2f} мс')
+    print(f'ускорение:           {loop / regex:8.1f}x')
+
+
+if __name__ == '__main__':
+    main()
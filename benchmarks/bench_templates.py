@@ -0,0 +1,132 @@
+"""
+Рендеринг главной страницы с 1000 карточек продуктов.
+
+Создает отдельную тестовую базу (benchmarks.seed) и вызывает ProductListView
+с paginate_by=1000 через RequestFactory, без middleware. Сценарии:
+  - без кеша: шаблоны разбираются при каждом рендеринге, карточки рендерятся заново;
+  - кеш шаблонов: cached.Loader, карточки рендерятся заново;
+  - кеш шаблонов и карточек: cached.Loader и фрагменты catalog.cards из кеша.
+Для каждого сценария выводит p50/p95/p99 на страницу, p50 на карточку и число SQL-запросов.
+
+    python -m benchmarks.bench_templates [--scale small] [--cards 1000] [--iterations 20] [--output result.json]
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'skypro_diplom.settings')
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.contrib.auth.models import AnonymousUser  # noqa: E402
+from django.core.cache import cache  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test import RequestFactory, override_settings  # noqa: E402
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment  # noqa: E402
+
+from benchmarks.seed import SCALES, seed  # noqa: E402
+from catalog.views import ProductListView  # noqa: E402
+from skypro_diplom.utils import percentile  # noqa: E402
+
+LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+
+
+def caches():
+    # LocMemCache по умолчанию хранит 300 записей - меньше, чем карточек на странице
+    return {alias: {**config, 'OPTIONS': {**config.get('OPTIONS', {}), 'MAX_ENTRIES': 100000}}
+            if config['BACKEND'].endswith('LocMemCache') else config
+            for alias, config in settings.CACHES.items()}
+
+
+def templates(loaders):
+    return [{**settings.TEMPLATES[0], 'OPTIONS': {**settings.TEMPLATES[0]['OPTIONS'], 'loaders': loaders}}]
+
+
+SCENARIOS = {
+    'без кеша': {'TEMPLATES': templates(LOADERS), 'CACHE_ENABLED': False},
+    'кеш шаблонов': {'TEMPLATES': templates([('django.template.loaders.cached.Loader', LOADERS)]),
+                     'CACHE_ENABLED': False},
+    'кеш шаблонов и карточек': {'TEMPLATES': templates([('django.template.loaders.cached.Loader', LOADERS)]),
+                                'CACHE_ENABLED': True, 'CACHES': caches()},
+}
+
+
+def render_page(view, request):
+    with CaptureQueriesContext(connection) as context:
+        started = time.perf_counter()
+        response = view(request)
+        response.render()
+        latency = (time.perf_counter() - started) * 1000
+    return response, latency, len(context.captured_queries)
+
+
+def bench(config, cards, iterations):
+    view = ProductListView.as_view(paginate_by=cards)
+    request = RequestFactory().get('/')
+    request.user = AnonymousUser()
+    with override_settings(**config):
+        cache.clear()
+        # Прогрев: разбор шаблонов и заполнение кеша карточек
+        response, _, _ = render_page(view, request)
+        rendered = len(response.context_data['cards'])
+        latencies, queries = [], []
+        for _ in range(iterations):
+            response, latency, count = render_page(view, request)
+            latencies.append(latency)
+            queries.append(count)
+    return {
+        'cards': rendered,
+        'requests': iterations,
+        'p50_ms': percentile(latencies, 50),
+        'p95_ms': percentile(latencies, 95),
+        'p99_ms': percentile(latencies, 99),
+        'per_card_us': percentile(latencies, 50) * 1000 / max(rendered, 1),
+        'queries': percentile(queries, 50),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', choices=SCALES, default='small')
+    parser.add_argument('--cards', type=int, default=1000, help='карточек на странице')
+    parser.add_argument('--iterations', type=int, default=20, help='рендерингов на каждый сценарий')
+    parser.add_argument('--output', help='записать результат в JSON')
+    args = parser.parse_args()
+
+    setup_test_environment()
+    directory = tempfile.TemporaryDirectory()
+    connection.settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(directory.name, 'bench.sqlite3')
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        cache.clear()
+        scale = dict(SCALES[args.scale])
+        scale['products'] = max(scale['products'], args.cards)
+        seed(**scale)
+        result = {
+            'meta': {'scale': args.scale, 'cards': args.cards, 'iterations': args.iterations},
+            'scenarios': {name: bench(config, args.cards, args.iterations) for name, config in SCENARIOS.items()},
+        }
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        directory.cleanup()
+        teardown_test_environment()
+
+    print(f"масштаб: {args.scale}, карточек: {args.cards}")
+    print(f"{'сценарий':<30}{'p50':>9}{'p95':>9}{'p99':>9}{'мкс/карт.':>11}{'SQL':>6}")
+    for name, row in result['scenarios'].items():
+        print(f"{name:<30}{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}{row['p99_ms']:>9.1f}"
+              f"{row['per_card_us']:>11.1f}{row['queries']:>6.0f}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
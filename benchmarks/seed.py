@@ -0,0 +1,83 @@
+"""
+Синтетические данные для бенчмарков: категории, продукты с версиями и пользователи.
+
+Заполнение идет через bulk_create без сигналов, поэтому после него отдельно
+проставляются активные версии, перестраиваются поисковый индекс и агрегаты, сбрасываются
+поколения кеша каталога.
+"""
+import random
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db.models import OuterRef, Subquery
+
+from catalog import aggregates
+from catalog.caching import bump_generation
+from catalog.models import Category, Product, Version
+from catalog.search import get_backend
+
+SCALES = {
+    'small': {'categories': 10, 'products': 500, 'versions': 2, 'users': 20},
+    'medium': {'categories': 50, 'products': 5000, 'versions': 3, 'users': 200},
+    'large': {'categories': 200, 'products': 50000, 'versions': 3, 'users': 2000},
+}
+
+PASSWORD = 'Bench!pass1'
+WORDS = ('свежий', 'молоко', 'хлеб', 'сыр', 'яблоко', 'чай', 'кофе', 'масло', 'мед', 'орех',
+         'fresh', 'organic', 'classic', 'premium', 'light', 'extra')
+BATCH_SIZE = 2000
+
+
+def user_email(i):
+    return f'bench{i}@example.com'
+
+
+def make_words(rng, count):
+    return ' '.join(rng.choice(WORDS) for _ in range(count))
+
+
+def seed(categories, products, versions, users, seed=0):
+    """Заполняет пустую базу, возвращает список pk пользователей."""
+    rng = random.Random(seed)
+    User = get_user_model()
+    # Хеш считаем один раз: на тысячах пользователей PBKDF2 занял бы минуты
+    password = make_password(PASSWORD)
+    User.objects.bulk_create(
+        [User(email=user_email(i), username=f'bench{i}', password=password) for i in range(users)],
+        batch_size=BATCH_SIZE,
+    )
+    user_pks = list(User.objects.filter(email__startswith='bench').order_by('pk').values_list('pk', flat=True))
+
+    Category.objects.bulk_create(
+        [Category(name=f'Категория {i}', description=make_words(rng, 8)) for i in range(categories)],
+        batch_size=BATCH_SIZE,
+    )
+    category_pks = list(Category.objects.order_by('pk').values_list('pk', flat=True))
+
+    Product.objects.bulk_create(
+        [
+            Product(name=f'{make_words(rng, 2)} {i}', description=make_words(rng, 30),
+                    category_id=rng.choice(category_pks), owner_id=rng.choice(user_pks),
+                    price_per_unit=rng.randint(10, 10000), is_published=True)
+            for i in range(products)
+        ],
+        batch_size=BATCH_SIZE,
+    )
+
+    product_pks = Product.objects.order_by('pk').values_list('pk', flat=True).iterator(chunk_size=BATCH_SIZE)
+    Version.objects.bulk_create(
+        (
+            Version(product_id=pk, version_name=f'v{n}', version_number=f'{n}.0.0', current_version=n == versions)
+            for pk in product_pks for n in range(1, versions + 1)
+        ),
+        batch_size=BATCH_SIZE,
+    )
+    Product.objects.update(active_version=Subquery(
+        Version.objects.filter(product=OuterRef('pk'), current_version=True).values('pk')[:1]
+    ))
+
+    get_backend().rebuild()
+    aggregates.rebuild()
+    for namespace in ('category', 'product', 'version'):
+        bump_generation(namespace)
+    return user_pks
@@ -1,6 +1,7 @@
 from django.contrib import admin
 
-from catalog.models import Category, Product, Version
+from catalog.models import Category, Product, Version, Warehouse, StockLevel, StockMovement
+from catalog.search import get_backend
 
 
 @admin.register(Category)
@@ -14,7 +15,46 @@ class ProductAdmin(admin.ModelAdmin):
     search_fields = ('name', 'description',)
     list_filter = ('category',)
 
+    def get_search_results(self, request, queryset, search_term):
+        # Поиск по полнотекстовому индексу вместо LIKE по search_fields
+        if not search_term:
+            return queryset, False
+        return get_backend().filter(queryset, search_term), False
+
 
 @admin.register(Version)
 class ProductVersionAdmin(admin.ModelAdmin):
     list_display = ('version_name', 'version_number', 'current_version')
+
+
+@admin.register(Warehouse)
+class WarehouseAdmin(admin.ModelAdmin):
+    list_display = ('code', 'name')
+
+
+@admin.register(StockLevel)
+class StockLevelAdmin(admin.ModelAdmin):
+    # Остатки меняются только через catalog.stock вместе с журналом
+    list_display = ('product', 'warehouse', 'quantity', 'reserved', 'updated_at')
+    list_filter = ('warehouse',)
+    list_select_related = ('product__category', 'warehouse')
+    readonly_fields = ('product', 'warehouse', 'quantity', 'reserved', 'updated_at')
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(StockMovement)
+class StockMovementAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'kind', 'product', 'warehouse', 'quantity_delta', 'reserved_delta', 'reference')
+    list_filter = ('kind', 'warehouse')
+    list_select_related = ('product__category', 'warehouse')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,184 @@
+"""
+Материализованные агрегаты каталога: CategoryStats и OwnerStats.
+
+Сигналы Product (catalog.signals) переносят продукт из старого состояния
+в новое через apply_change(): изменения складываются по группам (категория,
+владелец) и применяются одним UPDATE на группу. Счетчики и сумма цен меняются
+через F(), минимум и максимум при добавлении - через Case, а если уходит цена,
+равная текущему минимуму или максимуму категории, он пересчитывается
+подзапросом по индексу (category, price_per_unit).
+
+bulk-операции сигналов не отправляют: пакетный API передает изменения сам
+внутри collect(), где они копятся до выхода из блока, импорт вызывает refresh(),
+пересчитывающий перечисленные группы целиком. rebuild() пересчитывает все
+(команда rebuild_catalog_stats). Строка группы, оставшейся без продуктов,
+после пересчета удаляется, а после сигналов остается с нулевыми счетчиками.
+
+После коммита увеличивается поколение 'catalog_stats', и закешированные
+значения в catalog.services перестают читаться.
+"""
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models import Case, Count, F, Max, Min, Q, Subquery, Sum, Value, When
+
+from catalog.caching import bump_generation
+from catalog.models import CategoryStats, OwnerStats, Product
+
+GENERATION = 'catalog_stats'
+
+State = namedtuple('State', 'category_id owner_id price is_published')
+
+OWNER_AGGREGATES = {
+    'product_count': lambda: Count('pk'),
+    'published_count': lambda: Count('pk', filter=Q(is_published=True)),
+    'price_sum': lambda: Sum('price_per_unit'),
+}
+CATEGORY_AGGREGATES = {
+    **OWNER_AGGREGATES,
+    'price_min': lambda: Min('price_per_unit'),
+    'price_max': lambda: Max('price_per_unit'),
+}
+
+_local = threading.local()
+
+
+def get_state(product):
+    """Поля продукта, от которых зависят агрегаты; None, если часть полей не загружена."""
+    values = product.__dict__
+    try:
+        return State(values['category_id'], values['owner_id'], values['price_per_unit'], values['is_published'])
+    except KeyError:
+        return None
+
+
+def _invalidate():
+    bump_generation(GENERATION)
+
+
+def _add_state(changes, state, sign):
+    for model, pk in ((CategoryStats, state.category_id), (OwnerStats, state.owner_id)):
+        change = changes.setdefault((model, pk), {'count': 0, 'published': 0, 'price_sum': 0,
+                                                  'added': [], 'removed': []})
+        change['count'] += sign
+        change['published'] += sign * int(state.is_published)
+        change['price_sum'] += sign * state.price
+        change['added' if sign > 0 else 'removed'].append(state.price)
+
+
+def _is_noop(model, change):
+    if change['count'] or change['published'] or change['price_sum']:
+        return False
+    return model is OwnerStats or sorted(change['added']) == sorted(change['removed'])
+
+
+def _extreme(field, change, prices, pick, lookup):
+    whens = []
+    if change['removed']:
+        whens.append(When(**{f'{field}__in': change['removed']}, then=Subquery(prices[:1])))
+    if change['added']:
+        price = pick(change['added'])
+        whens.append(When(Q(**{f'{field}__isnull': True}) | Q(**{f'{field}__{lookup}': price}), then=Value(price)))
+    return Case(*whens, default=F(field))
+
+
+def _apply(changes):
+    """Применяет накопленные изменения; группы без строки агрегатов пересчитываются целиком."""
+    missing = {CategoryStats: set(), OwnerStats: set()}
+    for (model, pk), change in changes.items():
+        if _is_noop(model, change):
+            continue
+        values = {
+            'product_count': F('product_count') + change['count'],
+            'published_count': F('published_count') + change['published'],
+            'price_sum': F('price_sum') + change['price_sum'],
+        }
+        if model is CategoryStats:
+            prices = Product.objects.filter(category_id=pk).values('price_per_unit')
+            values['price_min'] = _extreme('price_min', change, prices.order_by('price_per_unit'), min, 'gt')
+            values['price_max'] = _extreme('price_max', change, prices.order_by('-price_per_unit'), max, 'lt')
+        if not model.objects.filter(pk=pk).update(**values) and change['added']:
+            missing[model].add(pk)
+    if missing[CategoryStats]:
+        _refresh(CategoryStats, 'category_id', CATEGORY_AGGREGATES, missing[CategoryStats])
+    if missing[OwnerStats]:
+        _refresh(OwnerStats, 'owner_id', OWNER_AGGREGATES, missing[OwnerStats])
+    transaction.on_commit(_invalidate)
+
+
+@contextmanager
+def collect():
+    """Копит изменения из apply_change() и применяет их при выходе, по одному UPDATE на группу."""
+    if getattr(_local, 'changes', None) is not None:
+        yield
+        return
+    _local.changes = {}
+    try:
+        yield
+        changes = _local.changes
+    finally:
+        _local.changes = None
+    with transaction.atomic(savepoint=False):
+        _apply(changes)
+
+
+def apply_change(old, new):
+    """
+    Переносит продукт из состояния old в new, None - продукта нет.
+
+    Вызывается после записи продукта в БД: пересчет минимума и максимума
+    видит уже новое состояние таблицы.
+    """
+    if old == new:
+        return
+    changes = getattr(_local, 'changes', None)
+    collecting = changes is not None
+    if not collecting:
+        changes = {}
+    if old is not None:
+        _add_state(changes, old, -1)
+    if new is not None:
+        _add_state(changes, new, 1)
+    if not collecting:
+        with transaction.atomic(savepoint=False):
+            _apply(changes)
+
+
+def _refresh(model, key, aggregates, ids=None):
+    """Пересчитывает строки агрегатов для ids (None - для всех) по таблице продуктов."""
+    rows = Product.objects.order_by().values(key).annotate(**{name: make() for name, make in aggregates.items()})
+    if ids is not None:
+        rows = rows.filter(**{f'{key}__in': ids})
+    stats = [model(**row) for row in rows]
+    if ids is None:
+        model.objects.exclude(pk__in=Product.objects.values(key)).delete()
+    elif len(stats) < len(ids):
+        model.objects.filter(pk__in=set(ids) - {getattr(obj, key) for obj in stats}).delete()
+    model.objects.bulk_create(stats, batch_size=1000, update_conflicts=True,
+                              unique_fields=[model._meta.pk.name], update_fields=list(aggregates))
+    return len(stats)
+
+
+def refresh(category_ids=(), owner_ids=()):
+    """Пересчитывает агрегаты перечисленных категорий и владельцев, для bulk-операций."""
+    category_ids = {pk for pk in category_ids if pk is not None}
+    owner_ids = {pk for pk in owner_ids if pk is not None}
+    if not category_ids and not owner_ids:
+        return
+    with transaction.atomic(savepoint=False):
+        if category_ids:
+            _refresh(CategoryStats, 'category_id', CATEGORY_AGGREGATES, category_ids)
+        if owner_ids:
+            _refresh(OwnerStats, 'owner_id', OWNER_AGGREGATES, owner_ids)
+    transaction.on_commit(_invalidate)
+
+
+def rebuild():
+    """Пересчитывает все агрегаты, возвращает (категорий, владельцев)."""
+    with transaction.atomic(savepoint=False):
+        categories = _refresh(CategoryStats, 'category_id', CATEGORY_AGGREGATES)
+        owners = _refresh(OwnerStats, 'owner_id', OWNER_AGGREGATES)
+    transaction.on_commit(_invalidate)
+    return categories, owners
@@ -0,0 +1,167 @@
+"""
+Пакетные операции с продуктами: создание, изменение, публикация и удаление.
+
+Все продукты и категории из пакета загружаются двумя запросами, права
+проверяются по владельцу и правам пользователя без дополнительных запросов
+на каждую операцию. Изменения применяются bulk_create/bulk_update в одной
+транзакции; bulk-операции не отправляют сигналы, поэтому поисковый индекс,
+агрегаты, журнал изменений и поколения кеша обновляются здесь же.
+"""
+import copy
+
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models.deletion import Collector
+from django.utils import timezone
+
+from catalog import aggregates, changes
+from catalog.caching import bump_generation
+from catalog.forms import ProductBatchForm
+from catalog.models import CatalogChange, Category, Product
+from catalog.permissions import CHANGE, DELETE, can_modify
+from catalog.search import get_backend
+
+OPERATIONS = ('create', 'update', 'publish', 'delete')
+FORM_FIELDS = ProductBatchForm._meta.fields
+
+
+class BatchError(ValueError):
+    pass
+
+
+def form_data(product, changes):
+    """Текущие значения продукта, поверх которых накладываются изменения из операции."""
+    data = {field: getattr(product, field) for field in FORM_FIELDS if field != 'category'}
+    data['category'] = product.category_id
+    data.update({field: value for field, value in changes.items() if field in FORM_FIELDS})
+    return data
+
+
+def apply_operations(user, operations, atomic=True):
+    """
+    Применяет пакет операций, возвращает (применено ли, результаты по каждой операции).
+
+    При atomic=True одна ошибка отменяет весь пакет, иначе применяются все корректные операции.
+    """
+    if not isinstance(operations, list):
+        raise BatchError('operations должен быть списком')
+    if len(operations) > settings.PRODUCT_BATCH_MAX_OPERATIONS:
+        raise BatchError(f'Не больше {settings.PRODUCT_BATCH_MAX_OPERATIONS} операций за запрос')
+
+    with transaction.atomic():
+        ids = {op.get('id') for op in operations if isinstance(op, dict) and op.get('op') != 'create'}
+        products = Product.objects.select_for_update().in_bulk([pk for pk in ids if isinstance(pk, int)])
+        category_ids = {product.category_id for product in products.values()}
+        for op in operations:
+            data = op.get('data') if isinstance(op, dict) else None
+            if isinstance(data, dict) and str(data.get('category', '')).isdigit():
+                category_ids.add(int(data['category']))
+        categories = Category.objects.in_bulk(category_ids)
+
+        results = []
+        to_create, to_update, to_delete = [], {}, []
+        update_fields = set()
+        for index, op in enumerate(operations):
+            result = {'index': index, 'op': op.get('op') if isinstance(op, dict) else None}
+            results.append(result)
+            errors = validate_operation(user, op, products, categories, result, to_create, to_update, to_delete,
+                                        update_fields)
+            if errors:
+                result.update(status='error', errors=errors)
+            else:
+                result['status'] = 'ok'
+
+        if atomic and any(result['status'] == 'error' for result in results):
+            return False, results
+
+        with aggregates.collect(), changes.collect():
+            created = Product.objects.bulk_create(to_create)
+            for result, product in zip((r for r in results if r['op'] == 'create' and r['status'] == 'ok'), created):
+                result['id'] = product.pk
+            updated = list(to_update.values())
+            if updated:
+                # bulk_update не заполняет auto_now, дата изменения ставится явно
+                now = timezone.now()
+                for product in updated:
+                    product.updated_at = now
+                Product.objects.bulk_update(updated, sorted(update_fields | {'updated_at'}))
+            if to_delete:
+                # Удаляем уже заблокированные объекты, не выбирая их заново; post_delete отправляется,
+                # индекс, кеш, агрегаты и журнал обновят сигналы
+                collector = Collector(using=router.db_for_write(Product))
+                collector.collect([products[pk] for pk in to_delete])
+                collector.delete()
+            for product in created:
+                aggregates.apply_change(None, aggregates.get_state(product))
+            for product in updated:
+                aggregates.apply_change(aggregates.get_state(products[product.pk]), aggregates.get_state(product))
+            changes.record_many(created, CatalogChange.ACTION_CREATE)
+            changes.record_many(updated, CatalogChange.ACTION_UPDATE)
+
+        get_backend().index_products(created + updated)
+        updated_pks = [product.pk for product in updated]
+
+        def invalidate():
+            bump_generation('product')
+            for pk in updated_pks:
+                bump_generation(f'product:{pk}')
+
+        transaction.on_commit(invalidate)
+    return True, results
+
+
+def validate_operation(user, op, products, categories, result, to_create, to_update, to_delete, update_fields):
+    """Проверяет одну операцию и раскладывает ее по спискам, возвращает ошибки или None."""
+    if not isinstance(op, dict) or op.get('op') not in OPERATIONS:
+        return {'op': [f"Ожидается одно из: {', '.join(OPERATIONS)}"]}
+
+    if op['op'] == 'create':
+        if not isinstance(op.get('data'), dict):
+            return {'data': ['Ожидается объект']}
+        form = ProductBatchForm(op['data'], categories=categories)
+        if not form.is_valid():
+            return form.errors.get_json_data()
+        product = form.save(commit=False)
+        product.owner = user
+        to_create.append(product)
+        return None
+
+    pk = op.get('id')
+    result['id'] = pk
+    product = products.get(pk) if isinstance(pk, int) else None
+    if product is None:
+        return {'id': ['Продукт не найден']}
+    if pk in to_delete:
+        return {'id': ['Продукт уже удален в этом пакете']}
+    # Повторные операции над одним продуктом применяются к уже измененному объекту
+    product = to_update.get(pk, product)
+
+    if op['op'] == 'delete':
+        if not can_modify(user, product, DELETE):
+            return {'id': ['Нет прав на удаление продукта']}
+        to_update.pop(pk, None)
+        to_delete.append(pk)
+        return None
+
+    if not can_modify(user, product, CHANGE):
+        return {'id': ['Нет прав на изменение продукта']}
+
+    if op['op'] == 'publish':
+        published = op.get('published', True)
+        if not isinstance(published, bool):
+            return {'published': ['Ожидается true или false']}
+        product = copy.copy(product)
+        product.is_published = published
+        update_fields.add('is_published')
+    else:
+        changes = op.get('data') or {}
+        if not isinstance(changes, dict):
+            return {'data': ['Ожидается объект']}
+        # Форма меняет экземпляр и при ошибках, поэтому проверяем копию
+        product = copy.copy(product)
+        form = ProductBatchForm(form_data(product, changes), instance=product, categories=categories)
+        if not form.is_valid():
+            return form.errors.get_json_data()
+        update_fields.update(field for field in FORM_FIELDS if field in changes)
+    to_update[pk] = product
+    return None
@@ -0,0 +1,228 @@
+"""
+Кеш справочных данных каталога.
+
+Ключи строятся из счетчиков поколений (generation) моделей, от которых зависит
+значение: сигналы post_save/post_delete увеличивают поколение, и старые ключи
+просто перестают читаться. Пересчет выполняет один процесс под блокировкой,
+остальные в это время получают прежнее значение; незадолго до истечения TTL
+значение обновляется заранее с вероятностью, растущей к концу срока (XFetch).
+
+Из поколений и времени, когда они впервые встретились, catalog.conditional
+строит ETag и Last-Modified.
+
+Для async-представлений есть варианты aget_generations/aget_or_compute
+на асинхронном API кеша.
+"""
+import asyncio
+import math
+import random
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+
+from skypro_diplom.db_router import use_primary
+
+KEY_PREFIX = 'catalog'
+DEFAULT_TTL = 60 * 60
+LOCK_TIMEOUT = 10
+LOCK_POLL_INTERVAL = 0.05
+EARLY_REFRESH_BETA = 1.0
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def _count(name, event):
+    with _stats_lock:
+        _stats[name, event] += 1
+
+
+def get_stats():
+    """Счетчики текущего процесса: {имя: {'hit': .., 'miss': .., 'stale': .., 'recompute': ..}}."""
+    with _stats_lock:
+        stats = {}
+        for (name, event), value in _stats.items():
+            stats.setdefault(name, {'hit': 0, 'miss': 0, 'stale': 0, 'recompute': 0})[event] = value
+        return stats
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+def _generation_key(namespace):
+    return f'{KEY_PREFIX}:generation:{namespace}'
+
+
+def _new_generation():
+    # После вытеснения счетчика из кеша новое значение не совпадет ни с одним прежним
+    return time.time_ns()
+
+
+def get_generations(namespaces):
+    keys = [_generation_key(namespace) for namespace in namespaces]
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            cache.add(key, _new_generation(), None)
+            generations[key] = cache.get(key)
+    return [str(generations[key]) for key in keys]
+
+
+async def aget_generations(namespaces):
+    keys = [_generation_key(namespace) for namespace in namespaces]
+    generations = await cache.aget_many(keys)
+    for key in keys:
+        if key not in generations:
+            await cache.aadd(key, _new_generation(), None)
+            generations[key] = await cache.aget(key)
+    return [str(generations[key]) for key in keys]
+
+
+def bump_generation(namespace):
+    key = _generation_key(namespace)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, _new_generation(), None)
+
+
+def _modified_keys(namespaces, generations):
+    return [f'{KEY_PREFIX}:modified:{namespace}:{generation}' for namespace, generation in zip(namespaces, generations)]
+
+
+def get_last_modified(namespaces, generations):
+    """
+    Время (timestamp), когда впервые встретились текущие поколения namespaces, - для Last-Modified.
+
+    Время запоминается при чтении, а не в bump_generation, и потому не раньше
+    настоящего изменения; вытесненное из кеша значение заменяется текущим временем.
+    """
+    keys = _modified_keys(namespaces, generations)
+    stamps = cache.get_many(keys)
+    for key in keys:
+        if key not in stamps:
+            cache.add(key, time.time(), getattr(settings, 'CATALOG_CACHE_TTL', DEFAULT_TTL))
+            stamps[key] = cache.get(key) or time.time()
+    return max(stamps.values(), default=None)
+
+
+async def aget_last_modified(namespaces, generations):
+    keys = _modified_keys(namespaces, generations)
+    stamps = await cache.aget_many(keys)
+    for key in keys:
+        if key not in stamps:
+            await cache.aadd(key, time.time(), getattr(settings, 'CATALOG_CACHE_TTL', DEFAULT_TTL))
+            stamps[key] = await cache.aget(key) or time.time()
+    return max(stamps.values(), default=None)
+
+
+def _should_refresh_early(expires_at, delta):
+    return time.time() - delta * EARLY_REFRESH_BETA * math.log(random.random() or 1e-12) >= expires_at
+
+
+def _recompute(name, key, compute, ttl):
+    _count(name, 'recompute')
+    started = time.time()
+    # Значение попадет в кеш под текущим поколением, отстающая реплика записала бы туда старые данные
+    with use_primary():
+        value = compute()
+    delta = time.time() - started
+    cache.set(key, (value, time.time() + ttl, delta), ttl)
+    return value
+
+
+def get_or_compute(name, compute, depends_on=(), ttl=None):
+    """
+    Возвращает закешированный результат compute().
+
+    depends_on - пространства имен (например 'category'), при изменении
+    которых значение считается устаревшим.
+    """
+    if not settings.CACHE_ENABLED:
+        return compute()
+    if ttl is None:
+        ttl = getattr(settings, 'CATALOG_CACHE_TTL', DEFAULT_TTL)
+
+    key = ':'.join([KEY_PREFIX, name, *get_generations(depends_on)])
+    entry = cache.get(key)
+    if entry is not None:
+        value, expires_at, delta = entry
+        if not _should_refresh_early(expires_at, delta):
+            _count(name, 'hit')
+            return value
+    else:
+        _count(name, 'miss')
+
+    lock_key = f'{key}:lock'
+    if cache.add(lock_key, 1, LOCK_TIMEOUT):
+        try:
+            return _recompute(name, key, compute, ttl)
+        finally:
+            cache.delete(lock_key)
+
+    if entry is not None:
+        # Пересчет уже идет в другом процессе, отдаем текущее значение
+        _count(name, 'stale')
+        return entry[0]
+
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(LOCK_POLL_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None:
+            _count(name, 'hit')
+            return entry[0]
+    return _recompute(name, key, compute, ttl)
+
+
+async def _arecompute(name, key, compute, ttl):
+    _count(name, 'recompute')
+    started = time.time()
+    with use_primary():
+        value = await compute()
+    delta = time.time() - started
+    await cache.aset(key, (value, time.time() + ttl, delta), ttl)
+    return value
+
+
+async def aget_or_compute(name, compute, depends_on=(), ttl=None):
+    """То же, что get_or_compute, для корутины compute()."""
+    if not settings.CACHE_ENABLED:
+        return await compute()
+    if ttl is None:
+        ttl = getattr(settings, 'CATALOG_CACHE_TTL', DEFAULT_TTL)
+
+    key = ':'.join([KEY_PREFIX, name, *await aget_generations(depends_on)])
+    entry = await cache.aget(key)
+    if entry is not None:
+        value, expires_at, delta = entry
+        if not _should_refresh_early(expires_at, delta):
+            _count(name, 'hit')
+            return value
+    else:
+        _count(name, 'miss')
+
+    lock_key = f'{key}:lock'
+    if await cache.aadd(lock_key, 1, LOCK_TIMEOUT):
+        try:
+            return await _arecompute(name, key, compute, ttl)
+        finally:
+            await cache.adelete(lock_key)
+
+    if entry is not None:
+        _count(name, 'stale')
+        return entry[0]
+
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        await asyncio.sleep(LOCK_POLL_INTERVAL)
+        entry = await cache.aget(key)
+        if entry is not None:
+            _count(name, 'hit')
+            return entry[0]
+    return await _arecompute(name, key, compute, ttl)
@@ -0,0 +1,80 @@
+"""
+Карточки продуктов на главной странице: HTML каждой карточки кешируется целиком.
+
+Ключ фрагмента строится из updated_at продукта (auto_now меняется при каждом
+сохранении, batch и импорт проставляют его сами), image_hash (уменьшенные копии
+записываются через update() без сохранения продукта), поколения категорий
+и CONDITIONAL_GET_VERSION (меняют при выкладке новых шаблонов). Поколение
+product:{pk} сюда не входит: его чтение стоило бы лишнего ключа в кеше на каждую
+карточку страницы.
+
+Кнопка изменения зависит от пользователя и в фрагмент не входит. Адреса
+карточек строятся в представлении по одному reverse() на страницу, а не
+тегом {% url %} в цикле.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import get_template
+from django.urls import reverse
+
+from catalog.caching import KEY_PREFIX, get_generations, aget_generations
+
+CARD_TEMPLATE = 'catalog/includes/product_card.html'
+# Подставляется в reverse() вместо pk, затем заменяется на {pk}
+PK_MARKER = '4815162342'
+
+
+def url_format(viewname):
+    """Адрес с {pk} для str.format: reverse() выполняется один раз."""
+    return reverse(viewname, kwargs={'pk': PK_MARKER}).replace(PK_MARKER, '{pk}')
+
+
+def _card_key(product, category_generation):
+    updated_at = product.updated_at.timestamp() if product.updated_at else ''
+    return (f'{KEY_PREFIX}:card:{settings.CONDITIONAL_GET_VERSION}:{product.pk}:{updated_at}:'
+            f'{product.image_hash}:{category_generation}')
+
+
+def _render(product, detail_url):
+    return get_template(CARD_TEMPLATE).render({'product': product, 'detail_url': detail_url})
+
+
+def _build(products, fragments, user, can_change_all):
+    """Рендерит недостающие фрагменты, возвращает карточки и новые фрагменты для кеша."""
+    detail_url = url_format('catalog:product_detail')
+    edit_url = url_format('catalog:product-edit')
+    cards, rendered = [], {}
+    for product, key in products:
+        html = fragments.get(key)
+        if html is None:
+            html = rendered[key] = _render(product, detail_url.format(pk=product.pk))
+        can_edit = can_change_all or (user.is_authenticated and product.owner_id == user.pk)
+        cards.append({
+            'product': product,
+            'html': html,
+            'edit_url': edit_url.format(pk=product.pk) if can_edit else None,
+        })
+    return cards, rendered
+
+
+def get_product_cards(products, user, can_change_all=False):
+    """[{'product', 'html', 'edit_url'}] для страницы списка; edit_url - None, если изменять нельзя."""
+    if not settings.CACHE_ENABLED:
+        return _build([(product, None) for product in products], {}, user, can_change_all)[0]
+    category_generation, = get_generations(['category'])
+    keyed = [(product, _card_key(product, category_generation)) for product in products]
+    cards, rendered = _build(keyed, cache.get_many([key for _, key in keyed]), user, can_change_all)
+    if rendered:
+        cache.set_many(rendered, settings.PRODUCT_FRAGMENT_TIMEOUT)
+    return cards
+
+
+async def aget_product_cards(products, user, can_change_all=False):
+    if not settings.CACHE_ENABLED:
+        return _build([(product, None) for product in products], {}, user, can_change_all)[0]
+    category_generation, = await aget_generations(['category'])
+    keyed = [(product, _card_key(product, category_generation)) for product in products]
+    cards, rendered = _build(keyed, await cache.aget_many([key for _, key in keyed]), user, can_change_all)
+    if rendered:
+        await cache.aset_many(rendered, settings.PRODUCT_FRAGMENT_TIMEOUT)
+    return cards
@@ -0,0 +1,142 @@
+"""
+Журнал изменений каталога и выгрузка дельт для внешних систем.
+
+Сохранение и удаление категорий, продуктов и версий пишет запись CatalogChange
+в той же транзакции (сигналы catalog.signals, Product.save и Category.save
+атомарны). bulk-операции сигналов не отправляют, пакетный API и импорт пишут
+записи сами через record_many(); внутри collect() записи копятся и вставляются
+одним запросом при выходе из блока.
+
+id записи - монотонная последовательность, потребитель хранит последний
+полученный id (watermark) и запрашивает только более новые записи. id
+выдаются при вставке, а видны после коммита, поэтому запись с меньшим id может
+появиться позже записи с большим. Выгрузка отдает только записи старше
+CATALOG_CHANGES_LAG секунд, чтобы watermark не перескочил через
+незакоммиченную запись. Это защита "по возможности", а не гарантия: запись из
+транзакции, которая шла дольше CATALOG_CHANGES_LAG, станет видна уже после того,
+как watermark ее обогнал, и потребитель ее пропустит. CATALOG_CHANGES_LAG
+должен быть больше самой долгой транзакции, которая пишет в каталог (импорт
+пачками по batch_size, пакетный API), а потребителю, которому пропуски
+недопустимы, нужна периодическая полная сверка с since=0.
+"""
+import csv
+import json
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.text import compress_sequence
+
+from catalog.models import CatalogChange, Category, Product, Version
+
+FIELDS = {
+    'category': ('name', 'description'),
+    'product': ('name', 'description', 'image', 'category_id', 'price_per_unit', 'is_published', 'owner_id',
+                'created_at', 'updated_at'),
+    'version': ('product_id', 'version_name', 'version_number', 'current_version'),
+}
+MODELS = {Category: 'category', Product: 'product', Version: 'version'}
+FORMATS = ('ndjson', 'csv')
+CSV_COLUMNS = ('id', 'model', 'object_id', 'action', 'created_at', 'data')
+
+_local = threading.local()
+
+
+def snapshot(obj):
+    """Значения полей объекта, которые попадают в журнал."""
+    opts = obj._meta
+    return {name: opts.get_field(name).get_prep_value(getattr(obj, name)) for name in FIELDS[MODELS[type(obj)]]}
+
+
+def _entry(obj, action):
+    return CatalogChange(model=MODELS[type(obj)], object_id=obj.pk, action=action,
+                         data=None if action == CatalogChange.ACTION_DELETE else snapshot(obj))
+
+
+def record_many(objects, action, using=None):
+    entries = [_entry(obj, action) for obj in objects]
+    pending = getattr(_local, 'entries', None)
+    if pending is not None:
+        pending[using].extend(entries)
+    elif entries:
+        CatalogChange.objects.using(using).bulk_create(entries, batch_size=1000)
+
+
+def record(obj, action, using=None):
+    record_many([obj], action, using)
+
+
+@contextmanager
+def collect(using=None):
+    """
+    Копит записи журнала и вставляет их одним bulk_create на базу при выходе из блока.
+
+    Записи, для которых record_many() не получил базу, пишутся в using.
+    """
+    if getattr(_local, 'entries', None) is not None:
+        yield
+        return
+    _local.entries = defaultdict(list)
+    try:
+        yield
+        pending = _local.entries
+    finally:
+        _local.entries = None
+    for alias, entries in pending.items():
+        CatalogChange.objects.using(alias or using).bulk_create(entries, batch_size=1000)
+
+
+def get_watermark(since=0, lag=None):
+    """
+    Последний id, который можно выгрузить: записи старше lag секунд, но не меньше since.
+
+    Записи транзакций, которые шли дольше lag, могут оказаться ниже watermark (см. описание модуля).
+    """
+    if lag is None:
+        lag = settings.CATALOG_CHANGES_LAG
+    until = CatalogChange.objects.filter(created_at__lte=timezone.now() - timedelta(seconds=lag)) \
+        .aggregate(last=Max('id'))['last']
+    return max(since, until or 0)
+
+
+def iter_changes(since, until, models=None, batch_size=1000):
+    """Записи журнала с since < id <= until по возрастанию id, в памяти не больше одной пачки."""
+    changes = CatalogChange.objects.filter(id__lte=until).order_by('id')
+    if models:
+        changes = changes.filter(model__in=models)
+    while True:
+        batch = list(changes.filter(id__gt=since).values(*CSV_COLUMNS)[:batch_size])
+        yield from batch
+        if len(batch) < batch_size:
+            return
+        since = batch[-1]['id']
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def render(rows, stream_format):
+    """Строки NDJSON или CSV (поле data - JSON-строка)."""
+    if stream_format == 'csv':
+        writer = csv.writer(_Echo())
+        yield writer.writerow(CSV_COLUMNS)
+        for row in rows:
+            row['data'] = json.dumps(row['data'], ensure_ascii=False) if row['data'] is not None else ''
+            row['created_at'] = row['created_at'].isoformat()
+            yield writer.writerow([row[column] for column in CSV_COLUMNS])
+    else:
+        for row in rows:
+            yield json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+def export(since, until, stream_format='ndjson', models=None, compress=False):
+    """Поток байтов выгрузки, при compress=True - в gzip."""
+    chunks = (line.encode() for line in render(iter_changes(since, until, models), stream_format))
+    return compress_sequence(chunks) if compress else chunks
@@ -0,0 +1,107 @@
+"""
+Условные GET-запросы: ETag, Last-Modified и 304 Not Modified без рендеринга страницы.
+
+Валидаторы строятся из поколений и времени изменения пространств имен
+catalog.caching, от которых зависит страница, - это обращения к кешу, а не
+к БД и шаблонам. Для страниц с данными пользователя в ETag входят пользователь
+и ключ сессии, в Last-Modified - время входа: после смены пользователя или
+повторного входа (новый CSRF-токен в форме выхода) страница отдается заново.
+CONDITIONAL_GET_VERSION тоже входит в ETag, его меняют при выкладке новых шаблонов.
+
+Ответы помечаются Cache-Control: no-cache - браузер и прокси хранят страницу,
+но перед каждым показом проверяют ее условным запросом.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from catalog.caching import get_generations, aget_generations, get_last_modified, aget_last_modified
+from skypro_diplom.db_router import pin_primary
+
+
+def make_etag(*parts):
+    value = ':'.join(str(part) for part in (settings.CONDITIONAL_GET_VERSION, *parts))
+    return '"%s"' % hashlib.sha256(value.encode()).hexdigest()[:32]
+
+
+def _user_parts(request, user):
+    if user is None or not user.is_authenticated:
+        return ('anonymous',), None
+    session = getattr(request, 'session', None)
+    login = user.last_login.timestamp() if user.last_login else None
+    return (user.pk, session.session_key if session is not None else ''), login
+
+
+def _combine(generations, stamp, user_parts, login, parts):
+    if time.time() - stamp < settings.DATABASE_REPLICA_LAG:
+        # Реплика могла еще не получить изменение, из-за которого сменилось поколение:
+        # страница с новым ETag должна строиться по новым данным
+        pin_primary()
+    last_modified = max(stamp, login) if login else stamp
+    return make_etag(*parts, *user_parts, *generations), last_modified
+
+
+def get_validators(request, namespaces, user=None, parts=()):
+    """(ETag, Last-Modified) страницы, зависящей от namespaces; user - для страниц с данными пользователя."""
+    if not settings.CACHE_ENABLED:
+        return None, None
+    user_parts, login = _user_parts(request, user)
+    generations = get_generations(namespaces)
+    return _combine(generations, get_last_modified(namespaces, generations), user_parts, login, parts)
+
+
+async def aget_validators(request, namespaces, user=None, parts=()):
+    if not settings.CACHE_ENABLED:
+        return None, None
+    user_parts, login = _user_parts(request, user)
+    generations = await aget_generations(namespaces)
+    return _combine(generations, await aget_last_modified(namespaces, generations), user_parts, login, parts)
+
+
+def not_modified(request, etag, last_modified):
+    """Ответ 304 (или 412 для небезопасных методов), если у клиента актуальная версия, иначе None."""
+    return get_conditional_response(request, etag=etag,
+                                    last_modified=int(last_modified) if last_modified is not None else None)
+
+
+def set_validators(response, etag, last_modified, private=True):
+    """Заголовки валидаторов и Cache-Control для успешного ответа или 304."""
+    if response.status_code not in (200, 304):
+        return response
+    if etag is not None:
+        response.headers.setdefault('ETag', etag)
+    if last_modified is not None:
+        response.headers.setdefault('Last-Modified', http_date(last_modified))
+    patch_cache_control(response, no_cache=True, **({'private': True} if private else {'public': True}))
+    return response
+
+
+def conditional(validators, private=True):
+    """
+    Декоратор представления: validators(request, *args, **kwargs) возвращает (ETag, Last-Modified),
+    для async-представления это корутина. Если у клиента актуальная версия, представление не вызывается.
+    """
+    def decorator(func):
+        if iscoroutinefunction(func):
+            @wraps(func)
+            async def inner(request, *args, **kwargs):
+                etag, last_modified = await validators(request, *args, **kwargs)
+                response = not_modified(request, etag, last_modified)
+                if response is None:
+                    response = await func(request, *args, **kwargs)
+                return set_validators(response, etag, last_modified, private)
+        else:
+            @wraps(func)
+            def inner(request, *args, **kwargs):
+                etag, last_modified = validators(request, *args, **kwargs)
+                response = not_modified(request, etag, last_modified)
+                if response is None:
+                    response = func(request, *args, **kwargs)
+                return set_validators(response, etag, last_modified, private)
+        return inner
+    return decorator
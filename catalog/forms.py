@@ -6,6 +6,7 @@ from crispy_forms.helper import FormHelper
 from django.urls import reverse_lazy
 
 from catalog.models import Product, Category, Version
+from catalog.moderation import find_banned_word
 
 
 class FormStyleMixin:
@@ -40,24 +41,16 @@ class ProductCreateForm(FormStyleMixin, ModelForm):
 
     def clean_name(self):
         name = self.cleaned_data['name']
-        banned_words = ['casino', 'cryptocurrency', 'crypto', 'exchange', 'cheap',
-                        'free', 'scam', 'police', 'radar']
-
-        for word in banned_words:
-            if word.lower() in name.lower():
-                raise ValidationError(f"Слово '{word}' запрещено использовать в названии продукта. ")
-
+        word = find_banned_word(name, 'en')
+        if word is not None:
+            raise ValidationError(f"Слово '{word}' запрещено использовать в названии продукта. ")
         return name
 
     def clean_description(self):
         description = self.cleaned_data['description']
-        banned_words = ['casino', 'cryptocurrency', 'crypto', 'exchange', 'cheap',
-                        'free', 'scam', 'police', 'radar']
-
-        for word in banned_words:
-            if word.lower() in description.lower():
-                raise ValidationError(f"Слово '{word}' запрещено использовать в описании продукта.")
-
+        word = find_banned_word(description, 'en')
+        if word is not None:
+            raise ValidationError(f"Слово '{word}' запрещено использовать в описании продукта.")
         return description
 
     def form_valid(self, form):
@@ -147,11 +140,9 @@ class ProductForm(StyleFormMixin, forms.ModelForm):
 
     def clean_name(self):
         name = self.cleaned_data['name']
-        forbidden_words = ['казино', 'криптовалюта', 'крипта', 'биржа', 'дешево', 'бесплатно', 'обман', 'полиция',
-                           'радар']
-        for word in forbidden_words:
-            if word in name.lower():
-                raise forms.ValidationError(f'Название не должно содержать запрещенное слово: {word}')
+        word = find_banned_word(name, 'ru')
+        if word is not None:
+            raise forms.ValidationError(f'Название не должно содержать запрещенное слово: {word}')
         return name
 
     def __init__(self, *args, **kwargs):
@@ -166,3 +157,41 @@ class ProductForm(StyleFormMixin, forms.ModelForm):
 
 
 ProductForm.base_fields['is_published'].widget.attrs['class'] = 'form-check-input'
+
+
+class PrefetchedCategoryField(forms.ModelChoiceField):
+    """Выбор категории из заранее загруженного словаря {pk: категория}, без запроса на каждое значение."""
+
+    def __init__(self, categories, **kwargs):
+        super().__init__(queryset=Category.objects.none(), **kwargs)
+        self.categories = categories
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        try:
+            return self.categories[int(value)]
+        except (KeyError, ValueError, TypeError):
+            raise ValidationError(self.error_messages['invalid_choice'], code='invalid_choice',
+                                  params={'value': value})
+
+
+class ProductBatchForm(ModelForm):
+    """Проверка продукта в пакетном API по тем же правилам, что и ProductCreateForm."""
+
+    class Meta:
+        model = Product
+        fields = ('name', 'description', 'category', 'price_per_unit')
+
+    clean_name = ProductCreateForm.clean_name
+    clean_description = ProductCreateForm.clean_description
+
+    def __init__(self, *args, categories, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['category'] = PrefetchedCategoryField(categories)
+
+    def _get_validation_exclusions(self):
+        # Категория уже найдена в словаре, проверка внешнего ключа моделью дала бы запрос на каждый продукт
+        exclude = super()._get_validation_exclusions()
+        exclude.add('category')
+        return exclude
@@ -0,0 +1,106 @@
+"""
+Уменьшенные копии картинок продуктов.
+
+Для каждого пресета из settings.PRODUCT_IMAGE_PRESETS создаются копии заданной
+ширины в WebP и JPEG. Имена строятся от хеша содержимого исходника
+(products/thumbs/<хеш>/<ширина>.<формат>), поэтому их можно кешировать навсегда.
+Хеш сохраняется в Product.image_hash после того, как все копии записаны: пока
+его нет, шаблоны показывают исходную картинку.
+"""
+import hashlib
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from catalog.caching import bump_generation
+from tasks.queue import enqueue
+
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def all_widths():
+    return sorted({width for preset in settings.PRODUCT_IMAGE_PRESETS.values() for width in preset['widths']})
+
+
+def derivative_name(image_hash, width, ext):
+    return f'products/thumbs/{image_hash}/{width}.{ext}'
+
+
+def content_hash(field):
+    digest = hashlib.sha256()
+    field.open('rb')
+    try:
+        for chunk in field.chunks():
+            digest.update(chunk)
+    finally:
+        field.close()
+    return digest.hexdigest()[:16]
+
+
+def generate_derivatives(product):
+    """Создает недостающие копии и записывает хеш в продукт, возвращает хеш."""
+    image_hash = content_hash(product.image)
+    product.image.open('rb')
+    try:
+        source = ImageOps.exif_transpose(Image.open(product.image))
+        source.load()
+    finally:
+        product.image.close()
+    if source.mode not in ('RGB', 'RGBA'):
+        source = source.convert('RGBA' if 'transparency' in source.info else 'RGB')
+
+    for width in all_widths():
+        resized = None
+        for ext, (pil_format, options) in FORMATS.items():
+            name = derivative_name(image_hash, width, ext)
+            if default_storage.exists(name):
+                continue
+            if resized is None:
+                resized = source.copy()
+                # thumbnail не увеличивает маленькие картинки
+                resized.thumbnail((width, width * 4), Image.LANCZOS)
+            image = resized.convert('RGB') if pil_format == 'JPEG' else resized
+            buffer = BytesIO()
+            image.save(buffer, pil_format, **options)
+            default_storage.save(name, ContentFile(buffer.getvalue()))
+
+    # update(), а не save(): не вызываем сигналы и не затираем параллельную замену картинки
+    type(product).objects.filter(pk=product.pk, image=product.image.name).update(image_hash=image_hash)
+    product.image_hash = image_hash
+    bump_generation('product')
+    bump_generation(f'product:{product.pk}')
+    return image_hash
+
+
+def schedule_derivatives(product_pk):
+    """Создание копий фоновой задачей (catalog.tasks), воркер увидит ее после коммита."""
+    from catalog.tasks import generate_image_derivatives
+
+    # Каждое сохранение продукта без image_hash снова попадает сюда, пока воркер не создал копии
+    enqueue(generate_image_derivatives, args=(product_pk,), unique=True)
+
+
+def get_srcset(product, preset, ext):
+    return ', '.join(
+        f'{default_storage.url(derivative_name(product.image_hash, width, ext))} {width}w'
+        for width in settings.PRODUCT_IMAGE_PRESETS[preset]['widths']
+    )
+
+
+def get_picture(product, preset):
+    """Данные для тега <picture> или None, если копий еще нет."""
+    if not product.image or not product.image_hash:
+        return None
+    widths = settings.PRODUCT_IMAGE_PRESETS[preset]['widths']
+    return {
+        'src': default_storage.url(derivative_name(product.image_hash, widths[0], 'jpg')),
+        'webp_srcset': get_srcset(product, preset, 'webp'),
+        'jpeg_srcset': get_srcset(product, preset, 'jpg'),
+        'sizes': settings.PRODUCT_IMAGE_PRESETS[preset]['sizes'],
+    }
@@ -0,0 +1,316 @@
+"""
+Потоковый импорт каталога из JSON (массив или фикстура Django), NDJSON и CSV.
+
+Файл читается построчно/кусками, записи пишутся пачками через bulk_create/bulk_update,
+каждая пачка в своей транзакции. Существующие записи обновляются по естественному
+ключу. После каждой пачки номер обработанной строки пишется в файл контрольной
+точки, так что прерванный импорт можно продолжить с --resume.
+"""
+import csv
+import json
+import os
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from django.core.management.color import no_style
+from django.db import connection, transaction
+
+from catalog import aggregates, changes
+from catalog.caching import bump_generation
+from catalog.models import CatalogChange, Category, Product
+from catalog.search import get_backend
+
+JSON_CHUNK_SIZE = 64 * 1024
+
+
+class ImportRowError(ValueError):
+    pass
+
+
+def iter_json_array(f, chunk_size=JSON_CHUNK_SIZE):
+    """Отдает элементы JSON-массива верхнего уровня, не загружая файл целиком."""
+    decoder = json.JSONDecoder()
+    buffer, pos, eof, started = '', 0, False, False
+    while True:
+        skip = ' \t\r\n,' if started else ' \t\r\n'
+        while pos < len(buffer) and buffer[pos] in skip:
+            pos += 1
+        if pos < len(buffer):
+            if not started:
+                if buffer[pos] != '[':
+                    raise ImportRowError('Ожидался JSON-массив')
+                started = True
+                pos += 1
+                continue
+            if buffer[pos] == ']':
+                return
+            try:
+                item, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise ImportRowError('Файл JSON поврежден или оборван')
+            else:
+                yield item
+                continue
+        elif eof:
+            raise ImportRowError('Файл JSON оборван')
+        chunk = f.read(chunk_size)
+        eof = not chunk
+        buffer, pos = buffer[pos:] + chunk, 0
+
+
+def iter_rows(path, fmt=None):
+    """Строки файла как словари; формат определяется по расширению, если не указан."""
+    fmt = fmt or Path(path).suffix.lstrip('.').lower()
+    with open(path, encoding='utf-8', newline='') as f:
+        if fmt == 'json':
+            rows = iter_json_array(f)
+        elif fmt in ('ndjson', 'jsonl'):
+            rows = (json.loads(line) for line in f if line.strip())
+        elif fmt == 'csv':
+            rows = csv.DictReader(f)
+        else:
+            raise ImportRowError(f'Неизвестный формат: {fmt}')
+        for row in rows:
+            # Записи фикстур Django: {"model": ..., "pk": ..., "fields": {...}}
+            if 'fields' in row:
+                row = {'pk': row.get('pk'), **row['fields']}
+            yield row
+
+
+class BulkImporter:
+    model = None
+    update_fields = ()
+
+    def __init__(self, batch_size=1000, stdout=None):
+        self.batch_size = batch_size
+        self.stdout = stdout
+        self.created = 0
+        self.updated = 0
+        self.skipped = 0
+        self.processed = 0
+
+    def build(self, row):
+        raise NotImplementedError
+
+    def natural_key(self, obj):
+        raise NotImplementedError
+
+    def find_existing(self, objects):
+        """{естественный ключ: pk} для уже сохраненных записей из пачки."""
+        raise NotImplementedError
+
+    def get_update_fields(self, obj):
+        """Поля, которые импорт перезаписывает у найденной записи."""
+        return self.update_fields
+
+    def after_batch(self, created, updated):
+        pass
+
+    def checkpoint_path(self, path):
+        return f'{path}.checkpoint'
+
+    def run(self, path, fmt=None, resume=False):
+        """Импортирует файл, возвращает (число обработанных строк, секунд)."""
+        checkpoint = self.checkpoint_path(path)
+        self.start_from = 0
+        if resume and os.path.exists(checkpoint):
+            with open(checkpoint) as f:
+                self.start_from = int(f.read().strip() or 0)
+            self.log(f'Продолжение со строки {self.start_from + 1}')
+
+        self.started = time.monotonic()
+        self.processed = self.start_from
+        batch = []
+        for number, row in enumerate(iter_rows(path, fmt), start=1):
+            if number <= self.start_from:
+                continue
+            try:
+                batch.append(self.build(row))
+            except (KeyError, ValueError, TypeError) as e:
+                self.skipped += 1
+                self.log(f'Строка {number} пропущена: {e!r}')
+            self.processed = number
+            if len(batch) >= self.batch_size:
+                self.flush(batch)
+                self.save_checkpoint(checkpoint)
+                batch = []
+        if batch:
+            self.flush(batch)
+        self.finish()
+        self.save_checkpoint(checkpoint)
+        os.remove(checkpoint)
+        return self.processed - self.start_from, time.monotonic() - self.started
+
+    def finish(self):
+        pass
+
+    @property
+    def rate(self):
+        elapsed = time.monotonic() - self.started
+        return (self.processed - self.start_from) / elapsed if elapsed else 0
+
+    def flush(self, objects):
+        by_key = {self.natural_key(obj): obj for obj in objects}
+        existing = self.find_existing(list(by_key.values()))
+        to_create, to_update = [], []
+        for key, obj in by_key.items():
+            if key in existing:
+                obj.pk = existing[key]
+                to_update.append(obj)
+            else:
+                to_create.append(obj)
+        with transaction.atomic():
+            self.model.objects.bulk_create(to_create)
+            by_fields = defaultdict(list)
+            for obj in to_update:
+                by_fields[tuple(self.get_update_fields(obj))].append(obj)
+            for update_fields, objects in by_fields.items():
+                # bulk_update не заполняет auto_now-поля (дата изменения продукта), заполняем их сами
+                for field in self.model._meta.concrete_fields:
+                    if getattr(field, 'auto_now', False) and field.name in update_fields:
+                        for obj in objects:
+                            field.pre_save(obj, add=False)
+                self.model.objects.bulk_update(objects, update_fields)
+            self.after_batch(to_create, to_update)
+        self.created += len(to_create)
+        self.updated += len(to_update)
+
+    def save_checkpoint(self, checkpoint):
+        with open(checkpoint, 'w') as f:
+            f.write(str(self.processed))
+        self.log(f'{self.processed} строк, {self.rate:.0f} строк/с')
+
+    def log(self, message):
+        if self.stdout is not None:
+            self.stdout.write(message)
+
+
+class CategoryImporter(BulkImporter):
+    model = Category
+    update_fields = ('description',)
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.names_by_pk = dict(Category.objects.values_list('pk', 'name'))
+
+    def build(self, row):
+        category = Category(name=row['name'], description=row.get('description', ''))
+        # pk из фикстуры сохраняем, если он свободен: на него ссылаются продукты
+        pk = int(row['pk']) if row.get('pk') else None
+        if pk is not None and self.names_by_pk.setdefault(pk, category.name) == category.name:
+            category.pk = pk
+        return category
+
+    def natural_key(self, obj):
+        return obj.name
+
+    def find_existing(self, objects):
+        names = [obj.name for obj in objects]
+        return {name: pk for pk, name in Category.objects.filter(name__in=names).values_list('pk', 'name')}
+
+    def after_batch(self, created, updated):
+        changes.record_many(created, CatalogChange.ACTION_CREATE)
+        changes.record_many(updated, CatalogChange.ACTION_UPDATE)
+        transaction.on_commit(lambda: bump_generation('category'))
+
+    def finish(self):
+        # После вставки явных pk счетчик последовательности в Postgres нужно сдвинуть
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), [Category]):
+                cursor.execute(sql)
+
+
+class ProductImporter(BulkImporter):
+    model = Product
+    update_fields = ('description', 'image', 'price_per_unit', 'is_published', 'updated_at')
+
+    def __init__(self, owner, **kwargs):
+        super().__init__(**kwargs)
+        self.owner = owner
+        self.categories_by_pk = {}
+        self.categories_by_name = {}
+        # Агрегаты пересчитываются один раз в finish() по всем затронутым категориям и владельцам,
+        # включая владельцев найденных записей: владелец при обновлении не меняется
+        self.touched_category_ids = set()
+        self.touched_owner_ids = set()
+        for pk, name in Category.objects.values_list('pk', 'name'):
+            self.categories_by_pk[pk] = pk
+            self.categories_by_name[name] = pk
+
+    def resolve_category(self, value):
+        if isinstance(value, int) or str(value).isdigit():
+            category_id = self.categories_by_pk.get(int(value))
+        else:
+            category_id = self.categories_by_name.get(value)
+        if category_id is None:
+            raise ImportRowError(f'Неизвестная категория: {value}')
+        return category_id
+
+    def build(self, row):
+        is_published = row.get('is_published', False)
+        if isinstance(is_published, str):
+            is_published = is_published.lower() in ('1', 'true', 'yes')
+        product = Product(
+            name=row['name'],
+            description=row.get('description', ''),
+            image=row.get('image') or None,
+            category_id=self.resolve_category(row['category']),
+            price_per_unit=int(row['price_per_unit']),
+            is_published=is_published,
+            owner=self.owner,
+        )
+        # В выгрузке без колонки image картинку существующего продукта не трогаем
+        product._has_image = 'image' in row
+        return product
+
+    def get_update_fields(self, obj):
+        if obj._has_image:
+            return self.update_fields
+        return tuple(field for field in self.update_fields if field != 'image')
+
+    def natural_key(self, obj):
+        return obj.category_id, obj.name
+
+    def find_existing(self, objects):
+        names = {obj.name for obj in objects}
+        category_ids = {obj.category_id for obj in objects}
+        rows = Product.objects.filter(name__in=names, category_id__in=category_ids).order_by('-pk')
+        existing, images = {}, {}
+        for pk, category_id, name, owner_id, image in rows.values_list('pk', 'category_id', 'name', 'owner_id',
+                                                                       'image'):
+            # При дублях в базе обновляется запись с меньшим pk
+            existing[category_id, name] = pk
+            images[category_id, name] = image
+            self.touched_owner_ids.add(owner_id)
+        # Картинка, которую импорт не меняет, нужна в записи журнала изменений
+        for obj in objects:
+            key = self.natural_key(obj)
+            if not obj._has_image and key in images:
+                obj.image = images[key]
+        return existing
+
+    def after_batch(self, created, updated):
+        # bulk-операции не отправляют сигналы, поисковый индекс обновляем сами
+        get_backend().index_products(created + updated)
+        changes.record_many(created, CatalogChange.ACTION_CREATE)
+        changes.record_many(updated, CatalogChange.ACTION_UPDATE)
+        self.touched_category_ids.update(obj.category_id for obj in created + updated)
+        self.touched_owner_ids.update(obj.owner_id for obj in created + updated)
+
+        updated_pks = [obj.pk for obj in updated]
+
+        def invalidate():
+            bump_generation('product')
+            for pk in updated_pks:
+                bump_generation(f'product:{pk}')
+
+        transaction.on_commit(invalidate)
+
+    def finish(self):
+        if self.start_from:
+            # Пачки до перезапуска в этом процессе не видны, пересчитываем все
+            aggregates.rebuild()
+        else:
+            aggregates.refresh(self.touched_category_ids, self.touched_owner_ids)
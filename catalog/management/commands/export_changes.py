@@ -0,0 +1,35 @@
+import sys
+
+from django.core.management import BaseCommand, CommandError
+
+from catalog.changes import FORMATS, MODELS, export, get_watermark
+
+
+class Command(BaseCommand):
+    help = 'Выгружает изменения каталога после watermark в NDJSON или CSV, новый watermark пишет в stderr'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=int, default=0, help='последний полученный id изменения')
+        parser.add_argument('--format', choices=FORMATS, default='ndjson')
+        parser.add_argument('--model', action='append', choices=list(MODELS.values()), help='только эти модели')
+        parser.add_argument('--gzip', action='store_true', help='сжать выгрузку')
+        parser.add_argument('--output', help='файл выгрузки, по умолчанию stdout')
+        parser.add_argument('--lag', type=int, default=None, help='брать изменения старше стольких секунд')
+
+    def handle(self, *args, **options):
+        if options['since'] < 0:
+            raise CommandError('--since не может быть отрицательным')
+        until = get_watermark(options['since'], options['lag'])
+        chunks = export(options['since'], until, options['format'], options['model'], options['gzip'])
+        if options['output']:
+            with open(options['output'], 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+        elif options['gzip']:
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk.decode(), ending='')
+        self.stderr.write(f'Watermark: {until}')
@@ -1,18 +1,21 @@
-import json
 from django.core.management import BaseCommand
-from catalog.models import Category
 
+from catalog.importers import CategoryImporter
 
-class Command(BaseCommand):
-    def handle(self, *args, **options):
-        Category.objects.all().delete()
-
-        category_list = []
-        with open('catalog/fixtures/category.json', encoding='utf-8') as f:
-            dict_categ = json.load(f)
 
-        for category in dict_categ:
-            category_list.append(Category(name=category['fields']['name'], description=category['fields']['description']))
+class Command(BaseCommand):
+    help = 'Загрузка категорий из JSON/NDJSON/CSV с обновлением существующих по названию'
 
-        Category.objects.bulk_create(category_list)
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='catalog/fixtures/category.json')
+        parser.add_argument('--format', choices=('json', 'ndjson', 'csv'), default=None)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--resume', action='store_true', help='продолжить с последней контрольной точки')
 
+    def handle(self, *args, **options):
+        importer = CategoryImporter(batch_size=options['batch_size'], stdout=self.stdout)
+        rows, elapsed = importer.run(options['path'], fmt=options['format'], resume=options['resume'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Категории: {rows} строк за {elapsed:.1f} с, создано {importer.created}, '
+            f'обновлено {importer.updated}, пропущено {importer.skipped}'
+        ))
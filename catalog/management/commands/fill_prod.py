@@ -1,19 +1,45 @@
-import json
-from django.core.management import BaseCommand
-from catalog.models import Product, Category
+import os
+
+from django.core.management import BaseCommand, CommandError
+
+from catalog.importers import ProductImporter
+from catalog.tasks import import_products
+from tasks.queue import enqueue
+from users.models import User
 
 
 class Command(BaseCommand):
+    help = 'Потоковая загрузка продуктов из JSON/NDJSON/CSV с обновлением существующих по (категория, название)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='catalog/fixtures/product.json')
+        parser.add_argument('--format', choices=('json', 'ndjson', 'csv'), default=None)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--owner', help='почта владельца загружаемых продуктов, по умолчанию первый суперпользователь')
+        parser.add_argument('--resume', action='store_true', help='продолжить с последней контрольной точки')
+        parser.add_argument('--background', action='store_true',
+                            help='поставить загрузку в очередь фоновых задач (выполнит runworker)')
 
     def handle(self, *args, **options):
-        Product.objects.all().delete()
+        if options['owner']:
+            owner = User.objects.filter(email=options['owner']).first()
+        else:
+            owner = User.objects.filter(is_superuser=True).order_by('pk').first()
+        if owner is None:
+            raise CommandError('Не найден владелец продуктов, укажите --owner')
 
-        with open('catalog/fixtures/product.json', encoding='utf-8') as f:
-            products_data = json.load(f)
+        if options['background']:
+            record = enqueue(import_products, kwargs={
+                'path': os.path.abspath(options['path']), 'owner_pk': owner.pk, 'fmt': options['format'],
+                'batch_size': options['batch_size'],
+            })
+            self.stdout.write(self.style.SUCCESS(f'Загрузка поставлена в очередь: задача {record.pk}'))
+            return
 
-        # Создание категорий и продуктов
-        for product_item in products_data:
-            category_id = product_item["fields"].pop("category")  # Получаем и удаляем идентификатор категории из данных продукта
-            category = Category.objects.get(pk=category_id)  # Получаем объект категории по идентификатору
-            product_item["fields"]["category"] = category  # Заменяем идентификатор категории объектом категории
-            Product.objects.create(**product_item["fields"])
\ No newline at end of file
+        importer = ProductImporter(owner, batch_size=options['batch_size'], stdout=self.stdout)
+        rows, elapsed = importer.run(options['path'], fmt=options['format'], resume=options['resume'])
+        rate = rows / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Продукты: {rows} строк за {elapsed:.1f} с ({rate:.0f} строк/с), создано {importer.created}, '
+            f'обновлено {importer.updated}, пропущено {importer.skipped}'
+        ))
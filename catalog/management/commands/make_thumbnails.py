@@ -0,0 +1,39 @@
+from django.core.management import BaseCommand
+
+from catalog.images import generate_derivatives
+from catalog.models import Product
+from catalog.tasks import generate_image_derivatives
+from tasks.queue import enqueue
+
+
+class Command(BaseCommand):
+    help = 'Создание уменьшенных копий картинок продуктов, у которых их еще нет'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='пересоздать копии для всех продуктов')
+        parser.add_argument('--background', action='store_true',
+                            help='поставить продукты в очередь фоновых задач (выполнит runworker)')
+
+    def handle(self, *args, **options):
+        products = Product.objects.exclude(image='').exclude(image=None).order_by('pk')
+        if not options['force']:
+            products = products.filter(image_hash='')
+
+        if options['background']:
+            queued = 0
+            for pk in products.values_list('pk', flat=True).iterator(chunk_size=200):
+                enqueue(generate_image_derivatives, args=(pk,), unique=True)
+                queued += 1
+            self.stdout.write(self.style.SUCCESS(f'Поставлено в очередь: {queued}'))
+            return
+
+        done = failed = 0
+        for product in products.iterator(chunk_size=200):
+            try:
+                generate_derivatives(product)
+            except (OSError, ValueError) as e:
+                failed += 1
+                self.stderr.write(f'Продукт {product.pk}: {e}')
+            else:
+                done += 1
+        self.stdout.write(self.style.SUCCESS(f'Готово: {done}, с ошибкой: {failed}'))
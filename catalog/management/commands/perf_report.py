@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+
+from skypro_diplom.performance import METRICS, get_report, is_process_local, reset_report
+
+
+class Command(BaseCommand):
+    help = 'Перцентили числа запросов и времени ответа по URL name'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sort', choices=METRICS, default='total_ms')
+        parser.add_argument('--reset', action='store_true', help='Очистить накопленные замеры после вывода')
+
+    def handle(self, *args, **options):
+        if is_process_local():
+            raise CommandError(
+                f'Замеры хранятся в памяти процесса (кеш {settings.PERFORMANCE_CACHE_ALIAS!r}), '
+                'команда их не увидит: укажите в PERFORMANCE_CACHE_ALIAS общий кеш (Redis, файлы, БД)'
+            )
+        report = get_report()
+        if not report:
+            self.stdout.write('Замеров нет')
+            return
+        sort = options['sort']
+        self.stdout.write(f"{'URL name':<32}{'n':>6}  {'метрика':<12}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+        for view_name, stats in sorted(report.items(), key=lambda item: item[1][sort]['p95'], reverse=True):
+            for i, metric in enumerate(METRICS):
+                values = stats[metric]
+                self.stdout.write(
+                    f"{view_name if i == 0 else '':<32}{stats['count'] if i == 0 else '':>6}  {metric:<12}"
+                    + ''.join(f'{values[p]:>10.1f}' for p in ('p50', 'p95', 'p99', 'max'))
+                )
+        if options['reset']:
+            reset_report()
@@ -0,0 +1,20 @@
+from django.core.management import BaseCommand
+
+from catalog.aggregates import rebuild
+from catalog.tasks import rebuild_catalog_stats
+
+
+class Command(BaseCommand):
+    help = 'Полный пересчет агрегатов каталога по категориям и владельцам'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--background', action='store_true',
+                            help='поставить пересчет в очередь фоновых задач (выполнит runworker)')
+
+    def handle(self, *args, **options):
+        if options['background']:
+            rebuild_catalog_stats.enqueue()
+            self.stdout.write(self.style.SUCCESS('Пересчет поставлен в очередь'))
+            return
+        categories, owners = rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Агрегаты пересчитаны: категорий {categories}, владельцев {owners}'))
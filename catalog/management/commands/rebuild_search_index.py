@@ -0,0 +1,14 @@
+from django.core.management import BaseCommand
+
+from catalog.search import get_backend
+
+
+class Command(BaseCommand):
+    help = 'Полная перестройка поискового индекса продуктов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=None)
+
+    def handle(self, *args, **options):
+        get_backend(options['database']).rebuild()
+        self.stdout.write(self.style.SUCCESS('Поисковый индекс перестроен'))
@@ -0,0 +1,24 @@
+from django.core.management import BaseCommand
+
+from catalog.stock import reconcile, take_snapshots
+
+
+class Command(BaseCommand):
+    help = 'Сворачивает журнал движений товаров в снимки остатков и сверяет их с текущими остатками'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lag', type=int, default=None, help='брать движения старше стольких секунд')
+        parser.add_argument('--reconcile', action='store_true', help='сверить остатки с журналом')
+
+    def handle(self, *args, **options):
+        created = take_snapshots(options['lag'])
+        self.stdout.write(f'Снимков создано: {created}')
+        if not options['reconcile']:
+            return
+        drift = reconcile()
+        for product_id, warehouse_id, level, ledger in drift:
+            self.stderr.write(f'Расхождение: продукт {product_id}, склад {warehouse_id}: '
+                              f'остаток/резерв {level}, по журналу {ledger}')
+        if drift:
+            raise SystemExit(1)
+        self.stdout.write(self.style.SUCCESS('Остатки совпадают с журналом'))
@@ -0,0 +1,88 @@
+# Generated by Django 5.0.6 on 2026-10-18 11:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+TRUE_VALUES = ('true', '1', 'yes', 'да')
+
+
+def convert_current_versions(apps, schema_editor):
+    # Строковое поле хранило либо 'True', либо номер версии: текущей считаем версию с истинным
+    # значением или с совпадающим номером, а при нескольких кандидатах - последнюю созданную
+    Version = apps.get_model('catalog', 'Version')
+    active = {}
+    for pk, product_id, number, current in Version.objects.order_by('pk').values_list(
+            'pk', 'product_id', 'version_number', 'current_version'):
+        if product_id is None:
+            continue
+        if str(current).strip().lower() in TRUE_VALUES or current == number:
+            active[product_id] = pk
+    Version.objects.filter(pk__in=active.values()).update(is_current=True)
+
+
+def restore_current_versions(apps, schema_editor):
+    Version = apps.get_model('catalog', 'Version')
+    Version.objects.filter(is_current=True).update(current_version='True')
+
+
+def fill_active_version(apps, schema_editor):
+    Product = apps.get_model('catalog', 'Product')
+    Version = apps.get_model('catalog', 'Version')
+    for pk, product_id in Version.objects.filter(current_version=True).values_list('pk', 'product_id'):
+        Product.objects.filter(pk=product_id).update(active_version_id=pk)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0003_product_image_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='version',
+            name='is_current',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(convert_current_versions, restore_current_versions),
+        migrations.RemoveField(
+            model_name='version',
+            name='current_version',
+        ),
+        migrations.RenameField(
+            model_name='version',
+            old_name='is_current',
+            new_name='current_version',
+        ),
+        migrations.AlterField(
+            model_name='version',
+            name='current_version',
+            field=models.BooleanField(default=False, verbose_name='текущая версия'),
+        ),
+        migrations.AddConstraint(
+            model_name='version',
+            constraint=models.UniqueConstraint(condition=models.Q(('current_version', True)), fields=('product',), name='unique_current_version_per_product'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='active_version',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='catalog.version', verbose_name='текущая версия'),
+        ),
+        migrations.RunPython(fill_active_version, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['name', 'id'], name='product_name_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'name', 'id'], name='product_category_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['owner', 'name', 'id'], name='product_owner_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['is_published', 'name', 'id'], name='product_published_name_idx'),
+        ),
+    ]
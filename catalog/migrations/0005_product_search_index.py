@@ -0,0 +1,79 @@
+# Generated by Django 5.0.6 on 2026-10-18 11:40
+
+import re
+
+from django.db import migrations
+
+from catalog.stemmer import stem
+
+TOKEN = re.compile(r'\w+')
+
+SQLITE_CREATE = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS catalog_product_fts USING fts5("
+    "name, description, tokenize='porter unicode61 remove_diacritics 2', prefix='2 3 4')"
+)
+SQLITE_DROP = 'DROP TABLE IF EXISTS catalog_product_fts'
+
+POSTGRES_CREATE = (
+    'CREATE TABLE IF NOT EXISTS catalog_product_search ('
+    'product_id bigint PRIMARY KEY REFERENCES catalog_product (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, '
+    'document tsvector NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS catalog_product_search_document_idx ON catalog_product_search USING GIN (document)',
+)
+POSTGRES_DROP = ('DROP TABLE IF EXISTS catalog_product_search',)
+
+POSTGRES_FILL = (
+    'INSERT INTO catalog_product_search (product_id, document) '
+    "SELECT id, setweight(to_tsvector('russian', name), 'A') || "
+    "setweight(to_tsvector('russian', description), 'B') FROM catalog_product "
+    'ON CONFLICT (product_id) DO NOTHING'
+)
+
+
+def prepare(text):
+    # Копия catalog.search.SqliteSearchBackend.prepare на момент миграции
+    tokens = TOKEN.findall(text.lower().replace('ё', 'е'))
+    return ' '.join(stem(token) for token in tokens if token != '_')
+
+
+def fill_sqlite_index(connection):
+    with connection.cursor() as read, connection.cursor() as write:
+        read.execute('SELECT id, name, description FROM catalog_product')
+        while rows := read.fetchmany(2000):
+            write.executemany(
+                'INSERT INTO catalog_product_fts (rowid, name, description) VALUES (%s, %s, %s)',
+                [[pk, prepare(name), prepare(description)] for pk, name, description in rows],
+            )
+
+
+def create_search_index(apps, schema_editor):
+    # Индекс сразу заполняется уже существующими продуктами. Сырой SQL, а не
+    # catalog.search: миграция не должна зависеть от текущего кода и моделей
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(SQLITE_CREATE)
+        fill_sqlite_index(schema_editor.connection)
+    elif vendor == 'postgresql':
+        for sql in POSTGRES_CREATE:
+            schema_editor.execute(sql)
+        schema_editor.execute(POSTGRES_FILL)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(SQLITE_DROP)
+    elif vendor == 'postgresql':
+        for sql in POSTGRES_DROP:
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0004_version_current_flag_active_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,85 @@
+# Generated by Django 5.0.6 on 2026-10-18 11:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0005_product_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Warehouse',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='название')),
+                ('code', models.CharField(max_length=20, unique=True, verbose_name='код')),
+            ],
+            options={
+                'verbose_name': 'склад',
+                'verbose_name_plural': 'склады',
+                'ordering': ('name',),
+            },
+        ),
+        migrations.CreateModel(
+            name='StockLevel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(default=0, verbose_name='на складе')),
+                ('reserved', models.PositiveIntegerField(default=0, verbose_name='в резерве')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='изменен')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_levels', to='catalog.product', verbose_name='продукт')),
+                ('warehouse', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_levels', to='catalog.warehouse', verbose_name='склад')),
+            ],
+            options={
+                'verbose_name': 'остаток',
+                'verbose_name_plural': 'остатки',
+            },
+        ),
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.IntegerField(verbose_name='на складе')),
+                ('reserved', models.IntegerField(verbose_name='в резерве')),
+                ('last_movement_id', models.BigIntegerField(verbose_name='последнее движение')),
+                ('taken_at', models.DateTimeField(auto_now_add=True, verbose_name='снят')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='catalog.product', verbose_name='продукт')),
+                ('warehouse', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='catalog.warehouse', verbose_name='склад')),
+            ],
+            options={
+                'verbose_name': 'снимок остатка',
+                'verbose_name_plural': 'снимки остатков',
+                'indexes': [models.Index(fields=['product', 'warehouse', '-last_movement_id'], name='stock_snapshot_level_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('receipt', 'поступление'), ('reserve', 'резерв'), ('release', 'снятие резерва'), ('ship', 'отгрузка из резерва'), ('sale', 'продажа'), ('adjust', 'инвентаризация')], max_length=10, verbose_name='тип')),
+                ('quantity_delta', models.IntegerField(default=0, verbose_name='изменение остатка')),
+                ('reserved_delta', models.IntegerField(default=0, verbose_name='изменение резерва')),
+                ('reference', models.CharField(blank=True, default='', max_length=100, verbose_name='основание')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='создано')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_movements', to='catalog.product', verbose_name='продукт')),
+                ('warehouse', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_movements', to='catalog.warehouse', verbose_name='склад')),
+            ],
+            options={
+                'verbose_name': 'движение товара',
+                'verbose_name_plural': 'движения товаров',
+                'indexes': [models.Index(fields=['product', 'warehouse', 'id'], name='stock_movement_level_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='stocklevel',
+            constraint=models.UniqueConstraint(fields=('product', 'warehouse'), name='unique_stock_level'),
+        ),
+        migrations.AddConstraint(
+            model_name='stocklevel',
+            constraint=models.CheckConstraint(check=models.Q(('reserved__lte', models.F('quantity'))), name='stock_reserved_lte_quantity'),
+        ),
+    ]
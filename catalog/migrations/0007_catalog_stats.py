@@ -0,0 +1,71 @@
+# Generated by Django 5.0.6 on 2026-10-18 11:19
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, Min, Q, Sum
+
+
+def fill_stats(apps, schema_editor):
+    Product = apps.get_model('catalog', 'Product')
+    CategoryStats = apps.get_model('catalog', 'CategoryStats')
+    OwnerStats = apps.get_model('catalog', 'OwnerStats')
+    published = Count('pk', filter=Q(is_published=True))
+    CategoryStats.objects.bulk_create(
+        CategoryStats(category_id=row['category_id'], product_count=row['count'], published_count=row['published'],
+                      price_min=row['min'], price_max=row['max'], price_sum=row['sum'])
+        for row in Product.objects.order_by().values('category_id').annotate(
+            count=Count('pk'), published=published, min=Min('price_per_unit'), max=Max('price_per_unit'),
+            sum=Sum('price_per_unit'))
+    )
+    OwnerStats.objects.bulk_create(
+        OwnerStats(owner_id=row['owner_id'], product_count=row['count'], published_count=row['published'],
+                   price_sum=row['sum'])
+        for row in Product.objects.order_by().values('owner_id').annotate(
+            count=Count('pk'), published=published, sum=Sum('price_per_unit'))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0006_stock_ledger'),
+        ('users', '0004_outgoingemail'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryStats',
+            fields=[
+                ('category', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='catalog.category', verbose_name='категория')),
+                ('product_count', models.PositiveIntegerField(default=0, verbose_name='продуктов')),
+                ('published_count', models.PositiveIntegerField(default=0, verbose_name='опубликовано')),
+                ('price_min', models.IntegerField(blank=True, null=True, verbose_name='минимальная цена')),
+                ('price_max', models.IntegerField(blank=True, null=True, verbose_name='максимальная цена')),
+                ('price_sum', models.BigIntegerField(default=0, verbose_name='сумма цен')),
+            ],
+            options={
+                'verbose_name': 'статистика категории',
+                'verbose_name_plural': 'статистика категорий',
+            },
+        ),
+        migrations.CreateModel(
+            name='OwnerStats',
+            fields=[
+                ('owner', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='product_stats', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='владелец')),
+                ('product_count', models.PositiveIntegerField(default=0, verbose_name='продуктов')),
+                ('published_count', models.PositiveIntegerField(default=0, verbose_name='опубликовано')),
+                ('price_sum', models.BigIntegerField(default=0, verbose_name='сумма цен')),
+            ],
+            options={
+                'verbose_name': 'статистика владельца',
+                'verbose_name_plural': 'статистика владельцев',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'price_per_unit'], name='product_category_price_idx'),
+        ),
+        migrations.RunPython(fill_stats, migrations.RunPython.noop),
+    ]
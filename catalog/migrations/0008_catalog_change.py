@@ -0,0 +1,30 @@
+# Generated by Django 5.0.6 on 2026-10-18 11:33
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0007_catalog_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogChange',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('model', models.CharField(max_length=20, verbose_name='модель')),
+                ('object_id', models.BigIntegerField(verbose_name='id объекта')),
+                ('action', models.CharField(choices=[('create', 'создание'), ('update', 'изменение'), ('delete', 'удаление')], max_length=10, verbose_name='действие')),
+                ('data', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder, null=True, verbose_name='данные')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='создано')),
+            ],
+            options={
+                'verbose_name': 'изменение каталога',
+                'verbose_name_plural': 'изменения каталога',
+                'indexes': [models.Index(fields=['model', 'id'], name='catalog_change_model_idx')],
+            },
+        ),
+    ]
@@ -1,5 +1,7 @@
-from django.db import models
-from django.db.models import ForeignKey
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
+from django.db.models import ForeignKey, Q
+from django.utils import timezone
 
 from users.models import User
 
@@ -11,6 +13,11 @@ class Category(models.Model):
     def __str__(self):
         return f'{self.name}'
 
+    def save(self, *args, **kwargs):
+        # Сигналы пишут журнал изменений (catalog.changes) в той же транзакции
+        with transaction.atomic(using=kwargs.get('using'), savepoint=False):
+            super().save(*args, **kwargs)
+
     class Meta:
         verbose_name = 'категория'
         verbose_name_plural = 'категории'
@@ -21,20 +28,42 @@ class Product(models.Model):
     name = models.CharField(verbose_name='название', max_length=255)
     description = models.TextField(verbose_name='описание')
     image = models.ImageField(upload_to='products/', verbose_name='картинка', null=True, blank=True)
+    image_hash = models.CharField(max_length=16, blank=True, default='', editable=False,
+                                  verbose_name='хеш картинки')
     category = models.ForeignKey(Category, on_delete=models.CASCADE, verbose_name='категория')
     price_per_unit = models.IntegerField(verbose_name='цена за штуку')
     created_at = models.DateField(verbose_name='дата создания', auto_now_add=True)
-    updated_at = models.DateField(verbose_name='дата последнего изменения', auto_now_add=True)
+    updated_at = models.DateTimeField(verbose_name='дата последнего изменения', auto_now=True)
     owner = models.ForeignKey(User, on_delete=models.CASCADE, default=None, related_name='products', verbose_name='Владелец')
     is_published = models.BooleanField(default=False, verbose_name='опубликован')
+    # Денормализованная ссылка на текущую версию, поддерживается в Version.save()
+    active_version = models.ForeignKey('Version', on_delete=models.SET_NULL, null=True, blank=True, editable=False,
+                                       related_name='+', verbose_name='текущая версия')
 
     def __str__(self):
         return f'{self.name} {self.category} {self.price_per_unit}'
 
+    def get_active_version(self):
+        return self.active_version
+
+    def save(self, *args, **kwargs):
+        # Сигналы пишут журнал изменений и агрегаты в той же транзакции
+        with transaction.atomic(using=kwargs.get('using'), savepoint=False):
+            super().save(*args, **kwargs)
+
     class Meta:
         verbose_name = 'продукт'
         verbose_name_plural = 'продукты'
         ordering = ('name',)
+        indexes = [
+            # Списки сортируются по (name, pk), в том числе курсорная пагинация
+            models.Index(fields=('name', 'id'), name='product_name_id_idx'),
+            models.Index(fields=('category', 'name', 'id'), name='product_category_name_idx'),
+            # Пересчет минимальной и максимальной цены категории в catalog.aggregates
+            models.Index(fields=('category', 'price_per_unit'), name='product_category_price_idx'),
+            models.Index(fields=('owner', 'name', 'id'), name='product_owner_name_idx'),
+            models.Index(fields=('is_published', 'name', 'id'), name='product_published_name_idx'),
+        ]
         permissions = [
             ('can_change_category', 'can_change_category'),
             ('can_change_product', 'can_change_product'),
@@ -45,12 +74,206 @@ class Product(models.Model):
 class Version(models.Model):
     version_name = models.CharField(max_length=200, verbose_name='version name')
     version_number = models.CharField(max_length=100, verbose_name='version number', default='1.0.0')
-    current_version = models.CharField(max_length=100, verbose_name='version number', default='1.0.0')
+    current_version = models.BooleanField(default=False, verbose_name='текущая версия')
     product = ForeignKey(Product, on_delete=models.CASCADE, null=True, blank=True, verbose_name='product')
 
     def __str__(self):
         return f'{self.product.name} - {self.version_name}'
 
+    def save(self, *args, **kwargs):
+        # Текущая версия у продукта одна: снимаем флаг с прежней и обновляем Product.active_version
+        # в той же транзакции, что и сохранение версии
+        with transaction.atomic(using=kwargs.get('using')):
+            if self.current_version and self.product_id:
+                Version.objects.filter(product_id=self.product_id, current_version=True) \
+                    .exclude(pk=self.pk).update(current_version=False)
+            super().save(*args, **kwargs)
+            if self.product_id:
+                products = Product.objects.filter(pk=self.product_id)
+                if self.current_version:
+                    products.update(active_version=self, updated_at=timezone.now())
+                else:
+                    products.filter(active_version=self).update(active_version=None, updated_at=timezone.now())
+
     class Meta:
         verbose_name = 'версия'
-        verbose_name_plural = 'версии'
\ No newline at end of file
+        verbose_name_plural = 'версии'
+        constraints = [
+            models.UniqueConstraint(fields=('product',), condition=Q(current_version=True),
+                                    name='unique_current_version_per_product'),
+        ]
+
+
+class Warehouse(models.Model):
+    name = models.CharField(max_length=100, verbose_name='название')
+    code = models.CharField(max_length=20, unique=True, verbose_name='код')
+
+    def __str__(self):
+        return f'{self.name}'
+
+    class Meta:
+        verbose_name = 'склад'
+        verbose_name_plural = 'склады'
+        ordering = ('name',)
+
+
+class StockLevel(models.Model):
+    """Текущий остаток продукта на складе; меняется только вместе с записью в StockMovement (catalog.stock)."""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_levels',
+                                verbose_name='продукт')
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE, related_name='stock_levels',
+                                  verbose_name='склад')
+    quantity = models.PositiveIntegerField(default=0, verbose_name='на складе')
+    reserved = models.PositiveIntegerField(default=0, verbose_name='в резерве')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='изменен')
+
+    def __str__(self):
+        return f'{self.product} / {self.warehouse}: {self.quantity} ({self.reserved})'
+
+    @property
+    def available(self):
+        return self.quantity - self.reserved
+
+    class Meta:
+        verbose_name = 'остаток'
+        verbose_name_plural = 'остатки'
+        constraints = [
+            models.UniqueConstraint(fields=('product', 'warehouse'), name='unique_stock_level'),
+            models.CheckConstraint(check=Q(reserved__lte=models.F('quantity')), name='stock_reserved_lte_quantity'),
+        ]
+
+
+class StockMovement(models.Model):
+    """Журнал движений: записи только добавляются."""
+    KIND_RECEIPT = 'receipt'
+    KIND_RESERVE = 'reserve'
+    KIND_RELEASE = 'release'
+    KIND_SHIP = 'ship'
+    KIND_SALE = 'sale'
+    KIND_ADJUST = 'adjust'
+    KINDS = (
+        (KIND_RECEIPT, 'поступление'),
+        (KIND_RESERVE, 'резерв'),
+        (KIND_RELEASE, 'снятие резерва'),
+        (KIND_SHIP, 'отгрузка из резерва'),
+        (KIND_SALE, 'продажа'),
+        (KIND_ADJUST, 'инвентаризация'),
+    )
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_movements',
+                                verbose_name='продукт')
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE, related_name='stock_movements',
+                                  verbose_name='склад')
+    kind = models.CharField(max_length=10, choices=KINDS, verbose_name='тип')
+    quantity_delta = models.IntegerField(default=0, verbose_name='изменение остатка')
+    reserved_delta = models.IntegerField(default=0, verbose_name='изменение резерва')
+    reference = models.CharField(max_length=100, blank=True, default='', verbose_name='основание')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='создано')
+
+    def save(self, *args, **kwargs):
+        if self.pk is not None:
+            raise ValueError('Движения склада не изменяются, нужно добавить новое')
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f'{self.get_kind_display()} {self.product_id}/{self.warehouse_id}: {self.quantity_delta:+}'
+
+    class Meta:
+        verbose_name = 'движение товара'
+        verbose_name_plural = 'движения товаров'
+        indexes = [
+            models.Index(fields=('product', 'warehouse', 'id'), name='stock_movement_level_idx'),
+        ]
+
+
+class StockSnapshot(models.Model):
+    """Остаток по журналу на момент движения last_movement_id, от него считается сверка."""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+', verbose_name='продукт')
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE, related_name='+', verbose_name='склад')
+    quantity = models.IntegerField(verbose_name='на складе')
+    reserved = models.IntegerField(verbose_name='в резерве')
+    last_movement_id = models.BigIntegerField(verbose_name='последнее движение')
+    taken_at = models.DateTimeField(auto_now_add=True, verbose_name='снят')
+
+    class Meta:
+        verbose_name = 'снимок остатка'
+        verbose_name_plural = 'снимки остатков'
+        indexes = [
+            models.Index(fields=('product', 'warehouse', '-last_movement_id'), name='stock_snapshot_level_idx'),
+        ]
+
+
+class CategoryStats(models.Model):
+    """Агрегаты по продуктам категории, поддерживаются catalog.aggregates."""
+    category = models.OneToOneField(Category, on_delete=models.CASCADE, primary_key=True, related_name='stats',
+                                    verbose_name='категория')
+    product_count = models.PositiveIntegerField(default=0, verbose_name='продуктов')
+    published_count = models.PositiveIntegerField(default=0, verbose_name='опубликовано')
+    price_min = models.IntegerField(null=True, blank=True, verbose_name='минимальная цена')
+    price_max = models.IntegerField(null=True, blank=True, verbose_name='максимальная цена')
+    price_sum = models.BigIntegerField(default=0, verbose_name='сумма цен')
+
+    def __str__(self):
+        return f'{self.category_id}: {self.product_count}'
+
+    @property
+    def price_avg(self):
+        return self.price_sum / self.product_count if self.product_count else None
+
+    class Meta:
+        verbose_name = 'статистика категории'
+        verbose_name_plural = 'статистика категорий'
+
+
+class OwnerStats(models.Model):
+    """Итоги по продуктам владельца, поддерживаются catalog.aggregates."""
+    owner = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='product_stats',
+                                 verbose_name='владелец')
+    product_count = models.PositiveIntegerField(default=0, verbose_name='продуктов')
+    published_count = models.PositiveIntegerField(default=0, verbose_name='опубликовано')
+    price_sum = models.BigIntegerField(default=0, verbose_name='сумма цен')
+
+    def __str__(self):
+        return f'{self.owner_id}: {self.product_count}'
+
+    @property
+    def price_avg(self):
+        return self.price_sum / self.product_count if self.product_count else None
+
+    class Meta:
+        verbose_name = 'статистика владельца'
+        verbose_name_plural = 'статистика владельцев'
+
+
+class CatalogChange(models.Model):
+    """Журнал изменений каталога для выгрузки дельт (catalog.changes), записи только добавляются."""
+    ACTION_CREATE = 'create'
+    ACTION_UPDATE = 'update'
+    ACTION_DELETE = 'delete'
+    ACTIONS = (
+        (ACTION_CREATE, 'создание'),
+        (ACTION_UPDATE, 'изменение'),
+        (ACTION_DELETE, 'удаление'),
+    )
+
+    id = models.BigAutoField(primary_key=True)
+    model = models.CharField(max_length=20, verbose_name='модель')
+    object_id = models.BigIntegerField(verbose_name='id объекта')
+    action = models.CharField(max_length=10, choices=ACTIONS, verbose_name='действие')
+    data = models.JSONField(null=True, encoder=DjangoJSONEncoder, verbose_name='данные')
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='создано')
+
+    def save(self, *args, **kwargs):
+        if self.pk is not None:
+            raise ValueError('Записи журнала изменений не изменяются')
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f'{self.pk}: {self.action} {self.model} {self.object_id}'
+
+    class Meta:
+        verbose_name = 'изменение каталога'
+        verbose_name_plural = 'изменения каталога'
+        indexes = [
+            models.Index(fields=('model', 'id'), name='catalog_change_model_idx'),
+        ]
@@ -0,0 +1,99 @@
+"""
+Проверка текста на запрещенные слова.
+
+Слова каждого списка собираются в одно регулярное выражение по префиксному
+дереву, так что текст проходится один раз независимо от длины списка. Списки
+берутся из settings.BANNED_WORDS ({название: слова}, у каждой формы свой список),
+слова из файла settings.BANNED_WORDS_FILE (по слову на строку) добавляются ко
+всем спискам; при изменении файла выражения пересобираются без перезапуска.
+"""
+import os
+import re
+import threading
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+_lock = threading.Lock()
+# {название списка: выражение}, None - все списки вместе
+_matchers = {}
+_file_mtime = None
+
+
+def _file_state():
+    path = getattr(settings, 'BANNED_WORDS_FILE', None)
+    if not path:
+        return None
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def load_banned_words(word_list=None):
+    words = [word for name, names in settings.BANNED_WORDS.items() if word_list in (None, name) for word in names]
+    path = getattr(settings, 'BANNED_WORDS_FILE', None)
+    if path and os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            words.extend(line.strip() for line in f)
+    return sorted({word.lower() for word in words if word}, key=len, reverse=True)
+
+
+def _trie_pattern(node):
+    branches = [re.escape(char) + _trie_pattern(child) for char, child in sorted(node.items()) if char]
+    if not branches:
+        return ''
+    if '' in node:
+        return f"(?:{'|'.join(branches)})?"
+    if len(branches) == 1:
+        return branches[0]
+    return f"(?:{'|'.join(branches)})"
+
+
+def compile_matcher(words):
+    """Выражение из префиксного дерева слов: у общих префиксов одна ветка, поэтому поиск не перебирает все слова."""
+    if not words:
+        return None
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+    return re.compile(_trie_pattern(trie))
+
+
+def reload():
+    global _matchers, _file_mtime
+    with _lock:
+        _file_mtime = _file_state()
+        _matchers = {name: compile_matcher(load_banned_words(name)) for name in [None, *settings.BANNED_WORDS]}
+
+
+def get_matcher(word_list=None):
+    if _file_state() != _file_mtime:
+        reload()
+    return _matchers[word_list]
+
+
+def find_banned_word(text, word_list=None):
+    """Первое запрещенное слово списка word_list (None - всех списков) в тексте, в нижнем регистре, или None."""
+    matcher = get_matcher(word_list)
+    if matcher is None or not text:
+        return None
+    match = matcher.search(text.lower())
+    return match.group() if match else None
+
+
+def contains_banned_word(*texts, word_list=None):
+    return any(find_banned_word(text, word_list) for text in texts)
+
+
+@receiver(setting_changed)
+def reload_on_setting_changed(setting, **kwargs):
+    if setting in ('BANNED_WORDS', 'BANNED_WORDS_FILE'):
+        reload()
+
+
+reload()
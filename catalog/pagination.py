@@ -0,0 +1,61 @@
+import base64
+import json
+
+from django.db.models import Q
+
+
+def encode_cursor(name, pk):
+    data = json.dumps([name, pk], ensure_ascii=False).encode()
+    return base64.urlsafe_b64encode(data).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        name, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise ValueError(f'Неверный курсор: {cursor}')
+    if not isinstance(name, str) or not isinstance(pk, int):
+        raise ValueError(f'Неверный курсор: {cursor}')
+    return name, pk
+
+
+def filter_after_cursor(queryset, cursor=None):
+    """Сортирует по (name, pk) и оставляет записи после курсора, без OFFSET."""
+    queryset = queryset.order_by('name', 'pk')
+    if cursor:
+        name, pk = decode_cursor(cursor)
+        queryset = queryset.filter(Q(name__gt=name) | Q(name=name, pk__gt=pk))
+    return queryset
+
+
+def paginate_by_keyset(queryset, cursor=None, per_page=24):
+    """Возвращает объекты страницы и курсор следующей страницы (None на последней)."""
+    objects = list(filter_after_cursor(queryset, cursor)[:per_page + 1])
+    next_cursor = None
+    if len(objects) > per_page:
+        objects = objects[:per_page]
+        next_cursor = encode_cursor(objects[-1].name, objects[-1].pk)
+    return objects, next_cursor
+
+
+async def apaginate_by_keyset(queryset, cursor=None, per_page=24):
+    """Асинхронный вариант paginate_by_keyset."""
+    objects = [obj async for obj in filter_after_cursor(queryset, cursor)[:per_page + 1]]
+    next_cursor = None
+    if len(objects) > per_page:
+        objects = objects[:per_page]
+        next_cursor = encode_cursor(objects[-1].name, objects[-1].pk)
+    return objects, next_cursor
+
+
+def iter_keyset_batches(queryset, fields, batch_size=500, cursor=None):
+    """Отдает словари values() пачками по batch_size, в памяти не больше одной пачки."""
+    fields = tuple(dict.fromkeys(('pk', 'name') + tuple(fields)))
+    while True:
+        batch = list(filter_after_cursor(queryset, cursor).values(*fields)[:batch_size])
+        if not batch:
+            return
+        yield from batch
+        if len(batch) < batch_size:
+            return
+        cursor = encode_cursor(batch[-1]['name'], batch[-1]['pk'])
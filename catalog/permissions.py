@@ -0,0 +1,25 @@
+"""
+Проверка прав на продукты без отдельных запросов на каждый объект.
+
+Продукт может менять или удалять владелец либо пользователь с правом
+catalog.can_change_product / catalog.can_delete_product. Права берутся
+из кеша (users.services.permissions), а владение проверяется в SQL:
+чужой продукт просто не находится в queryset представления.
+"""
+from catalog.models import Product
+
+CHANGE = 'catalog.can_change_product'
+DELETE = 'catalog.can_delete_product'
+
+
+def can_modify(user, product, permission):
+    return product.owner_id == user.pk or user.has_perm(permission)
+
+
+def filter_modifiable(user, permission, queryset=None):
+    """Продукты, которые пользователь может менять с правом permission."""
+    if queryset is None:
+        queryset = Product.objects.all()
+    if user.has_perm(permission):
+        return queryset
+    return queryset.filter(owner_id=user.pk)
@@ -0,0 +1,241 @@
+"""
+Полнотекстовый поиск по названию и описанию продуктов.
+
+Индекс хранится в отдельной таблице и обновляется сигналами Product:
+на SQLite это виртуальная таблица FTS5 с ранжированием bm25(), на Postgres -
+tsvector с GIN-индексом и ts_rank_cd() (русская конфигурация стеммит и
+латиницу английским стеммером). На остальных СУБД используется icontains.
+"""
+import itertools
+import re
+
+from django.conf import settings
+from django.db import connections, router
+from django.db.models import Count, Q
+from django.db.models.expressions import RawSQL
+
+from catalog.models import Product
+from catalog.stemmer import stem
+
+TOKEN = re.compile(r'\w+')
+
+
+def tokenize(text):
+    return [token for token in TOKEN.findall(text.lower().replace('ё', 'е')) if token != '_']
+
+
+class FallbackSearchBackend:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def index_product(self, product):
+        self.index_products([product])
+
+    def index_products(self, products):
+        pass
+
+    def remove_product(self, pk):
+        pass
+
+    def rebuild(self):
+        pass
+
+    def filter(self, queryset, query, prefix=False):
+        condition = Q()
+        for token in tokenize(query):
+            condition &= Q(name__icontains=token) | Q(description__icontains=token)
+        return queryset.filter(condition)
+
+    def ranked(self, queryset, query, prefix=False):
+        return self.filter(queryset, query, prefix).order_by('name', 'pk')
+
+
+class SqliteSearchBackend(FallbackSearchBackend):
+    table = 'catalog_product_fts'
+    # Вес названия относительно описания в bm25()
+    rank_sql = f'bm25({table}, 10.0, 1.0)'
+
+    @staticmethod
+    def prepare(text):
+        # Русские слова приводим к основе сами, английские стеммит токенизатор porter
+        return ' '.join(stem(token) for token in tokenize(text))
+
+    def index_products(self, products):
+        # REPLACE заменяет прежнюю запись продукта одним запросом вместо DELETE и INSERT
+        with self.connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT OR REPLACE INTO {self.table} (rowid, name, description) VALUES (%s, %s, %s)',
+                [[product.pk, self.prepare(product.name), self.prepare(product.description)] for product in products],
+            )
+
+    def remove_product(self, pk):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid = %s', [pk])
+
+    def rebuild(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+        products = Product.objects.only('pk', 'name', 'description').iterator(chunk_size=2000)
+        while batch := list(itertools.islice(products, 2000)):
+            self.index_products(batch)
+
+    def match_expression(self, query, prefix=False):
+        tokens = tokenize(query)
+        if not tokens:
+            return None
+        terms = [f'"{stem(token)}"' for token in tokens]
+        if prefix:
+            # Последнее слово может быть недописано: ищем и по нему, и по его основе
+            last = tokens[-1]
+            terms[-1] = f'("{last}"* OR "{stem(last)}"*)'
+        return ' '.join(terms)
+
+    def filter(self, queryset, query, prefix=False):
+        expression = self.match_expression(query, prefix)
+        if expression is None:
+            return queryset.none()
+        return queryset.filter(pk__in=RawSQL(f'SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s',
+                                             [expression]))
+
+    def ranked(self, queryset, query, prefix=False):
+        expression = self.match_expression(query, prefix)
+        if expression is None:
+            return queryset.none()
+        # Соединение с таблицей индекса вместо подзапроса для каждой строки:
+        # MATCH выполняется один раз, bm25() считается только для найденных строк.
+        # bm25() отрицательный: чем меньше, тем релевантнее
+        return queryset.extra(
+            select={'rank': self.rank_sql},
+            tables=[self.table],
+            where=[f'{self.table}.rowid = catalog_product.id', f'{self.table} MATCH %s'],
+            params=[expression],
+        ).order_by('rank', 'pk')
+
+
+class PostgresSearchBackend(FallbackSearchBackend):
+    table = 'catalog_product_search'
+    config = 'russian'
+
+    def index_products(self, products):
+        with self.connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {self.table} (product_id, document) '
+                f"VALUES (%s, setweight(to_tsvector('{self.config}', %s), 'A') || "
+                f"setweight(to_tsvector('{self.config}', %s), 'B')) "
+                'ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document',
+                [[product.pk, product.name, product.description] for product in products],
+            )
+
+    def remove_product(self, pk):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE product_id = %s', [pk])
+
+    def rebuild(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {self.table} (product_id, document) '
+                f"SELECT id, setweight(to_tsvector('{self.config}', name), 'A') || "
+                f"setweight(to_tsvector('{self.config}', description), 'B') FROM catalog_product "
+                'ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document'
+            )
+
+    def tsquery(self, query, prefix=False):
+        tokens = tokenize(query)
+        if not tokens:
+            return None
+        if prefix:
+            tokens[-1] += ':*'
+        return ' & '.join(tokens)
+
+    def filter(self, queryset, query, prefix=False):
+        tsquery = self.tsquery(query, prefix)
+        if tsquery is None:
+            return queryset.none()
+        return queryset.filter(pk__in=RawSQL(
+            f"SELECT product_id FROM {self.table} WHERE document @@ to_tsquery('{self.config}', %s)", [tsquery]))
+
+    def ranked(self, queryset, query, prefix=False):
+        tsquery = self.tsquery(query, prefix)
+        if tsquery is None:
+            return queryset.none()
+        return queryset.extra(
+            select={'rank': f"ts_rank_cd({self.table}.document, to_tsquery('{self.config}', %s))"},
+            select_params=[tsquery],
+            tables=[self.table],
+            where=[f'{self.table}.product_id = catalog_product.id',
+                   f"{self.table}.document @@ to_tsquery('{self.config}', %s)"],
+            params=[tsquery],
+        ).order_by('-rank', 'pk')
+
+
+BACKENDS = {
+    'sqlite': SqliteSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def get_backend(using=None):
+    connection = connections[using or router.db_for_write(Product)]
+    return BACKENDS.get(connection.vendor, FallbackSearchBackend)(connection)
+
+
+def get_price_facets(queryset):
+    bounds = settings.SEARCH_PRICE_BUCKETS
+    ranges = [(low, high) for low, high in zip(bounds, bounds[1:])] + [(bounds[-1], None)]
+    aggregates = {}
+    for i, (low, high) in enumerate(ranges):
+        condition = Q(price_per_unit__gte=low)
+        if high is not None:
+            condition &= Q(price_per_unit__lt=high)
+        aggregates[f'bucket_{i}'] = Count('pk', filter=condition)
+    counts = queryset.order_by().aggregate(**aggregates)
+    return [
+        {'min': low, 'max': high, 'count': counts[f'bucket_{i}']}
+        for i, (low, high) in enumerate(ranges) if counts[f'bucket_{i}']
+    ]
+
+
+def search_products(query, category=None, price_min=None, price_max=None, limit=24, offset=0):
+    """
+    Поиск с ранжированием и фасетами.
+
+    Фасеты по категориям считаются без учета фильтра по категории, по цене -
+    без учета фильтра по цене, чтобы их можно было переключать.
+    """
+    backend = get_backend(router.db_for_read(Product))
+    matched = backend.filter(Product.objects.all(), query)
+
+    by_category = matched
+    by_price = matched
+    if category:
+        by_price = by_price.filter(category_id=category)
+    if price_min is not None:
+        by_category = by_category.filter(price_per_unit__gte=price_min)
+    if price_max is not None:
+        by_category = by_category.filter(price_per_unit__lte=price_max)
+
+    results = backend.ranked(Product.objects.select_related('category'), query)
+    if category:
+        results = results.filter(category_id=category)
+    if price_min is not None:
+        results = results.filter(price_per_unit__gte=price_min)
+    if price_max is not None:
+        results = results.filter(price_per_unit__lte=price_max)
+
+    categories = (by_category.order_by().values('category_id', 'category__name')
+                  .annotate(count=Count('pk')).order_by('-count', 'category__name'))
+    return {
+        'products': list(results[offset:offset + limit]),
+        'total': results.count(),
+        'categories': [
+            {'id': row['category_id'], 'name': row['category__name'], 'count': row['count']} for row in categories
+        ],
+        'prices': get_price_facets(by_price),
+    }
+
+
+def autocomplete(prefix, limit=10):
+    """Названия продуктов для подсказки по началу ввода."""
+    backend = get_backend(router.db_for_read(Product))
+    products = backend.ranked(Product.objects.all(), prefix, prefix=True)
+    return list(products.values_list('name', flat=True)[:limit])
@@ -1,23 +1,84 @@
 from django.conf import settings
 from django.core.cache import cache
 
-from catalog.models import Category
+from catalog.caching import get_or_compute, get_generations, aget_or_compute, aget_generations
+from catalog.aggregates import GENERATION as STATS_GENERATION
+from catalog.models import Category, CategoryStats, OwnerStats, Product, Version
 from users.models import User
 
 
 def get_cached_categories():
-    categories = cache.get('categories')
-    if not categories:
-        if settings.CACHE_ENABLED:
-            key = 'category_list'
-            categories = cache.get(key)
-            if not categories:
-                categories = list(Category.objects.all())
-                cache.set(key, categories, 60 * 60)
-        else:
-            categories = list(Category.objects.all())
-            cache.set('categories', categories, 60 * 60)
-    return categories
+    return get_or_compute('category_list', lambda: list(Category.objects.all()), depends_on=('category',))
+
+
+async def aget_cached_categories():
+    async def compute():
+        return [category async for category in Category.objects.all()]
+
+    return await aget_or_compute('category_list', compute, depends_on=('category',))
+
+
+def get_category_stats():
+    """Агрегаты непустых категорий в порядке имени."""
+    def compute():
+        return list(CategoryStats.objects.filter(product_count__gt=0).select_related('category').order_by('category__name'))
+
+    return get_or_compute('category_stats', compute, depends_on=(STATS_GENERATION, 'category'))
+
+
+async def aget_category_stats():
+    async def compute():
+        return [stats async for stats in CategoryStats.objects.filter(product_count__gt=0).select_related('category').order_by('category__name')]
+
+    return await aget_or_compute('category_stats', compute, depends_on=(STATS_GENERATION, 'category'))
+
+
+def get_owner_stats(owner):
+    """Итоги по продуктам владельца, None - продуктов нет."""
+    owner_pk = getattr(owner, 'pk', owner)
+    return get_or_compute(f'owner_stats:{owner_pk}', lambda: OwnerStats.objects.filter(pk=owner_pk, product_count__gt=0).first(),
+                          depends_on=(STATS_GENERATION,))
+
+
+async def aget_owner_stats(owner):
+    owner_pk = getattr(owner, 'pk', owner)
+
+    async def compute():
+        return await OwnerStats.objects.filter(pk=owner_pk, product_count__gt=0).afirst()
+
+    return await aget_or_compute(f'owner_stats:{owner_pk}', compute, depends_on=(STATS_GENERATION,))
+
+
+def get_active_versions(products):
+    """Активные версии для набора продуктов: {pk продукта: версия или None}, не больше одного запроса."""
+    missing = [product.active_version_id for product in products
+               if product.active_version_id and not Product.active_version.is_cached(product)]
+    versions = Version.objects.in_bulk(missing) if missing else {}
+    return {
+        product.pk: product.active_version if Product.active_version.is_cached(product)
+        else versions.get(product.active_version_id)
+        for product in products
+    }
+
+
+async def aget_active_versions(products):
+    missing = [product.active_version_id for product in products
+               if product.active_version_id and not Product.active_version.is_cached(product)]
+    versions = await Version.objects.ain_bulk(missing) if missing else {}
+    return {
+        product.pk: product.active_version if Product.active_version.is_cached(product)
+        else versions.get(product.active_version_id)
+        for product in products
+    }
+
+
+def get_product_fragment_version(product):
+    """Версия кешированного фрагмента карточки: меняется при изменении продукта, его версий и категорий."""
+    return ':'.join(get_generations([f'product:{product.pk}', 'category']))
+
+
+async def aget_product_fragment_version(product):
+    return ':'.join(await aget_generations([f'product:{product.pk}', 'category']))
 
 
 def get_cached_customers_for_dish(product_pk):
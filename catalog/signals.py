@@ -0,0 +1,111 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, post_init, pre_save
+from django.dispatch import receiver
+
+from catalog import aggregates, changes
+from catalog.caching import bump_generation
+from catalog.images import schedule_derivatives
+from catalog.models import CatalogChange, Category, Product, Version
+from catalog.search import get_backend
+
+
+def _bump_on_commit(*namespaces):
+    # До коммита параллельный запрос увидел бы новое поколение, но старые строки,
+    # и закешировал бы их под новым ключом
+    transaction.on_commit(lambda: [bump_generation(namespace) for namespace in namespaces])
+
+
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_categories(sender, **kwargs):
+    _bump_on_commit('category')
+
+
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_products(sender, instance, **kwargs):
+    _bump_on_commit('product', f'product:{instance.pk}')
+
+
+@receiver([post_save, post_delete], sender=Version)
+def invalidate_versions(sender, instance, **kwargs):
+    namespaces = ['version', f'version:{instance.pk}']
+    if instance.product_id:
+        namespaces.append(f'product:{instance.product_id}')
+    _bump_on_commit(*namespaces)
+
+
+def _image_name(instance):
+    """Имя файла картинки; None, если поле не загружено (only/defer) - обращение к нему вызвало бы запрос."""
+    if 'image' not in instance.__dict__:
+        return None
+    return instance.image.name if instance.image else ''
+
+
+@receiver(post_init, sender=Product)
+def remember_image(sender, instance, **kwargs):
+    instance._original_image = _image_name(instance)
+
+
+@receiver(pre_save, sender=Product)
+def reset_image_hash(sender, instance, **kwargs):
+    image = _image_name(instance)
+    if image is not None and image != instance._original_image:
+        instance.image_hash = ''
+
+
+@receiver(post_save, sender=Product)
+def make_image_derivatives(sender, instance, raw=False, **kwargs):
+    instance._original_image = image = _image_name(instance)
+    if image and not instance.image_hash and not raw:
+        schedule_derivatives(instance.pk)
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, raw=False, using=None, **kwargs):
+    if not raw:
+        get_backend(using).index_product(instance)
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, using=None, **kwargs):
+    get_backend(using).remove_product(instance.pk)
+
+
+@receiver(post_init, sender=Product)
+def remember_stats_state(sender, instance, **kwargs):
+    instance._stats_state = aggregates.get_state(instance)
+
+
+@receiver(post_save, sender=Product)
+def update_stats(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    state = aggregates.get_state(instance)
+    if created or instance._stats_state is not None:
+        aggregates.apply_change(None if created else instance._stats_state, state)
+    else:
+        # Продукт загружен не полностью, прежнее состояние неизвестно
+        aggregates.refresh([instance.category_id], [instance.owner_id])
+    instance._stats_state = state
+
+
+@receiver(post_delete, sender=Product)
+def remove_from_stats(sender, instance, **kwargs):
+    if instance._stats_state is not None:
+        aggregates.apply_change(instance._stats_state, None)
+    else:
+        aggregates.refresh([instance.__dict__.get('category_id')], [instance.__dict__.get('owner_id')])
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Version)
+def record_change(sender, instance, created, raw=False, using=None, **kwargs):
+    if not raw:
+        changes.record(instance, CatalogChange.ACTION_CREATE if created else CatalogChange.ACTION_UPDATE, using)
+
+
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Version)
+def record_delete(sender, instance, using=None, **kwargs):
+    changes.record(instance, CatalogChange.ACTION_DELETE, using)
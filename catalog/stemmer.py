@@ -0,0 +1,114 @@
+"""
+Стеммер Snowball для русского языка (snowballstem.org/algorithms/russian/stemmer.html).
+
+Нужен для поиска на SQLite: FTS5 умеет стемминг только английского (porter),
+поэтому русские слова приводятся к основе до индексации и в запросе.
+"""
+import re
+
+VOWELS = 'аеиоуыэюя'
+
+PERFECTIVE_GERUND_1 = ('вшись', 'вши', 'в')
+PERFECTIVE_GERUND_2 = ('ившись', 'ывшись', 'ивши', 'ывши', 'ив', 'ыв')
+ADJECTIVE = ('ими', 'ыми', 'его', 'ого', 'ему', 'ому', 'ее', 'ие', 'ые', 'ое', 'ей', 'ий', 'ый', 'ой', 'ем', 'им',
+             'ым', 'ом', 'их', 'ых', 'ую', 'юю', 'ая', 'яя', 'ою', 'ею')
+PARTICIPLE_1 = ('ем', 'нн', 'вш', 'ющ', 'щ')
+PARTICIPLE_2 = ('ивш', 'ывш', 'ующ')
+REFLEXIVE = ('ся', 'сь')
+VERB_1 = ('ете', 'йте', 'ешь', 'нно', 'ла', 'на', 'ли', 'ем', 'ло', 'но', 'ет', 'ют', 'ны', 'ть', 'й', 'л', 'н')
+VERB_2 = ('уйте', 'ейте', 'ила', 'ыла', 'ена', 'ите', 'или', 'ыли', 'ило', 'ыло', 'ено', 'ует', 'уют', 'ены', 'ить',
+          'ыть', 'ишь', 'ей', 'уй', 'ил', 'ыл', 'им', 'ым', 'ен', 'ят', 'ит', 'ыт', 'ую', 'ю')
+NOUN = ('иями', 'ями', 'ами', 'ией', 'иям', 'ием', 'иях', 'ев', 'ов', 'ие', 'ье', 'еи', 'ии', 'ей', 'ой', 'ий', 'ям',
+        'ем', 'ам', 'ом', 'ах', 'ях', 'ию', 'ью', 'ия', 'ья', 'а', 'е', 'и', 'й', 'о', 'у', 'ы', 'ь', 'ю', 'я')
+SUPERLATIVE = ('ейше', 'ейш')
+DERIVATIONAL = ('ость', 'ост')
+
+CYRILLIC_WORD = re.compile('^[а-я]+$')
+
+
+def _by_length(endings):
+    return tuple(sorted(endings, key=len, reverse=True))
+
+
+def _regions(word):
+    """Позиции начала RV и R2."""
+    rv = len(word)
+    for i, char in enumerate(word):
+        if char in VOWELS:
+            rv = i + 1
+            break
+
+    def next_region(start):
+        for i in range(start + 1, len(word)):
+            if word[i] not in VOWELS and word[i - 1] in VOWELS:
+                return i + 1
+        return len(word)
+
+    r1 = next_region(0)
+    return rv, next_region(r1)
+
+
+def _remove(word, start, endings, preceded_by=None):
+    """Удаляет самое длинное окончание из endings, если оно целиком в области start."""
+    for ending in endings:
+        if word.endswith(ending) and len(word) - len(ending) >= start:
+            stem = word[:-len(ending)]
+            if preceded_by is not None:
+                if not stem or stem[-1] not in preceded_by or len(stem) - 1 < start:
+                    continue
+            return stem, True
+    return word, False
+
+
+def _remove_group(word, start, group_1, group_2):
+    # Окончания первой группы удаляются, только если перед ними 'а' или 'я'
+    candidates = []
+    stem, found = _remove(word, start, group_1, preceded_by='ая')
+    if found:
+        candidates.append(stem)
+    stem, found = _remove(word, start, group_2)
+    if found:
+        candidates.append(stem)
+    if not candidates:
+        return word, False
+    return min(candidates, key=len), True
+
+
+PERFECTIVE_GERUND = (_by_length(PERFECTIVE_GERUND_1), _by_length(PERFECTIVE_GERUND_2))
+ADJECTIVE = _by_length(ADJECTIVE)
+PARTICIPLE = (_by_length(PARTICIPLE_1), _by_length(PARTICIPLE_2))
+VERB = (_by_length(VERB_1), _by_length(VERB_2))
+NOUN = _by_length(NOUN)
+
+
+def stem(word):
+    word = word.lower().replace('ё', 'е')
+    if not CYRILLIC_WORD.match(word):
+        return word
+    rv, r2 = _regions(word)
+
+    # Шаг 1
+    word, found = _remove_group(word, rv, *PERFECTIVE_GERUND)
+    if not found:
+        word, _ = _remove(word, rv, REFLEXIVE)
+        word, found = _remove(word, rv, ADJECTIVE)
+        if found:
+            word, _ = _remove_group(word, rv, *PARTICIPLE)
+        else:
+            word, found = _remove_group(word, rv, *VERB)
+            if not found:
+                word, _ = _remove(word, rv, NOUN)
+
+    # Шаг 2
+    word, _ = _remove(word, rv, ('и',))
+
+    # Шаг 3
+    word, _ = _remove(word, r2, DERIVATIONAL)
+
+    # Шаг 4
+    word, found = _remove(word, rv, SUPERLATIVE)
+    if word.endswith('нн') and len(word) - 1 >= rv:
+        word = word[:-1]
+    elif not found:
+        word, _ = _remove(word, rv, ('ь',))
+    return word
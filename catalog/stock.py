@@ -0,0 +1,213 @@
+"""
+Складской учет: остатки по складам и журнал движений.
+
+Каждая операция - один условный UPDATE строки StockLevel
+(... WHERE quantity - reserved >= n) и запись в StockMovement в одной
+транзакции. Условие проверяет сама БД, поэтому параллельные резервы одного
+товара не уводят остаток в минус: на Postgres конкурирующие UPDATE ждут
+блокировку строки и заново проверяют условие, на SQLite запись сериализуется
+блокировкой базы, а занятая база приводит к повтору операции.
+
+Текущий остаток читается из StockLevel одной строкой. Журнал периодически
+сворачивается в StockSnapshot (команда stock_snapshot): остаток по журналу
+считается от последнего снимка, а не с начала истории, и сверяется с StockLevel.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Max, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from catalog.models import StockLevel, StockMovement, StockSnapshot
+from skypro_diplom import utils
+
+
+class InsufficientStock(Exception):
+    pass
+
+
+def _pk(obj):
+    return getattr(obj, 'pk', obj)
+
+
+retry_locked = utils.retry_locked('STOCK_LOCK_TIMEOUT', 'STOCK_LOCK_BACKOFF')
+
+
+def _apply(product, warehouse, kind, quantity_delta, reserved_delta, condition, reference):
+    """Условный UPDATE остатка и запись в журнал; False, если условие не выполнилось."""
+    with transaction.atomic():
+        updated = StockLevel.objects.filter(condition, product_id=_pk(product), warehouse_id=_pk(warehouse)).update(
+            quantity=F('quantity') + quantity_delta,
+            reserved=F('reserved') + reserved_delta,
+            updated_at=timezone.now(),
+        )
+        if not updated:
+            return False
+        StockMovement.objects.create(product_id=_pk(product), warehouse_id=_pk(warehouse), kind=kind,
+                                     quantity_delta=quantity_delta, reserved_delta=reserved_delta,
+                                     reference=reference)
+    return True
+
+
+def _check_quantity(quantity):
+    if not isinstance(quantity, int) or quantity <= 0:
+        raise ValueError(f'Количество должно быть положительным целым: {quantity!r}')
+
+
+@retry_locked
+def receive(product, warehouse, quantity, reference=''):
+    """Поступление товара на склад."""
+    _check_quantity(quantity)
+    with transaction.atomic():
+        StockLevel.objects.get_or_create(product_id=_pk(product), warehouse_id=_pk(warehouse))
+        _apply(product, warehouse, StockMovement.KIND_RECEIPT, quantity, 0, Q(), reference)
+
+
+@retry_locked
+def reserve(product, warehouse, quantity, reference=''):
+    """Резервирует товар, при нехватке свободного остатка - InsufficientStock."""
+    _check_quantity(quantity)
+    condition = Q(quantity__gte=F('reserved') + quantity)
+    if not _apply(product, warehouse, StockMovement.KIND_RESERVE, 0, quantity, condition, reference):
+        raise InsufficientStock(f'Недостаточно товара {_pk(product)} на складе {_pk(warehouse)}')
+
+
+@retry_locked
+def release(product, warehouse, quantity, reference=''):
+    """Снимает резерв."""
+    _check_quantity(quantity)
+    condition = Q(reserved__gte=quantity)
+    if not _apply(product, warehouse, StockMovement.KIND_RELEASE, 0, -quantity, condition, reference):
+        raise InsufficientStock(f'Резерв товара {_pk(product)} на складе {_pk(warehouse)} меньше {quantity}')
+
+
+@retry_locked
+def ship(product, warehouse, quantity, reference=''):
+    """Отгружает зарезервированный товар: уменьшает и резерв, и остаток."""
+    _check_quantity(quantity)
+    condition = Q(reserved__gte=quantity)
+    if not _apply(product, warehouse, StockMovement.KIND_SHIP, -quantity, -quantity, condition, reference):
+        raise InsufficientStock(f'Резерв товара {_pk(product)} на складе {_pk(warehouse)} меньше {quantity}')
+
+
+@retry_locked
+def sell(product, warehouse, quantity, reference=''):
+    """Списывает свободный остаток без резерва."""
+    _check_quantity(quantity)
+    condition = Q(quantity__gte=F('reserved') + quantity)
+    if not _apply(product, warehouse, StockMovement.KIND_SALE, -quantity, 0, condition, reference):
+        raise InsufficientStock(f'Недостаточно товара {_pk(product)} на складе {_pk(warehouse)}')
+
+
+@retry_locked
+def adjust(product, warehouse, quantity, reference=''):
+    """Инвентаризация: устанавливает фактический остаток, не меньше текущего резерва."""
+    if not isinstance(quantity, int) or quantity < 0:
+        raise ValueError(f'Остаток должен быть неотрицательным целым: {quantity!r}')
+    with transaction.atomic():
+        level, _ = StockLevel.objects.select_for_update().get_or_create(product_id=_pk(product),
+                                                                       warehouse_id=_pk(warehouse))
+        if quantity < level.reserved:
+            raise InsufficientStock(f'Остаток {quantity} меньше резерва {level.reserved}')
+        if quantity != level.quantity:
+            _apply(product, warehouse, StockMovement.KIND_ADJUST, quantity - level.quantity, 0, Q(), reference)
+
+
+def get_level(product, warehouse):
+    return StockLevel.objects.filter(product_id=_pk(product), warehouse_id=_pk(warehouse)).first()
+
+
+def get_available(product):
+    """Свободный остаток продукта по всем складам."""
+    totals = StockLevel.objects.filter(product_id=_pk(product)).aggregate(
+        quantity=Coalesce(Sum('quantity'), 0), reserved=Coalesce(Sum('reserved'), 0))
+    return totals['quantity'] - totals['reserved']
+
+
+def _latest_snapshot_id():
+    return Subquery(
+        StockSnapshot.objects.filter(product_id=OuterRef('product_id'), warehouse_id=OuterRef('warehouse_id'))
+        .order_by('-last_movement_id').values('last_movement_id')[:1]
+    )
+
+
+def _movements_since_snapshots(until=None):
+    """{(продукт, склад): (изменение остатка, изменение резерва, последнее движение)} после последних снимков."""
+    movements = StockMovement.objects.annotate(since=Coalesce(_latest_snapshot_id(), Value(0)))
+    movements = movements.filter(id__gt=F('since'))
+    if until is not None:
+        movements = movements.filter(id__lte=until)
+    rows = movements.values('product_id', 'warehouse_id').annotate(
+        quantity=Sum('quantity_delta'), reserved=Sum('reserved_delta'), last=Max('id')).order_by()
+    return {(row['product_id'], row['warehouse_id']): (row['quantity'], row['reserved'], row['last']) for row in rows}
+
+
+def _latest_snapshots():
+    snapshots = StockSnapshot.objects.filter(last_movement_id=_latest_snapshot_id())
+    return {(s.product_id, s.warehouse_id): s for s in snapshots}
+
+
+def ledger_balance(product, warehouse):
+    """(остаток, резерв) по журналу: последний снимок плюс движения после него."""
+    key = (_pk(product), _pk(warehouse))
+    snapshot = StockSnapshot.objects.filter(product_id=key[0], warehouse_id=key[1]) \
+        .order_by('-last_movement_id').first()
+    movements = StockMovement.objects.filter(product_id=key[0], warehouse_id=key[1])
+    if snapshot is not None:
+        movements = movements.filter(id__gt=snapshot.last_movement_id)
+    totals = movements.aggregate(quantity=Coalesce(Sum('quantity_delta'), 0),
+                                 reserved=Coalesce(Sum('reserved_delta'), 0))
+    base = (snapshot.quantity, snapshot.reserved) if snapshot is not None else (0, 0)
+    return base[0] + totals['quantity'], base[1] + totals['reserved']
+
+
+def take_snapshots(lag=None):
+    """
+    Сворачивает журнал в снимки, возвращает число новых снимков.
+
+    Берутся только движения старше lag секунд: движение с меньшим id может
+    закоммититься позже движения с большим, и снимок не должен его пропустить.
+    """
+    if lag is None:
+        lag = settings.STOCK_SNAPSHOT_LAG
+    until = StockMovement.objects.filter(created_at__lte=timezone.now() - timedelta(seconds=lag)) \
+        .aggregate(last=Max('id'))['last']
+    if until is None:
+        return 0
+    with transaction.atomic():
+        changes = _movements_since_snapshots(until)
+        previous = _latest_snapshots()
+        snapshots = []
+        for (product_id, warehouse_id), (quantity, reserved, last) in changes.items():
+            snapshot = previous.get((product_id, warehouse_id))
+            base = (snapshot.quantity, snapshot.reserved) if snapshot is not None else (0, 0)
+            snapshots.append(StockSnapshot(product_id=product_id, warehouse_id=warehouse_id, quantity=base[0] + quantity,
+                                           reserved=base[1] + reserved, last_movement_id=last))
+        StockSnapshot.objects.bulk_create(snapshots, batch_size=1000)
+    return len(snapshots)
+
+
+def reconcile():
+    """
+    Сверяет StockLevel с журналом, возвращает расхождения
+    [(продукт, склад, (остаток, резерв) в StockLevel, (остаток, резерв) по журналу)].
+
+    Остатки блокируются на время сверки, чтобы параллельные операции не давали ложных расхождений.
+    """
+    with transaction.atomic():
+        levels = list(StockLevel.objects.select_for_update().order_by('pk'))
+        changes = _movements_since_snapshots()
+        snapshots = _latest_snapshots()
+    drift = []
+    for level in levels:
+        key = (level.product_id, level.warehouse_id)
+        snapshot = snapshots.get(key)
+        quantity, reserved, _ = changes.get(key, (0, 0, None))
+        if snapshot is not None:
+            quantity += snapshot.quantity
+            reserved += snapshot.reserved
+        if (level.quantity, level.reserved) != (quantity, reserved):
+            drift.append((level.product_id, level.warehouse_id, (level.quantity, level.reserved), (quantity, reserved)))
+    return drift
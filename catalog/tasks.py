@@ -0,0 +1,25 @@
+from catalog import aggregates
+from catalog.images import generate_derivatives
+from catalog.importers import ProductImporter
+from catalog.models import Product
+from tasks.queue import task
+from users.models import User
+
+
+@task(timeout=120, concurrency=2)
+def generate_image_derivatives(product_pk):
+    product = Product.objects.filter(pk=product_pk).exclude(image='').exclude(image=None).first()
+    if product is not None:
+        generate_derivatives(product)
+
+
+@task(timeout=30 * 60, concurrency=1)
+def rebuild_catalog_stats():
+    aggregates.rebuild()
+
+
+@task(timeout=6 * 60 * 60, concurrency=1, max_attempts=3)
+def import_products(path, owner_pk, fmt=None, batch_size=1000):
+    """Загрузка продуктов из файла; повторная попытка продолжает с контрольной точки."""
+    importer = ProductImporter(User.objects.get(pk=owner_pk), batch_size=batch_size)
+    importer.run(path, fmt=fmt, resume=True)
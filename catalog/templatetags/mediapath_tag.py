@@ -0,0 +1,23 @@
+from django import template
+from django.conf import settings
+
+from catalog.images import get_picture
+
+register = template.Library()
+
+
+@register.filter()
+def mediapath(value):
+    if value:
+        return f'{settings.MEDIA_URL}{value}'
+    return '#'
+
+
+@register.inclusion_tag('catalog/includes/product_picture.html')
+def product_picture(product, preset, css_class=''):
+    """<picture> с srcset уменьшенных копий, пока их нет - исходная картинка."""
+    return {
+        'product': product,
+        'picture': get_picture(product, preset),
+        'css_class': css_class,
+    }
@@ -1,15 +1,45 @@
+import csv
+import gzip
+import io
+import json
 import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
 
-from catalog.models import Product
+from asgiref.sync import async_to_sync, sync_to_async
+from PIL import Image
 
-os.environ['DJANGO_SETTINGS_MODULE'] = 'config.settings'
+from catalog.models import Product, Category, Version, Warehouse, StockLevel, StockMovement, StockSnapshot, \
+    CategoryStats, OwnerStats, CatalogChange
 
-import django
-django.setup()
-
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction, IntegrityError
+from django.db.models import Max
+from django.http import Http404
+from django.test import AsyncRequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser, Permission
+
+from catalog import aggregates, caching, cards, changes, stock
+from catalog.cards import get_product_cards, url_format
+from catalog.forms import ProductCreateForm, ProductForm
+from catalog.images import derivative_name
+from catalog.importers import iter_json_array, ImportRowError
+from catalog.moderation import find_banned_word
+from catalog.search import search_products, autocomplete
+from catalog.tasks import generate_image_derivatives
+from catalog.services import get_cached_categories, get_active_versions, aget_cached_categories, \
+    get_category_stats, get_owner_stats
+from catalog.views import ProductListView, ProductStreamView, ProductListAsyncView, ProductDetailAsyncView, \
+    VersionDetailAsyncView
+from tasks.models import Task
 
 User = get_user_model()
 
@@ -36,4 +66,1188 @@ class ProductTests(TestCase):
         self.assertEqual(response.status_code, 302)
 
         # Проверяем адрес перенаправления
-        self.assertRedirects(response, reverse('users:login') + '?next=' + reverse('products:home'))
\ No newline at end of file
+        self.assertRedirects(response, reverse('users:login') + '?next=' + reverse('products:home'))
+
+class ProductListQueryCountTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='owner@example.com', password='password')
+        self.category = Category.objects.create(name='Category', description='Category')
+
+    def create_products(self, count):
+        Product.objects.all().delete()
+        products = Product.objects.bulk_create(
+            Product(name=f'Product {i}', description='Description', category=self.category,
+                    price_per_unit=i, owner=self.user)
+            for i in range(count)
+        )
+        versions = Version.objects.bulk_create(
+            Version(version_name='Version', version_number='1.0.0', current_version=True, product=product)
+            for product in products
+        )
+        for product, version in zip(products, versions):
+            product.active_version = version
+        Product.objects.bulk_update(products, ['active_version'])
+
+    def count_home_queries(self, count):
+        self.create_products(count)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('catalog:home'))
+        self.assertEqual(response.status_code, 200)
+        active_versions = response.context['active_versions']
+        self.assertEqual(len(active_versions), min(count, ProductListView.paginate_by))
+        self.assertNotIn(None, active_versions.values())
+        return len(context.captured_queries)
+
+    def test_home_query_count_is_constant(self):
+        self.count_home_queries(1)
+        query_counts = [self.count_home_queries(count) for count in (10, 100, 1000)]
+        self.assertEqual(len(set(query_counts)), 1, query_counts)
+
+
+class ProductKeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='owner@example.com', password='password')
+        self.category = Category.objects.create(name='Category', description='Category')
+        # Повторяющиеся названия проверяют разрешение равенства по pk
+        Product.objects.bulk_create(
+            Product(name=f'Product {i // 3}', description='Description', category=self.category,
+                    price_per_unit=i, owner=self.user, is_published=bool(i % 2))
+            for i in range(60)
+        )
+
+    def test_pages_cover_catalog_without_duplicates(self):
+        seen = []
+        url = reverse('catalog:home')
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(product.pk for product in response.context['products'])
+            next_cursor = response.context['next_cursor']
+            url = f"{reverse('catalog:home')}?cursor={next_cursor}" if next_cursor else None
+        expected = list(Product.objects.order_by('name', 'pk').values_list('pk', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('catalog:home'), {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 404)
+
+    @mock.patch.object(ProductStreamView, 'batch_size', 7)
+    def test_stream_returns_ndjson(self):
+        response = self.client.get(reverse('catalog:api_products'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row['pk'] for row in rows], list(
+            Product.objects.filter(is_published=True).order_by('name', 'pk').values_list('pk', flat=True)))
+        self.assertNotIn('owner_id', rows[0])
+
+    def test_stream_invalid_cursor(self):
+        response = self.client.get(reverse('catalog:api_products'), {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 400)
+
+
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        caching.reset_stats()
+        self.category = Category.objects.create(name='Category', description='Category')
+
+    def test_categories_invalidated_on_save_and_delete(self):
+        self.assertEqual(get_cached_categories(), [self.category])
+        with self.assertNumQueries(0):
+            get_cached_categories()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            other = Category.objects.create(name='Other', description='Other')
+        self.assertEqual(get_cached_categories(), [self.category, other])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            other.delete()
+        self.assertEqual(get_cached_categories(), [self.category])
+        self.assertEqual(caching.get_stats()['category_list'],
+                         {'hit': 1, 'miss': 3, 'stale': 0, 'recompute': 3})
+
+    def test_generation_bumped_after_commit(self):
+        self.assertEqual(get_cached_categories(), [self.category])
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name='Other', description='Other')
+            # Изменение еще не закоммичено: другие процессы читают прежнее поколение
+            with self.assertNumQueries(0):
+                self.assertEqual(get_cached_categories(), [self.category])
+        self.assertEqual(len(get_cached_categories()), 2)
+
+    def test_unrelated_namespace_does_not_invalidate(self):
+        compute = mock.Mock(return_value='value')
+        caching.get_or_compute('name', compute, depends_on=('category',))
+        caching.bump_generation('version')
+        caching.get_or_compute('name', compute, depends_on=('category',))
+        self.assertEqual(compute.call_count, 1)
+
+    def test_bump_after_generation_evicted(self):
+        before = caching.get_generations(['category'])
+        cache.delete('catalog:generation:category')
+        caching.bump_generation('category')
+        self.assertNotEqual(caching.get_generations(['category']), before)
+
+    def test_stale_value_served_while_locked(self):
+        compute = mock.Mock(return_value='old')
+        caching.get_or_compute('name', compute)
+        cache.add('catalog:name:lock', 1)
+        compute.return_value = 'new'
+        with mock.patch.object(caching, '_should_refresh_early', return_value=True):
+            self.assertEqual(caching.get_or_compute('name', compute), 'old')
+        self.assertEqual(compute.call_count, 1)
+        self.assertEqual(caching.get_stats()['name']['stale'], 1)
+
+    def test_early_refresh_recomputes(self):
+        compute = mock.Mock(return_value='value')
+        caching.get_or_compute('name', compute)
+        with mock.patch.object(caching, '_should_refresh_early', return_value=True):
+            caching.get_or_compute('name', compute)
+        self.assertEqual(compute.call_count, 2)
+
+    def test_disabled_cache(self):
+        compute = mock.Mock(return_value='value')
+        with self.settings(CACHE_ENABLED=False):
+            caching.get_or_compute('name', compute)
+            caching.get_or_compute('name', compute)
+        self.assertEqual(compute.call_count, 2)
+
+
+class ProductDetailFragmentCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user(email='owner@example.com', password='password')
+        self.other = User.objects.create_user(email='other@example.com', password='password')
+        self.category = Category.objects.create(name='Category', description='Category')
+        self.product = Product.objects.create(name='Product', description='Description', category=self.category,
+                                              price_per_unit=10, owner=self.owner)
+        self.url = reverse('catalog:product_detail', kwargs={'pk': self.product.pk})
+
+    def get_queries(self, user):
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return response, len(context.captured_queries)
+
+    def test_body_served_from_cache(self):
+        _, cold_queries = self.get_queries(self.owner)
+        _, warm_queries = self.get_queries(self.owner)
+        self.assertLess(warm_queries, cold_queries)
+
+    def test_save_invalidates_fragment(self):
+        self.get_queries(self.owner)
+        self.product.description = 'New description'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+        response, _ = self.get_queries(self.owner)
+        self.assertContains(response, 'New description')
+
+    def test_new_active_version_invalidates_fragment(self):
+        self.get_queries(self.owner)
+        with self.captureOnCommitCallbacks(execute=True):
+            Version.objects.create(version_name='Version', version_number='2.0.0', current_version=True,
+                                   product=self.product)
+        response, _ = self.get_queries(self.owner)
+        self.assertContains(response, '2.0.0')
+
+    def test_owner_controls_are_not_shared(self):
+        delete_url = reverse('catalog:product-delete', kwargs={'pk': self.product.pk})
+        response, _ = self.get_queries(self.owner)
+        self.assertContains(response, delete_url)
+        response, _ = self.get_queries(self.other)
+        self.assertNotContains(response, delete_url)
+
+
+class CatalogImportTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_superuser(email='admin@example.com', password='password')
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def write(self, name, content):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return path
+
+    def test_iter_json_array_small_chunks(self):
+        items = [{'name': f'Товар {i}', 'nested': {'list': [1, 2, ']']}} for i in range(50)]
+        f = io.StringIO(json.dumps(items, ensure_ascii=False, indent=2))
+        self.assertEqual(list(iter_json_array(f, chunk_size=7)), items)
+
+    def test_iter_json_array_truncated(self):
+        with self.assertRaises(ImportRowError):
+            list(iter_json_array(io.StringIO('[{"name": "a"}, {"na'), chunk_size=4))
+
+    def test_fixtures_import_is_idempotent(self):
+        out = io.StringIO()
+        call_command('fill_categ', stdout=out)
+        call_command('fill_prod', '--batch-size', '2', stdout=out)
+        with open('catalog/fixtures/product.json', encoding='utf-8') as f:
+            fixture = json.load(f)
+        self.assertEqual(Product.objects.count(), len(fixture))
+        self.assertIn('строк/с', out.getvalue())
+
+        call_command('fill_categ', stdout=out)
+        call_command('fill_prod', stdout=out)
+        self.assertEqual(Product.objects.count(), len(fixture))
+        self.assertEqual(Category.objects.count(), Category.objects.values('name').distinct().count())
+
+    def test_csv_upsert_by_category_name(self):
+        category = Category.objects.create(name='Бытовая химия', description='')
+        existing = Product.objects.create(name='Ферри', description='old', category=category,
+                                          price_per_unit=1, owner=self.owner, image='products/ferri.jpg')
+        path = self.write('products.csv', 'name,description,category,price_per_unit,is_published\n'
+                                          'Ферри,new,Бытовая химия,150,true\n'
+                                          'Губка,new,Бытовая химия,20,false\n'
+                                          'Лишний,new,Нет такой,20,false\n')
+        call_command('fill_prod', path, stdout=io.StringIO())
+        existing.refresh_from_db()
+        self.assertEqual((existing.description, existing.price_per_unit, existing.is_published), ('new', 150, True))
+        # В файле нет колонки image - картинка остается прежней
+        self.assertEqual(existing.image.name, 'products/ferri.jpg')
+        change = CatalogChange.objects.filter(model='product', object_id=existing.pk).latest('id')
+        self.assertEqual(change.data['image'], 'products/ferri.jpg')
+        self.assertEqual(Product.objects.count(), 2)
+
+    def test_resume_from_checkpoint(self):
+        category = Category.objects.create(name='Категория', description='')
+        rows = [{'name': f'Товар {i}', 'category': category.pk, 'price_per_unit': i} for i in range(5)]
+        path = self.write('products.ndjson', '\n'.join(json.dumps(row) for row in rows))
+        with open(f'{path}.checkpoint', 'w') as f:
+            f.write('3')
+        call_command('fill_prod', path, '--resume', stdout=io.StringIO())
+        self.assertEqual(sorted(Product.objects.values_list('name', flat=True)), ['Товар 3', 'Товар 4'])
+        self.assertFalse(os.path.exists(f'{path}.checkpoint'))
+
+
+class ModerationTests(TestCase):
+    def test_finds_words_from_each_list(self):
+        self.assertEqual(find_banned_word('Лучшее CASINO в городе'), 'casino')
+        self.assertEqual(find_banned_word('Очень Дешево'), 'дешево')
+        self.assertEqual(find_banned_word('Cryptocurrency wallet', 'en'), 'cryptocurrency')
+        self.assertIsNone(find_banned_word('Cryptocurrency wallet', 'ru'))
+        self.assertEqual(find_banned_word('Очень Дешево', 'ru'), 'дешево')
+        self.assertIsNone(find_banned_word('Очень Дешево', 'en'))
+        self.assertIsNone(find_banned_word('Обычный товар'))
+
+    def test_each_form_checks_its_own_list(self):
+        category = Category.objects.create(name='Category', description='Category')
+        form = ProductCreateForm(data={'name': 'Free stuff', 'description': 'Crypto', 'category': category.pk,
+                                       'price_per_unit': 1})
+        self.assertFalse(form.is_valid())
+        self.assertIn('name', form.errors)
+        self.assertIn('description', form.errors)
+        form = ProductCreateForm(data={'name': 'Радар', 'description': 'Крипта', 'category': category.pk,
+                                       'price_per_unit': 1})
+        self.assertTrue(form.is_valid(), form.errors)
+
+        form = ProductForm(data={'name': 'Радар', 'price_per_unit': 1})
+        self.assertFalse(form.is_valid())
+        self.assertIn('name', form.errors)
+        form = ProductForm(data={'name': 'Radar', 'price_per_unit': 1})
+        self.assertTrue(form.is_valid(), form.errors)
+
+    def test_reload_on_settings_change(self):
+        with self.settings(BANNED_WORDS={'en': ['spam']}):
+            self.assertEqual(find_banned_word('Some SPAM'), 'spam')
+            self.assertIsNone(find_banned_word('casino'))
+        self.assertEqual(find_banned_word('casino'), 'casino')
+
+    def test_reload_on_file_change(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'words.txt')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write('spam\n')
+            with self.settings(BANNED_WORDS={'en': [], 'ru': []}, BANNED_WORDS_FILE=path):
+                self.assertEqual(find_banned_word('spam', 'ru'), 'spam')
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.write('eggs\n')
+                os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1))
+                self.assertIsNone(find_banned_word('spam'))
+                self.assertEqual(find_banned_word('green eggs'), 'eggs')
+
+
+class ProductImageTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        settings_override = self.settings(MEDIA_ROOT=self.media.name, MEDIA_URL='/media/',
+                                          TASKS_EAGER=True)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = User.objects.create_user(email='owner@example.com', password='password')
+        self.category = Category.objects.create(name='Category', description='Category')
+
+    def make_upload(self, color='red'):
+        buffer = io.BytesIO()
+        Image.new('RGB', (1600, 900), color).save(buffer, 'JPEG')
+        return SimpleUploadedFile('photo.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+    def create_product(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Product.objects.create(name='Product', description='Description', category=self.category,
+                                          price_per_unit=10, owner=self.user, image=self.make_upload())
+
+    def test_derivatives_created_after_upload(self):
+        product = self.create_product()
+        product.refresh_from_db()
+        self.assertEqual(len(product.image_hash), 16)
+        for width in (320, 640, 600, 1200):
+            for ext in ('webp', 'jpg'):
+                self.assertTrue(default_storage.exists(derivative_name(product.image_hash, width, ext)))
+        with default_storage.open(derivative_name(product.image_hash, 320, 'jpg')) as f:
+            self.assertEqual(Image.open(f).size, (320, 180))
+
+        response = self.client.get(reverse('catalog:home'))
+        self.assertContains(response, f'/media/products/thumbs/{product.image_hash}/640.webp 640w')
+
+    def test_new_image_resets_hash(self):
+        product = self.create_product()
+        product.refresh_from_db()
+        old_hash = product.image_hash
+        product.image = self.make_upload('blue')
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        product.refresh_from_db()
+        self.assertNotIn(product.image_hash, ('', old_hash))
+
+    @override_settings(TASKS_EAGER=False)
+    def test_derivatives_scheduled_once(self):
+        product = Product.objects.create(name='Product', description='Description', category=self.category,
+                                         price_per_unit=10, owner=self.user, image=self.make_upload())
+        product.price_per_unit = 20
+        product.save()
+        self.assertEqual(Task.objects.filter(name=generate_image_derivatives.task_name, args=[product.pk]).count(), 1)
+
+    def test_deferred_image_not_loaded(self):
+        self.create_product()
+        with self.assertNumQueries(1):
+            products = list(Product.objects.only('pk', 'name'))
+        self.assertEqual(len(products), 1)
+        with self.assertNumQueries(0):
+            self.assertIsNone(products[0]._original_image)
+
+    def test_backfill_command(self):
+        product = self.create_product()
+        Product.objects.filter(pk=product.pk).update(image_hash='')
+        out = io.StringIO()
+        call_command('make_thumbnails', stdout=out)
+        product.refresh_from_db()
+        self.assertTrue(product.image_hash)
+        self.assertIn('Готово: 1', out.getvalue())
+
+
+class ActiveVersionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='owner@example.com', password='password')
+        self.category = Category.objects.create(name='Category', description='Category')
+        self.product = Product.objects.create(name='Product', description='Description', category=self.category,
+                                              price_per_unit=10, owner=self.user)
+
+    def create_version(self, number, current=True):
+        return Version.objects.create(version_name=number, version_number=number, current_version=current,
+                                      product=self.product)
+
+    def test_new_current_version_replaces_previous(self):
+        first = self.create_version('1.0.0')
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.active_version, first)
+
+        second = self.create_version('2.0.0')
+        first.refresh_from_db()
+        self.product.refresh_from_db()
+        self.assertFalse(first.current_version)
+        self.assertEqual(self.product.active_version, second)
+
+    def test_unset_and_delete_clear_pointer(self):
+        version = self.create_version('1.0.0')
+        version.current_version = False
+        version.save()
+        self.product.refresh_from_db()
+        self.assertIsNone(self.product.active_version)
+
+        version = self.create_version('2.0.0')
+        version.delete()
+        self.product.refresh_from_db()
+        self.assertIsNone(self.product.active_version_id)
+
+    def test_constraint_allows_one_current_version(self):
+        self.create_version('1.0.0')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Version.objects.bulk_create([Version(version_name='x', current_version=True, product=self.product)])
+
+    def test_active_versions_without_queries(self):
+        version = self.create_version('1.0.0')
+        products = list(Product.objects.select_related('active_version'))
+        with self.assertNumQueries(0):
+            self.assertEqual(get_active_versions(products), {self.product.pk: version})
+        products = list(Product.objects.all())
+        with self.assertNumQueries(1):
+            self.assertEqual(get_active_versions(products), {self.product.pk: version})
+
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='owner@example.com', password='password')
+        self.phones = Category.objects.create(name='Телефоны', description='')
+        self.home = Category.objects.create(name='Для дома', description='')
+        self.create('Смартфон Galaxy', 'Мощный телефон с хорошей камерой', self.phones, 900)
+        self.create('Кнопочный телефон', 'Простой телефон для звонков', self.phones, 90)
+        self.create('Чехол', 'Чехол для смартфонов и телефонов', self.phones, 50)
+        self.create('Стиральная машина', 'Washing machine with quick programs', self.home, 30000)
+
+    def create(self, name, description, category, price):
+        return Product.objects.create(name=name, description=description, category=category,
+                                      price_per_unit=price, owner=self.user)
+
+    def names(self, result):
+        return [product.name for product in result['products']]
+
+    def test_russian_stemming_and_name_ranking(self):
+        result = search_products('телефоны')
+        self.assertEqual(result['total'], 3)
+        self.assertEqual(self.names(result)[0], 'Кнопочный телефон')
+        self.assertEqual(self.names(search_products('смартфоны')), ['Смартфон Galaxy', 'Чехол'])
+
+    def test_english_stemming(self):
+        self.assertEqual(self.names(search_products('washed programming')), ['Стиральная машина'])
+        self.assertEqual(self.names(search_products('washed cars')), [])
+
+    def test_facets_and_filters(self):
+        result = search_products('телефон', price_max=100)
+        self.assertEqual(sorted(self.names(result)), ['Кнопочный телефон', 'Чехол'])
+        self.assertEqual(result['categories'], [{'id': self.phones.pk, 'name': 'Телефоны', 'count': 2}])
+        self.assertEqual(result['prices'], [{'min': 0, 'max': 100, 'count': 2},
+                                            {'min': 500, 'max': 1000, 'count': 1}])
+
+    def test_index_follows_updates_and_deletes(self):
+        product = Product.objects.get(name='Чехол')
+        product.description = 'Аксессуар'
+        product.save()
+        self.assertNotIn('Чехол', self.names(search_products('смартфон')))
+        Product.objects.get(name='Стиральная машина').delete()
+        self.assertEqual(search_products('машина')['total'], 0)
+
+    def test_autocomplete(self):
+        self.assertEqual(autocomplete('смарт'), ['Смартфон Galaxy', 'Чехол'])
+        response = self.client.get(reverse('catalog:autocomplete'), {'q': 'стир'})
+        self.assertEqual(response.json(), {'results': ['Стиральная машина']})
+
+    def test_search_page(self):
+        response = self.client.get(reverse('catalog:search'), {'q': 'телефон', 'category': self.phones.pk})
+        self.assertContains(response, 'Найдено: 3')
+        self.assertContains(response, 'Кнопочный телефон')
+
+    def test_admin_search_uses_index(self):
+        self.client.force_login(User.objects.create_superuser(email='admin@example.com', password='password'))
+        response = self.client.get(reverse('admin:catalog_product_changelist'), {'q': 'смартфоны'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(product.name for product in response.context['cl'].result_list),
+                         ['Смартфон Galaxy', 'Чехол'])
+
+
+class ProductBatchApiTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='owner@example.com', password='password')
+        self.other = User.objects.create_user(email='other@example.com', password='password')
+        self.category = Category.objects.create(name='Еда', description='')
+        self.products = [
+            Product.objects.create(name=f'Продукт {i}', description='описание', category=self.category,
+                                   price_per_unit=100, owner=self.user)
+            for i in range(3)
+        ]
+        self.foreign = Product.objects.create(name='Чужой', description='описание', category=self.category,
+                                              price_per_unit=100, owner=self.other)
+        self.client.force_login(self.user)
+
+    def post(self, operations, **payload):
+        return self.client.post(reverse('catalog:api_products_batch'),
+                                json.dumps({'operations': operations, **payload}), content_type='application/json')
+
+    def test_applies_all_operations(self):
+        first, second, third = self.products
+        operations = [{'op': 'create', 'data': {'name': f'Новый {i}', 'description': 'новый',
+                                                'category': self.category.pk, 'price_per_unit': 10}}
+                      for i in range(50)]
+        operations += [
+            {'op': 'update', 'id': first.pk, 'data': {'price_per_unit': 250}},
+            {'op': 'publish', 'id': first.pk},
+            {'op': 'publish', 'id': second.pk, 'published': True},
+            {'op': 'delete', 'id': third.pk},
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post(operations)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(all(result['status'] == 'ok' for result in response.json()['results']))
+        # Число запросов не зависит от числа созданных продуктов
+        self.assertLess(len(queries), 20)
+
+        first.refresh_from_db()
+        self.assertEqual((first.price_per_unit, first.is_published, first.name), (250, True, 'Продукт 0'))
+        self.assertTrue(Product.objects.get(pk=second.pk).is_published)
+        self.assertFalse(Product.objects.filter(pk=third.pk).exists())
+        self.assertEqual(Product.objects.filter(owner=self.user, name__startswith='Новый').count(), 50)
+        self.assertEqual(response.json()['results'][0]['id'],
+                         Product.objects.get(name='Новый 0').pk)
+        self.assertEqual(search_products('новый')['total'], 50)
+
+    def test_atomic_batch_rejected_on_any_error(self):
+        response = self.post([
+            {'op': 'update', 'id': self.products[0].pk, 'data': {'price_per_unit': 1}},
+            {'op': 'update', 'id': self.foreign.pk, 'data': {'price_per_unit': 1}},
+            {'op': 'create', 'data': {'name': 'casino', 'description': 'x', 'category': self.category.pk,
+                                      'price_per_unit': 1}},
+            {'op': 'delete', 'id': 999999},
+        ])
+        self.assertEqual(response.status_code, 400)
+        results = response.json()['results']
+        self.assertEqual([result['status'] for result in results], ['ok', 'error', 'error', 'error'])
+        self.assertIn('name', results[2]['errors'])
+        self.assertEqual(Product.objects.get(pk=self.products[0].pk).price_per_unit, 100)
+
+    def test_non_atomic_batch_applies_valid_operations(self):
+        response = self.post([
+            {'op': 'update', 'id': self.products[0].pk, 'data': {'price_per_unit': 1}},
+            {'op': 'delete', 'id': self.foreign.pk},
+            {'op': 'update', 'id': self.products[1].pk, 'data': {'category': 999999}},
+        ], atomic=False)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['status'] for result in response.json()['results']], ['ok', 'error', 'error'])
+        self.assertEqual(Product.objects.get(pk=self.products[0].pk).price_per_unit, 1)
+        self.assertTrue(Product.objects.filter(pk=self.foreign.pk).exists())
+
+    def test_permission_allows_foreign_products(self):
+        self.user.user_permissions.add(Permission.objects.get(codename='can_change_product'))
+        response = self.post([{'op': 'publish', 'id': self.foreign.pk}])
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(Product.objects.get(pk=self.foreign.pk).is_published)
+
+    def test_bad_payload(self):
+        response = self.client.post(reverse('catalog:api_products_batch'), 'not json',
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        with self.settings(PRODUCT_BATCH_MAX_OPERATIONS=1):
+            self.assertEqual(self.post([{'op': 'delete', 'id': 1}] * 2).status_code, 400)
+
+
+class ProductPermissionViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user(email='owner@example.com', password='password')
+        self.other = User.objects.create_user(email='other@example.com', password='password')
+        category = Category.objects.create(name='Еда', description='')
+        self.product = Product.objects.create(name='Хлеб', description='хлеб', category=category,
+                                              price_per_unit=10, owner=self.owner)
+
+    def test_foreign_product_is_not_found(self):
+        self.client.force_login(self.other)
+        self.assertEqual(self.client.get(reverse('catalog:product-edit', args=[self.product.pk])).status_code, 404)
+        response = self.client.post(reverse('catalog:product-delete', args=[self.product.pk]))
+        self.assertEqual(response.status_code, 404)
+        self.assertTrue(Product.objects.filter(pk=self.product.pk).exists())
+
+    def test_owner_and_permitted_user_can_modify(self):
+        self.client.force_login(self.owner)
+        self.assertEqual(self.client.get(reverse('catalog:product-edit', args=[self.product.pk])).status_code, 200)
+
+        self.other.user_permissions.add(Permission.objects.get(codename='can_delete_product'))
+        self.client.force_login(self.other)
+        response = self.client.get(reverse('catalog:product_detail', args=[self.product.pk]))
+        self.assertEqual((response.context['can_change'], response.context['can_delete']), (False, True))
+        response = self.client.post(reverse('catalog:product-delete', args=[self.product.pk]))
+        self.assertRedirects(response, reverse('catalog:home'))
+        self.assertFalse(Product.objects.filter(pk=self.product.pk).exists())
+
+    def test_permissions_loaded_once_per_request(self):
+        self.client.force_login(self.other)
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(reverse('catalog:product_detail', args=[self.product.pk]))
+        permission_queries = [q for q in context.captured_queries if 'auth_permission' in q['sql']]
+        self.assertEqual(len(permission_queries), 1)
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(reverse('catalog:product_detail', args=[self.product.pk]))
+        self.assertFalse([q for q in context.captured_queries if 'auth_permission' in q['sql']])
+
+
+class ProductCardCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user(email='owner@example.com', password='password')
+        self.other = User.objects.create_user(email='other@example.com', password='password')
+        self.category = Category.objects.create(name='Category', description='Category')
+        self.product = Product.objects.create(name='Product', description='Description', category=self.category,
+                                              price_per_unit=10, owner=self.owner)
+
+    def products(self):
+        return list(Product.objects.select_related('category'))
+
+    def test_url_format(self):
+        self.assertEqual(url_format('catalog:product_detail').format(pk=self.product.pk),
+                         reverse('catalog:product_detail', kwargs={'pk': self.product.pk}))
+
+    def test_cards_rendered_once(self):
+        with mock.patch('catalog.cards._render', wraps=cards._render) as render:
+            first = get_product_cards(self.products(), AnonymousUser())
+            second = get_product_cards(self.products(), AnonymousUser())
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual(first[0]['html'], second[0]['html'])
+        self.assertIn(reverse('catalog:product_detail', kwargs={'pk': self.product.pk}), second[0]['html'])
+
+    def test_save_invalidates_card(self):
+        get_product_cards(self.products(), AnonymousUser())
+        self.product.description = 'New description'
+        self.product.save()
+        card, = get_product_cards(self.products(), AnonymousUser())
+        self.assertIn('New description', card['html'])
+
+    def test_category_rename_invalidates_card(self):
+        get_product_cards(self.products(), AnonymousUser())
+        self.category.name = 'Renamed'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.save()
+        card, = get_product_cards(self.products(), AnonymousUser())
+        self.assertIn('Renamed', card['html'])
+
+    def test_edit_link_is_not_shared(self):
+        edit_url = reverse('catalog:product-edit', args=[self.product.pk])
+        self.client.force_login(self.owner)
+        self.assertContains(self.client.get(reverse('catalog:home')), edit_url)
+        self.client.force_login(self.other)
+        self.assertNotContains(self.client.get(reverse('catalog:home')), edit_url)
+
+
+class AsyncCatalogViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='owner@example.com', password='password')
+        self.category = Category.objects.create(name='Category', description='Category')
+        self.products = [
+            Product.objects.create(name=f'Product {i:02}', description='Description', category=self.category,
+                                   price_per_unit=10, owner=self.user)
+            for i in range(30)
+        ]
+        self.version = Version.objects.create(version_name='Version', version_number='2.0.0', current_version=True,
+                                              product=self.products[0])
+        self.factory = AsyncRequestFactory()
+
+    def request(self, path, user=None):
+        request = self.factory.get(path)
+
+        async def auser():
+            return user or AnonymousUser()
+
+        request.auser = auser
+        request.user = user or AnonymousUser()
+        return request
+
+    async def test_list_matches_sync_view(self):
+        response = await ProductListAsyncView.as_view()(self.request('/'))
+        response.render()
+        sync_response = await sync_to_async(self.client.get)(reverse('catalog:home'))
+        self.assertEqual(response.context_data['next_cursor'], sync_response.context['next_cursor'])
+        self.assertEqual([product.pk for product in response.context_data['products']],
+                         [product.pk for product in sync_response.context['products']])
+        self.assertContains(response, 'Product 00')
+        self.assertEqual(response.context_data['active_versions'][self.products[0].pk], self.version)
+
+    async def test_list_bad_cursor(self):
+        with self.assertRaises(Http404):
+            await ProductListAsyncView.as_view()(self.request('/?cursor=bad'))
+
+    async def test_detail_requires_login(self):
+        product = self.products[0]
+        response = await ProductDetailAsyncView.as_view()(self.request('/'), pk=product.pk)
+        self.assertEqual(response.status_code, 302)
+
+        response = await ProductDetailAsyncView.as_view()(self.request('/', self.user), pk=product.pk)
+        response.render()
+        self.assertContains(response, '2.0.0')
+        self.assertTrue(response.context_data['is_owner'])
+        with self.assertRaises(Http404):
+            await ProductDetailAsyncView.as_view()(self.request('/', self.user), pk=0)
+
+    async def test_version_detail(self):
+        response = await VersionDetailAsyncView.as_view()(self.request('/', self.user), version_id=self.version.pk)
+        response.render()
+        self.assertContains(response, 'Версия "Version"')
+
+    def test_async_cache_shares_entries_with_sync(self):
+        self.assertEqual(async_to_sync(aget_cached_categories)(), [self.category])
+        with self.assertNumQueries(0):
+            self.assertEqual(get_cached_categories(), [self.category])
+
+
+class CatalogStatsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='owner@example.com', password='password')
+        self.other = User.objects.create_user(email='other@example.com', password='password')
+        self.food = Category.objects.create(name='Еда', description='')
+        self.drinks = Category.objects.create(name='Напитки', description='')
+
+    def create(self, price, category=None, owner=None, is_published=False):
+        return Product.objects.create(name=f'Продукт {price}', description='описание',
+                                      category=category or self.food, price_per_unit=price,
+                                      owner=owner or self.user, is_published=is_published)
+
+    def stats(self, category):
+        return CategoryStats.objects.filter(pk=category.pk).values_list(
+            'product_count', 'published_count', 'price_min', 'price_max', 'price_sum').first()
+
+    def snapshot_stats(self):
+        return [list(model.objects.filter(product_count__gt=0).order_by('pk').values())
+                for model in (CategoryStats, OwnerStats)]
+
+    def assertMatchesRebuild(self):
+        current = self.snapshot_stats()
+        aggregates.rebuild()
+        self.assertEqual(current, self.snapshot_stats())
+
+    def test_incremental_updates(self):
+        cheap = self.create(10)
+        expensive = self.create(300, is_published=True)
+        self.create(50, owner=self.other)
+        self.assertEqual(self.stats(self.food), (3, 1, 10, 300, 360))
+
+        expensive.price_per_unit = 20
+        expensive.save()
+        self.assertEqual(self.stats(self.food), (3, 1, 10, 50, 80))
+
+        cheap.category = self.drinks
+        cheap.save()
+        self.assertEqual(self.stats(self.food), (2, 1, 20, 50, 70))
+        self.assertEqual(self.stats(self.drinks), (1, 0, 10, 10, 10))
+
+        cheap.delete()
+        self.assertEqual(self.stats(self.drinks), (0, 0, None, None, 0))
+        self.assertEqual(OwnerStats.objects.get(pk=self.user.pk).product_count, 1)
+        self.assertAlmostEqual(CategoryStats.objects.get(pk=self.food.pk).price_avg, 35)
+        self.assertMatchesRebuild()
+
+    def test_unrelated_change_does_not_touch_stats(self):
+        product = self.create(10)
+        product.name = 'Новое имя'
+        with CaptureQueriesContext(connection) as context:
+            product.save()
+        self.assertFalse([q for q in context.captured_queries if 'catalog_categorystats' in q['sql']])
+
+    def test_batch_api_updates_stats(self):
+        product = self.create(100)
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('catalog:api_products_batch'), json.dumps({'operations': [
+            {'op': 'create', 'data': {'name': 'Сок', 'description': 'сок', 'category': self.drinks.pk,
+                                      'price_per_unit': 70}},
+            {'op': 'update', 'id': product.pk, 'data': {'category': self.drinks.pk}},
+        ]}), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.stats(self.food), (0, 0, None, None, 0))
+        self.assertEqual(self.stats(self.drinks), (2, 0, 70, 100, 170))
+        self.assertMatchesRebuild()
+
+    def test_import_refreshes_stats(self):
+        self.create(500, owner=self.other)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'products.ndjson')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write('{"name": "Продукт 500", "category": "Еда", "price_per_unit": 5}\n'
+                        '{"name": "Вода", "category": "Напитки", "price_per_unit": 30, "is_published": true}\n')
+            call_command('fill_prod', path, '--owner', self.user.email, stdout=io.StringIO())
+        self.assertEqual(self.stats(self.food), (1, 0, 5, 5, 5))
+        self.assertEqual(self.stats(self.drinks), (1, 1, 30, 30, 30))
+        self.assertMatchesRebuild()
+
+    def test_import_refreshes_stats_once(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'products.ndjson')
+            with open(path, 'w', encoding='utf-8') as f:
+                for price in (10, 20, 30):
+                    f.write(json.dumps({'name': f'Продукт {price}', 'category': 'Еда', 'price_per_unit': price}) + '\n')
+            with mock.patch.object(aggregates, 'refresh', wraps=aggregates.refresh) as refresh:
+                call_command('fill_prod', path, '--owner', self.user.email, '--batch-size', '1',
+                             stdout=io.StringIO())
+        refresh.assert_called_once_with({self.food.pk}, {self.user.pk})
+        self.assertEqual(self.stats(self.food), (3, 0, 10, 30, 60))
+        self.assertMatchesRebuild()
+
+    def test_rebuild_command_fixes_drift(self):
+        self.create(10)
+        CategoryStats.objects.update(product_count=42)
+        OwnerStats.objects.all().delete()
+        call_command('rebuild_catalog_stats', stdout=io.StringIO())
+        self.assertEqual(self.stats(self.food), (1, 0, 10, 10, 10))
+        self.assertEqual(OwnerStats.objects.get(pk=self.user.pk).price_sum, 10)
+
+    def test_services_are_cached_and_invalidated(self):
+        self.create(10)
+        self.assertEqual([stats.category for stats in get_category_stats()], [self.food])
+        self.assertEqual(get_owner_stats(self.user).product_count, 1)
+        with self.assertNumQueries(0):
+            get_category_stats()
+            get_owner_stats(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create(20, category=self.drinks)
+        self.assertEqual([stats.category for stats in get_category_stats()], [self.food, self.drinks])
+        self.assertEqual(get_owner_stats(self.user).product_count, 2)
+        self.assertIsNone(get_owner_stats(self.other))
+
+    def test_home_shows_category_stats(self):
+        self.create(10)
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('catalog:home'))
+        self.assertEqual(response.context['owner_stats'].product_count, 1)
+        self.assertContains(response, 'Ваши продукты: 1')
+
+
+@override_settings(CATALOG_CHANGES_LAG=0)
+class CatalogChangeFeedTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='owner@example.com', password='password')
+        self.staff = User.objects.create_user(email='staff@example.com', password='password', is_staff=True)
+        self.category = Category.objects.create(name='Еда', description='')
+
+    def create_product(self, name='Хлеб', price=10):
+        return Product.objects.create(name=name, description='описание', category=self.category,
+                                      price_per_unit=price, owner=self.user)
+
+    def entries(self, since=0):
+        return list(CatalogChange.objects.filter(id__gt=since).order_by('id')
+                    .values_list('model', 'action', 'object_id'))
+
+    def test_changes_recorded_in_order(self):
+        product = self.create_product()
+        product.price_per_unit = 20
+        product.save()
+        version = Version.objects.create(product=product, version_name='v1', current_version=True)
+        product_pk = product.pk
+        product.delete()
+        entries = self.entries()
+        self.assertEqual(entries[:4], [
+            ('category', 'create', self.category.pk),
+            ('product', 'create', product_pk),
+            ('product', 'update', product_pk),
+            ('version', 'create', version.pk),
+        ])
+        self.assertCountEqual(entries[4:], [('version', 'delete', version.pk), ('product', 'delete', product_pk)])
+        update = CatalogChange.objects.get(model='product', action='update')
+        self.assertEqual(update.data['price_per_unit'], 20)
+        self.assertIsNone(CatalogChange.objects.get(model='product', action='delete').data)
+
+    def test_change_rolled_back_with_transaction(self):
+        watermark = CatalogChange.objects.aggregate(last=Max('id'))['last']
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.create_product()
+            raise IntegrityError
+        self.assertEqual(self.entries(watermark), [])
+
+    def test_batch_api_records_changes(self):
+        product = self.create_product()
+        watermark = CatalogChange.objects.aggregate(last=Max('id'))['last']
+        self.client.force_login(self.user)
+        self.client.post(reverse('catalog:api_products_batch'), json.dumps({'operations': [
+            {'op': 'create', 'data': {'name': 'Сыр', 'description': 'сыр', 'category': self.category.pk,
+                                      'price_per_unit': 70}},
+            {'op': 'publish', 'id': product.pk},
+        ]}), content_type='application/json')
+        new_pk = Product.objects.get(name='Сыр').pk
+        self.assertEqual(sorted(self.entries(watermark)),
+                         [('product', 'create', new_pk), ('product', 'update', product.pk)])
+
+    def test_collect_writes_to_given_database(self):
+        product = self.create_product()
+        with mock.patch.object(CatalogChange.objects, 'using', wraps=CatalogChange.objects.using) as using:
+            with changes.collect(using='default'):
+                changes.record(product, CatalogChange.ACTION_UPDATE)
+        using.assert_called_once_with('default')
+        self.assertEqual(self.entries()[-1], ('product', 'update', product.pk))
+
+    def test_export_since_watermark(self):
+        self.create_product()
+        watermark = CatalogChange.objects.aggregate(last=Max('id'))['last']
+        second = self.create_product('Сыр', 70)
+        self.client.force_login(self.staff)
+
+        response = self.client.get(reverse('catalog:api_changes'), {'since': watermark})
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([(row['object_id'], row['action']) for row in rows], [(second.pk, 'create')])
+        self.assertEqual(rows[0]['data']['name'], 'Сыр')
+        self.assertEqual(int(response['X-Watermark']), rows[-1]['id'])
+
+        response = self.client.get(reverse('catalog:api_changes'), {'since': response['X-Watermark']})
+        self.assertEqual(b''.join(response.streaming_content), b'')
+
+    def test_export_csv_gzip(self):
+        product = self.create_product()
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('catalog:api_changes'), {'format': 'csv', 'model': 'product'},
+                                   HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        content = gzip.decompress(b''.join(response.streaming_content)).decode()
+        rows = list(csv.DictReader(io.StringIO(content)))
+        self.assertEqual([(int(row['object_id']), row['action']) for row in rows], [(product.pk, 'create')])
+        self.assertEqual(json.loads(rows[0]['data'])['price_per_unit'], 10)
+
+    def test_export_respects_lag_and_access(self):
+        self.create_product()
+        self.client.force_login(self.staff)
+        with override_settings(CATALOG_CHANGES_LAG=3600):
+            response = self.client.get(reverse('catalog:api_changes'))
+        self.assertEqual(response['X-Watermark'], '0')
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('catalog:api_changes')).status_code, 302)
+        self.client.force_login(self.staff)
+        self.assertEqual(self.client.get(reverse('catalog:api_changes'), {'format': 'xml'}).status_code, 400)
+
+    def test_export_command(self):
+        self.create_product()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'changes.ndjson.gz')
+            err = io.StringIO()
+            call_command('export_changes', '--gzip', '--output', path, '--model', 'product', stderr=err)
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                rows = [json.loads(line) for line in f]
+        self.assertEqual([row['model'] for row in rows], ['product'])
+        self.assertIn(f"Watermark: {CatalogChange.objects.aggregate(last=Max('id'))['last']}", err.getvalue())
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='owner@example.com', password='password')
+        self.other = User.objects.create_user(email='other@example.com', password='password')
+        self.staff = User.objects.create_user(email='staff@example.com', password='password', is_staff=True)
+        self.category = Category.objects.create(name='Category', description='Category')
+        self.product = Product.objects.create(name='Product', description='Description', category=self.category,
+                                              price_per_unit=10, owner=self.user)
+        self.version = Version.objects.create(product=self.product, version_name='v1', current_version=True)
+        self.client.force_login(self.user)
+
+    def assertNotModified(self, path, response, **headers):
+        if not headers:
+            headers = {'HTTP_IF_NONE_MATCH': response['ETag']}
+        repeated = self.client.get(path, **headers)
+        self.assertEqual(repeated.status_code, 304)
+        self.assertEqual(repeated.content, b'')
+        self.assertEqual(repeated['ETag'], response['ETag'])
+
+    def test_detail_not_modified_until_product_changes(self):
+        path = reverse('catalog:product_detail', args=[self.product.pk])
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertIn('private', response['Cache-Control'])
+        self.assertNotModified(path, response)
+        self.assertNotModified(path, response, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+
+        self.product.price_per_unit = 20
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+        changed = self.client.get(path, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], response['ETag'])
+        self.assertContains(changed, 'Цена: $20')
+
+    def test_validators_depend_on_user(self):
+        path = reverse('catalog:product_detail', args=[self.product.pk])
+        response = self.client.get(path)
+        self.client.force_login(self.other)
+        other = self.client.get(path, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(other.status_code, 200)
+        self.assertFalse(other.context['can_change'])
+
+    def test_list_changes_with_versions_and_batch(self):
+        path = reverse('catalog:home')
+        response = self.client.get(path)
+        self.assertNotModified(path, response)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Version.objects.create(product=self.product, version_name='v2', version_number='2.0.0',
+                                   current_version=True)
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('catalog:api_products_batch'), json.dumps(
+                {'operations': [{'op': 'publish', 'id': self.product.pk, 'published': True}]}),
+                content_type='application/json')
+        self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_version_detail_and_api(self):
+        path = reverse('catalog:version-detail', args=[self.version.pk])
+        response = self.client.get(path)
+        self.assertNotModified(path, response)
+        self.version.version_name = 'v1.1'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.version.save()
+        self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+        path = reverse('catalog:api_products')
+        response = self.client.get(path)
+        self.assertIn('public', response['Cache-Control'])
+        self.assertNotModified(path, response)
+
+    @override_settings(CATALOG_CHANGES_LAG=0)
+    def test_changes_api_not_modified_without_new_entries(self):
+        self.client.force_login(self.staff)
+        path = reverse('catalog:api_changes') + '?since=0'
+        response = self.client.get(path)
+        b''.join(response.streaming_content)
+        self.assertNotModified(path, response)
+        self.product.save()
+        self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_updated_at_changes_on_edit(self):
+        created = self.product.updated_at
+        self.product.description = 'New description'
+        self.product.save()
+        self.assertGreater(self.product.updated_at, created)
+        apply = self.client.post(reverse('catalog:api_products_batch'), json.dumps(
+            {'operations': [{'op': 'update', 'id': self.product.pk, 'data': {'price_per_unit': 30}}]}),
+            content_type='application/json')
+        self.assertEqual(apply.status_code, 200)
+        self.product.refresh_from_db()
+        self.assertGreater(self.product.updated_at, created)
+        self.assertEqual(self.product.price_per_unit, 30)
+
+    async def test_async_detail_not_modified(self):
+        def request(**headers):
+            request = AsyncRequestFactory().get('/', headers=headers)
+
+            async def auser():
+                return self.user
+
+            request.auser = auser
+            return request
+
+        view = ProductDetailAsyncView.as_view()
+        response = await view(request(), pk=self.product.pk)
+        self.assertEqual(response.status_code, 200)
+        not_modified = await view(request(if_none_match=response['ETag']), pk=self.product.pk)
+        self.assertEqual(not_modified.status_code, 304)
+
+
+class StockLedgerTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(email='owner@example.com', password='password')
+        category = Category.objects.create(name='Еда', description='')
+        self.product = Product.objects.create(name='Сыр', description='', category=category, price_per_unit=10,
+                                              owner=user)
+        self.warehouse = Warehouse.objects.create(name='Основной', code='main')
+
+    def level(self):
+        level = stock.get_level(self.product, self.warehouse)
+        return level.quantity, level.reserved
+
+    def test_operations_keep_level_and_ledger_in_sync(self):
+        stock.receive(self.product, self.warehouse, 10, reference='поставка 1')
+        stock.reserve(self.product, self.warehouse, 4, reference='заказ 1')
+        stock.ship(self.product, self.warehouse, 3)
+        stock.release(self.product, self.warehouse, 1)
+        stock.sell(self.product, self.warehouse, 2)
+        self.assertEqual(self.level(), (5, 0))
+        self.assertEqual(stock.get_available(self.product), 5)
+        self.assertEqual(stock.ledger_balance(self.product, self.warehouse), (5, 0))
+        self.assertEqual(StockMovement.objects.count(), 5)
+
+    def test_cannot_go_below_available(self):
+        stock.receive(self.product, self.warehouse, 3)
+        stock.reserve(self.product, self.warehouse, 2)
+        with self.assertRaises(stock.InsufficientStock):
+            stock.reserve(self.product, self.warehouse, 2)
+        with self.assertRaises(stock.InsufficientStock):
+            stock.sell(self.product, self.warehouse, 2)
+        with self.assertRaises(stock.InsufficientStock):
+            stock.ship(self.product, self.warehouse, 3)
+        with self.assertRaises(stock.InsufficientStock):
+            stock.adjust(self.product, self.warehouse, 1)
+        with self.assertRaises(stock.InsufficientStock):
+            stock.reserve(self.product, Warehouse.objects.create(name='Пустой', code='empty'), 1)
+        self.assertEqual(self.level(), (3, 2))
+        self.assertEqual(StockMovement.objects.count(), 2)
+
+    def test_adjust_records_difference(self):
+        stock.receive(self.product, self.warehouse, 10)
+        stock.adjust(self.product, self.warehouse, 7, reference='инвентаризация')
+        self.assertEqual(self.level(), (7, 0))
+        self.assertEqual(StockMovement.objects.latest('id').quantity_delta, -3)
+
+    def test_movements_are_append_only(self):
+        stock.receive(self.product, self.warehouse, 1)
+        movement = StockMovement.objects.get()
+        with self.assertRaises(ValueError):
+            movement.save()
+
+    def test_snapshots_and_reconcile(self):
+        stock.receive(self.product, self.warehouse, 10)
+        stock.reserve(self.product, self.warehouse, 4)
+        self.assertEqual(stock.take_snapshots(lag=0), 1)
+        self.assertEqual(stock.take_snapshots(lag=0), 0)
+        snapshot = StockSnapshot.objects.get()
+        self.assertEqual((snapshot.quantity, snapshot.reserved), (10, 4))
+
+        stock.sell(self.product, self.warehouse, 1)
+        with self.assertNumQueries(2):
+            self.assertEqual(stock.ledger_balance(self.product, self.warehouse), (9, 4))
+        self.assertEqual(stock.take_snapshots(lag=0), 1)
+        self.assertEqual(stock.reconcile(), [])
+
+        StockLevel.objects.update(quantity=100)
+        self.assertEqual(stock.reconcile(), [(self.product.pk, self.warehouse.pk, (100, 4), (9, 4))])
+        with self.assertRaises(SystemExit):
+            call_command('stock_snapshot', '--reconcile', stdout=io.StringIO(), stderr=io.StringIO())
+
+
+class StockConcurrencyTests(TransactionTestCase):
+    workers = 100
+
+    def setUp(self):
+        user = User.objects.create_user(email='owner@example.com', password='password')
+        category = Category.objects.create(name='Еда', description='')
+        self.product = Product.objects.create(name='Сыр', description='', category=category, price_per_unit=10,
+                                              owner=user)
+        self.warehouse = Warehouse.objects.create(name='Основной', code='main')
+
+    def run_concurrently(self, operation):
+        barrier = threading.Barrier(self.workers)
+
+        def worker(i):
+            barrier.wait()
+            try:
+                operation(i)
+                return True
+            except stock.InsufficientStock:
+                return False
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return list(executor.map(worker, range(self.workers)))
+
+    def test_concurrent_reservations_of_one_sku(self):
+        stock.receive(self.product, self.warehouse, 40)
+        results = self.run_concurrently(
+            lambda i: stock.reserve(self.product, self.warehouse, 1, reference=f'заказ {i}'))
+        self.assertEqual(results.count(True), 40)
+        level = stock.get_level(self.product, self.warehouse)
+        self.assertEqual((level.quantity, level.reserved), (40, 40))
+        self.assertEqual(StockMovement.objects.filter(kind=StockMovement.KIND_RESERVE).count(), 40)
+        self.assertEqual(stock.reconcile(), [])
+
+    def test_concurrent_mixed_operations(self):
+        stock.receive(self.product, self.warehouse, 50)
+
+        def operation(i):
+            if i % 4 == 0:
+                stock.receive(self.product, self.warehouse, 2)
+            elif i % 4 == 1:
+                stock.sell(self.product, self.warehouse, 3)
+            else:
+                stock.reserve(self.product, self.warehouse, 1)
+
+        self.run_concurrently(operation)
+        level = stock.get_level(self.product, self.warehouse)
+        self.assertGreaterEqual(level.quantity, level.reserved)
+        self.assertEqual(stock.ledger_balance(self.product, self.warehouse), (level.quantity, level.reserved))
+        self.assertEqual(stock.reconcile(), [])
@@ -1,17 +1,32 @@
+from django.conf import settings
 from django.urls import path
 from django.views.decorators.cache import never_cache
 
 from catalog.views import ProductListView, ProductDetailView, ProductUpdateView, ProductCreateView, \
-    VersionDetailView, VersionCreateView, VersionUpdateView, ProductDeleteView
+    VersionDetailView, VersionCreateView, VersionUpdateView, ProductDeleteView, ProductStreamView, \
+    ProductSearchView, ProductAutocompleteView, ProductBatchView, CatalogChangesView, ProductListAsyncView, ProductDetailAsyncView, \
+    VersionDetailAsyncView
 
 app_name = 'catalog'
 
+# Под ASGI список и карточки обслуживают async-представления
+if settings.CATALOG_ASYNC_VIEWS:
+    product_list, product_detail, version_detail = ProductListAsyncView, ProductDetailAsyncView, VersionDetailAsyncView
+else:
+    product_list, product_detail, version_detail = ProductListView, ProductDetailView, VersionDetailView
+
 urlpatterns = [
-    path('', ProductListView.as_view(), name='home'),
-    path('product/<int:pk>', never_cache(ProductDetailView.as_view()), name='product_detail'),
+    path('', product_list.as_view(), name='home'),
+    path('api/products/', ProductStreamView.as_view(), name='api_products'),
+    path('api/products/batch/', ProductBatchView.as_view(), name='api_products_batch'),
+    path('api/changes/', CatalogChangesView.as_view(), name='api_changes'),
+    path('search/', ProductSearchView.as_view(), name='search'),
+    path('api/search/autocomplete/', ProductAutocompleteView.as_view(), name='autocomplete'),
+    # Карточка отдает Cache-Control: private, no-cache и отвечает 304 по ETag (catalog.conditional)
+    path('product/<int:pk>', product_detail.as_view(), name='product_detail'),
     path('create/', never_cache(ProductCreateView.as_view()), name='create_product'),
     path('update/<int:pk>', never_cache(ProductUpdateView.as_view()), name='update_product'),
-    path('version/<int:version_id>/', VersionDetailView.as_view(), name='version-detail'),
+    path('version/<int:version_id>/', version_detail.as_view(), name='version-detail'),
     path('version/form/<int:pk>/', never_cache(VersionCreateView.as_view()), name='version-form'),
     path('version/edit/<int:pk>/', never_cache(VersionUpdateView.as_view()), name='version-edit'),
     path('product/delete/<int:pk>/', never_cache(ProductDeleteView.as_view()), name='product-delete'),
@@ -1,58 +1,262 @@
+import json
+import re
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.core.exceptions import PermissionDenied
-from django.http import Http404, HttpResponseForbidden
+from django.contrib.auth.views import redirect_to_login
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import Http404, HttpResponseBadRequest, StreamingHttpResponse, JsonResponse
 from django.urls import reverse_lazy, reverse
 from django.utils import timezone
+from django.utils.cache import patch_vary_headers
 from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page
 from django.views.decorators.csrf import csrf_exempt
 
+from catalog.batch import apply_operations
+from catalog.cards import get_product_cards, aget_product_cards
+from catalog.aggregates import GENERATION as STATS_GENERATION
+from catalog.changes import FORMATS, MODELS, export, get_watermark
+from catalog.conditional import conditional, get_validators, aget_validators, make_etag, not_modified, \
+    set_validators
 from catalog.forms import ProductCreateForm, ProductUpdateForm, VersionCreateForm, VersionUpdateForm, ProductForm
 from catalog.models import Product, Version
+from catalog.moderation import contains_banned_word
+from catalog.permissions import CHANGE, DELETE, filter_modifiable
 from django.shortcuts import render, get_object_or_404
-from django.views.generic import ListView, DetailView, TemplateView, UpdateView, CreateView, DeleteView
+from django.template.response import TemplateResponse
+from django.views.generic import ListView, DetailView, TemplateView, UpdateView, CreateView, DeleteView, View
+
+from catalog.pagination import paginate_by_keyset, apaginate_by_keyset, decode_cursor, iter_keyset_batches
+from catalog.search import search_products, autocomplete
+from catalog.services import get_cached_categories, get_active_versions, get_product_fragment_version, \
+    aget_cached_categories, aget_active_versions, aget_product_fragment_version, get_category_stats, \
+    aget_category_stats, get_owner_stats, aget_owner_stats
+from users.services.permissions import GENERATION as PERMISSIONS_GENERATION
+
+# Пространства имен кеша, от которых зависят страницы (catalog.conditional)
+PRODUCT_LIST_NAMESPACES = ('product', 'version', 'category', STATS_GENERATION, PERMISSIONS_GENERATION)
+
+
+def async_login_required(view_func):
+    """login_required для async-представлений: пользователь загружается через request.auser()."""
+    @wraps(view_func)
+    async def wrapper(request, *args, **kwargs):
+        user = await request.auser()
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path(), reverse('user:login'))
+        request.user = user
+        return await view_func(request, *args, **kwargs)
+    return wrapper
+
+
+def product_list_validators(request, *args, **kwargs):
+    return get_validators(request, PRODUCT_LIST_NAMESPACES, request.user)
+
+
+async def aproduct_list_validators(request, *args, **kwargs):
+    return await aget_validators(request, PRODUCT_LIST_NAMESPACES, await request.auser())
+
+
+def product_detail_validators(request, pk, *args, **kwargs):
+    return get_validators(request, (f'product:{pk}', 'category', PERMISSIONS_GENERATION), request.user)
+
+
+async def aproduct_detail_validators(request, pk, *args, **kwargs):
+    return await aget_validators(request, (f'product:{pk}', 'category', PERMISSIONS_GENERATION), request.user)
 
-from catalog.services import get_cached_categories
 
+def version_detail_validators(request, version_id, *args, **kwargs):
+    return get_validators(request, (f'version:{version_id}',), request.user)
 
+
+async def aversion_detail_validators(request, version_id, *args, **kwargs):
+    return await aget_validators(request, (f'version:{version_id}',), request.user)
+
+
+def product_stream_validators(request, *args, **kwargs):
+    return get_validators(request, ('product',))
+
+
+@method_decorator(conditional(product_list_validators), name='get')
 class ProductListView(ListView):
     model = Product
     template_name = 'catalog/home.html'
     context_object_name = 'products'
+    paginate_by = 24
+
+    def get_queryset(self):
+        return super().get_queryset().select_related('category', 'active_version')
+
+    def paginate_queryset(self, queryset, page_size):
+        # Курсорная пагинация по (name, pk) вместо OFFSET
+        try:
+            products, self.next_cursor = paginate_by_keyset(queryset, self.request.GET.get('cursor'), page_size)
+        except ValueError:
+            raise Http404('Неверный курсор')
+        return None, None, products, self.next_cursor is not None
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        products = context['products']
-        active_versions = {}
+        context['next_cursor'] = self.next_cursor
+        context['active_versions'] = get_active_versions(context['products'])
+        context['categories'] = get_cached_categories()
+        context['category_stats'] = get_category_stats()
+        if self.request.user.is_authenticated:
+            context['owner_stats'] = get_owner_stats(self.request.user)
+            context['can_change_all'] = self.request.user.has_perm(CHANGE)
+        context['cards'] = get_product_cards(context['products'], self.request.user,
+                                             context.get('can_change_all', False))
+        return context
 
-        for product in products:
-            active_version = product.version_set.filter(current_version=True).first()
-            if active_version is None:
-                active_versions[product.pk] = None
-            else:
-                active_versions[product.pk] = active_version
 
-        context['active_versions'] = active_versions
-        context['categories'] = get_cached_categories()
+@method_decorator(conditional(product_stream_validators, private=False), name='get')
+class ProductStreamView(View):
+    """
+    Опубликованные продукты в NDJSON, читаются из БД пачками по batch_size.
+
+    Доступен без входа и кешируется как публичный, поэтому неопубликованные
+    продукты и владельцы в выгрузку не попадают.
+    """
+    fields = ('name', 'description', 'category_id', 'price_per_unit', 'created_at', 'updated_at')
+    batch_size = 500
+
+    def get(self, request, *args, **kwargs):
+        cursor = request.GET.get('cursor')
+        if cursor:
+            try:
+                decode_cursor(cursor)
+            except ValueError as e:
+                return HttpResponseBadRequest(str(e))
+        rows = iter_keyset_batches(Product.objects.filter(is_published=True), self.fields, self.batch_size, cursor)
+        lines = (json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n' for row in rows)
+        return StreamingHttpResponse(lines, content_type='application/x-ndjson')
+
+
+@method_decorator(staff_member_required, name='dispatch')
+class CatalogChangesView(View):
+    """
+    Изменения каталога после watermark: ?since=<id>&format=ndjson|csv&model=product&model=version.
+
+    Следующий watermark отдается в заголовке X-Watermark, при Accept-Encoding: gzip ответ сжимается.
+    ETag зависит от параметров и watermark: пока новых записей нет, повторный опрос получает 304.
+    """
+    content_types = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+    accepts_gzip = re.compile(r'\bgzip\b')
+
+    def get(self, request, *args, **kwargs):
+        try:
+            since = int(request.GET.get('since') or 0)
+        except ValueError:
+            return HttpResponseBadRequest('since должен быть числом')
+        stream_format = request.GET.get('format') or 'ndjson'
+        if stream_format not in FORMATS:
+            return HttpResponseBadRequest(f"format: одно из {', '.join(FORMATS)}")
+        models = request.GET.getlist('model')
+        if set(models) - set(MODELS.values()):
+            return HttpResponseBadRequest(f"model: одно из {', '.join(MODELS.values())}")
+
+        until = get_watermark(since)
+        compress = bool(self.accepts_gzip.search(request.headers.get('Accept-Encoding', '')))
+        etag = make_etag(since, until, stream_format, *sorted(models), 'gzip' if compress else '')
+        response = not_modified(request, etag, None)
+        if response is not None:
+            response['X-Watermark'] = until
+            patch_vary_headers(response, ('Accept-Encoding',))
+            return set_validators(response, etag, None)
+        response = StreamingHttpResponse(export(since, until, stream_format, models, compress),
+                                         content_type=self.content_types[stream_format])
+        response['X-Watermark'] = until
+        if compress:
+            response['Content-Encoding'] = 'gzip'
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return set_validators(response, etag, None)
+
+
+class ProductSearchView(TemplateView):
+    template_name = 'catalog/search.html'
+    paginate_by = 24
+
+    def get_int_param(self, name):
+        try:
+            return int(self.request.GET[name])
+        except (KeyError, ValueError):
+            return None
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        query = self.request.GET.get('q', '').strip()
+        page = max(self.get_int_param('page') or 1, 1)
+        context['query'] = query
+        context['page'] = page
+        if query:
+            result = search_products(
+                query,
+                category=self.get_int_param('category'),
+                price_min=self.get_int_param('price_min'),
+                price_max=self.get_int_param('price_max'),
+                limit=self.paginate_by,
+                offset=(page - 1) * self.paginate_by,
+            )
+            context.update(result)
+            context['has_next'] = page * self.paginate_by < result['total']
         return context
 
 
+class ProductAutocompleteView(View):
+    def get(self, request, *args, **kwargs):
+        prefix = request.GET.get('q', '').strip()
+        return JsonResponse({'results': autocomplete(prefix) if prefix else []})
+
+
 @method_decorator(login_required(login_url=reverse_lazy('user:login')), name='dispatch')
+class ProductBatchView(View):
+    """
+    Пакет операций с продуктами в одном запросе.
+
+    Тело: {"operations": [{"op": "create", "data": {...}}, {"op": "update", "id": 1, "data": {...}},
+    {"op": "publish", "id": 1, "published": true}, {"op": "delete", "id": 1}], "atomic": true}
+    """
+
+    def post(self, request, *args, **kwargs):
+        try:
+            payload = json.loads(request.body)
+            applied, results = apply_operations(request.user, payload['operations'], bool(payload.get('atomic', True)))
+        except (ValueError, KeyError, TypeError) as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        return JsonResponse({'applied': applied, 'results': results}, status=200 if applied else 400,
+                            json_dumps_params={'ensure_ascii': False})
+
+
+@method_decorator(login_required(login_url=reverse_lazy('user:login')), name='dispatch')
+@method_decorator(conditional(product_detail_validators), name='get')
 class ProductDetailView(DetailView):
     model = Product
     template_name = 'catalog/product_detail.html'
     context_object_name = 'product'
 
-    @method_decorator(cache_page(60 * 15))  # Применение декоратора к методу dispatch
-    def dispatch(self, *args, **kwargs):
-        return super().dispatch(*args, **kwargs)
-
     def get_context_data(self, **kwargs):
         context_data = super().get_context_data(**kwargs)
         context_data['categories'] = get_cached_categories()
+        # Общая для всех пользователей часть страницы кешируется фрагментом в шаблоне
+        context_data['fragment_version'] = get_product_fragment_version(self.object)
+        context_data['fragment_timeout'] = settings.PRODUCT_FRAGMENT_TIMEOUT if settings.CACHE_ENABLED else 0
+        context_data.update(self.get_permission_context(self.request.user, self.object))
         return context_data
 
+    @staticmethod
+    def get_permission_context(user, product):
+        is_owner = user.pk == product.owner_id
+        return {
+            'is_owner': is_owner,
+            'can_change': is_owner or user.has_perm(CHANGE),
+            'can_delete': is_owner or user.has_perm(DELETE),
+        }
+
 
 @method_decorator(login_required(login_url=reverse_lazy('user:login')), name='dispatch')
 @method_decorator(csrf_exempt, name='dispatch')
@@ -64,26 +268,13 @@ class ProductCreateView(CreateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        products = Product.objects.all()
-        active_versions = {}
-
-        for product in products:
-            active_version = product.version_set.filter(current_version=True).first()
-            if active_version is None:
-                active_versions[product.pk] = None
-            else:
-                active_versions[product.pk] = active_version
-
-        context['active_versions'] = active_versions
-
+        context['active_versions'] = get_active_versions(Product.objects.all())
         return context
 
     def form_valid(self, form):
         form.instance.owner = self.request.user
-        form.instance.is_banned = any(word in form.cleaned_data['name'].lower() or
-                                      word in form.cleaned_data['description'].lower()
-                                      for word in ['casino', 'cryptocurrency', 'crypto', 'exchange', 'cheap',
-                                                   'free', 'scam', 'police', 'radar'])
+        form.instance.is_banned = contains_banned_word(form.cleaned_data['name'], form.cleaned_data['description'],
+                                                        word_list='en')
         form.instance.last_modified_date = timezone.now()
         return super().form_valid(form)
 
@@ -96,17 +287,7 @@ class ProductUpdateView(UpdateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        products = context['products']
-        active_versions = {}
-
-        for product in products:
-            active_version = product.version_set.filter(current_version=True).first()
-            if active_version is None:
-                active_versions[product.pk] = None
-            else:
-                active_versions[product.pk] = active_version
-
-        context['active_versions'] = active_versions
+        context['active_versions'] = get_active_versions(context['products'])
         return context
 
     def get_object(self, queryset=None):
@@ -123,6 +304,7 @@ class ContactDetailView(TemplateView):
 
 
 @method_decorator(login_required(login_url=reverse_lazy('user:login')), name='dispatch')
+@method_decorator(conditional(version_detail_validators), name='get')
 class VersionDetailView(DetailView):
     model = Version
     template_name = 'catalog/version_detail.html'
@@ -133,6 +315,67 @@ class VersionDetailView(DetailView):
         return Version.objects.get(id=version_id)
 
 
+@method_decorator(conditional(aproduct_list_validators), name='get')
+class ProductListAsyncView(View):
+    """ProductListView на асинхронном ORM, для запуска под ASGI."""
+    template_name = 'catalog/home.html'
+    paginate_by = ProductListView.paginate_by
+
+    async def get(self, request, *args, **kwargs):
+        user = await request.auser()
+        queryset = Product.objects.select_related('category', 'active_version')
+        try:
+            products, next_cursor = await apaginate_by_keyset(queryset, request.GET.get('cursor'), self.paginate_by)
+        except ValueError:
+            raise Http404('Неверный курсор')
+        can_change_all = user.is_authenticated and await user.ahas_perm(CHANGE)
+        return TemplateResponse(request, self.template_name, {
+            'products': products,
+            'cards': await aget_product_cards(products, user, can_change_all),
+            'object_list': products,
+            'is_paginated': next_cursor is not None,
+            'next_cursor': next_cursor,
+            'active_versions': await aget_active_versions(products),
+            'categories': await aget_cached_categories(),
+            'category_stats': await aget_category_stats(),
+            'owner_stats': await aget_owner_stats(user) if user.is_authenticated else None,
+            'can_change_all': can_change_all,
+        })
+
+
+@method_decorator(async_login_required, name='dispatch')
+@method_decorator(conditional(aproduct_detail_validators), name='get')
+class ProductDetailAsyncView(View):
+    template_name = 'catalog/product_detail.html'
+
+    async def get(self, request, pk, *args, **kwargs):
+        try:
+            product = await Product.objects.select_related('category', 'active_version').aget(pk=pk)
+        except Product.DoesNotExist:
+            raise Http404('Продукт не найден')
+        return TemplateResponse(request, self.template_name, {
+            'product': product,
+            'object': product,
+            'categories': await aget_cached_categories(),
+            'fragment_version': await aget_product_fragment_version(product),
+            'fragment_timeout': settings.PRODUCT_FRAGMENT_TIMEOUT if settings.CACHE_ENABLED else 0,
+            **await sync_to_async(ProductDetailView.get_permission_context)(request.user, product),
+        })
+
+
+@method_decorator(async_login_required, name='dispatch')
+@method_decorator(conditional(aversion_detail_validators), name='get')
+class VersionDetailAsyncView(View):
+    template_name = 'catalog/version_detail.html'
+
+    async def get(self, request, version_id, *args, **kwargs):
+        try:
+            version = await Version.objects.aget(id=version_id)
+        except Version.DoesNotExist:
+            raise Http404('Версия не найдена')
+        return TemplateResponse(request, self.template_name, {'version': version, 'object': version})
+
+
 @method_decorator(login_required(login_url=reverse_lazy('user:login')), name='dispatch')
 class VersionCreateView(CreateView):
     model = Version
@@ -161,12 +404,11 @@ class VersionUpdateView(UpdateView):
 class ProductUpdateView(LoginRequiredMixin, UpdateView):
     model = Product
     form_class = ProductForm
-    success_url = reverse_lazy('products:home')
+    success_url = reverse_lazy('catalog:home')
 
-    def handle_no_permission(self):
-        if self.request.user.is_authenticated:
-            raise PermissionDenied("У вас нет прав на редактирование этого товара.")
-        return super().handle_no_permission()
+    def get_queryset(self):
+        # Чужой продукт без права на изменение не найдется: 404 без загрузки объекта и проверки после нее
+        return filter_modifiable(self.request.user, CHANGE, super().get_queryset())
 
     def get_context_data(self, **kwargs):
         context_data = super().get_context_data(**kwargs)
@@ -175,16 +417,7 @@ class ProductUpdateView(LoginRequiredMixin, UpdateView):
 
 class ProductDeleteView(LoginRequiredMixin, DeleteView):
     model = Product
-    success_url = reverse_lazy('products:home')
+    success_url = reverse_lazy('catalog:home')
 
-    def handle_no_permission(self):
-        if self.request.user.is_authenticated:
-            raise PermissionDenied("У вас нет прав на удаление этого товара.")
-        return super().handle_no_permission()
-
-    def delete(self, request, *args, **kwargs):
-        self.object = self.get_object()
-        if hasattr(self.object, 'owner') and self.request.user == self.object.owner:
-            return super().delete(request, *args, **kwargs)
-        else:
-            return HttpResponseForbidden("У вас нет прав на удаление этого товара.")
+    def get_queryset(self):
+        return filter_modifiable(self.request.user, DELETE, super().get_queryset())
@@ -0,0 +1,153 @@
+"""
+Отдача статики и медиа.
+
+Файлы с хешем содержимого в имени (skypro_diplom.storage) отдаются
+с Cache-Control: public, max-age=<год>, immutable - повторные визиты их
+не запрашивают совсем. Остальные - с no-cache и проверкой по ETag/Last-Modified.
+
+Поддерживаются запросы диапазонов (Range, If-Range) и заранее сжатые
+варианты статики (.br, .gz) по Accept-Encoding. При ASSET_SENDFILE
+файл отдает веб-сервер: 'x-accel' - заголовок X-Accel-Redirect для nginx
+(internal location ASSET_ACCEL_PREFIX + static/ или media/; диапазоны
+и сжатые варианты тогда обрабатывает nginx), 'x-sendfile' - X-Sendfile
+с абсолютным путем для Apache/lighttpd.
+"""
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, parse_http_date_safe
+
+from skypro_diplom.storage import ENCODINGS, is_hashed
+
+IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+
+def _find(root, path):
+    try:
+        full_path = safe_join(root, path)
+    except SuspiciousFileOperation:
+        return None
+    return full_path if os.path.isfile(full_path) else None
+
+
+def _parse_range(header, size):
+    """(начало, длина) одного диапазона, None - диапазон не указан или не поддерживается, False - вне файла."""
+    match = RANGE.match(header or '')
+    if not match or not any(match.groups()):
+        return None
+    start, end = match.groups()
+    if not start:
+        # bytes=-500: последние 500 байт
+        length = min(int(end), size)
+        return (size - length, length) if length else False
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or end < start:
+        return False
+    return start, end - start + 1
+
+
+def _iter_range(full_path, start, length):
+    with open(full_path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                return
+            length -= len(chunk)
+            yield chunk
+
+
+def _range_applies(request, etag, mtime):
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == int(mtime)
+
+
+def _accepted_variant(request, full_path, kind):
+    if kind != 'static':
+        return None, full_path
+    accept = request.headers.get('Accept-Encoding', '')
+    for encoding, suffix in ENCODINGS:
+        if re.search(rf'\b{encoding}\b', accept) and os.path.isfile(full_path + suffix):
+            return encoding, full_path + suffix
+    return None, full_path
+
+
+def _file_response(request, full_path, path, kind, stat, etag):
+    content_type = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+    if settings.ASSET_SENDFILE == 'x-accel':
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = f'{settings.ASSET_ACCEL_PREFIX}{kind}/{path}'
+        return response
+
+    byte_range = _parse_range(request.headers.get('Range'), stat.st_size) \
+        if _range_applies(request, etag, stat.st_mtime) else None
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{stat.st_size}'
+        return response
+    if byte_range is not None and settings.ASSET_SENDFILE != 'x-sendfile':
+        start, length = byte_range
+        response = StreamingHttpResponse(_iter_range(full_path, start, length), status=206,
+                                         content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{start + length - 1}/{stat.st_size}'
+        response['Content-Length'] = length
+        return response
+
+    # Диапазон относится к исходному файлу, сжатый вариант отдается только целиком
+    encoding, variant = _accepted_variant(request, full_path, kind) if byte_range is None else (None, full_path)
+    if settings.ASSET_SENDFILE == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = variant
+    else:
+        response = FileResponse(open(variant, 'rb'), content_type=content_type)
+    if encoding:
+        response['Content-Encoding'] = encoding
+    return response
+
+
+def serve(request, path, root, kind):
+    full_path = _find(root, path) if root else None
+    if full_path is None and kind == 'static' and settings.DEBUG:
+        # Без collectstatic при разработке файл ищется в каталогах приложений
+        full_path = finders.find(path)
+    if full_path is None:
+        raise Http404('Файл не найден')
+
+    stat = os.stat(full_path)
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    response = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if response is None:
+        response = _file_response(request, full_path, path, kind, stat, etag)
+    if response.status_code in (200, 206, 304):
+        response.headers.setdefault('ETag', etag)
+        response.headers.setdefault('Last-Modified', http_date(stat.st_mtime))
+        response['Accept-Ranges'] = 'bytes'
+        if is_hashed(path):
+            patch_cache_control(response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+        else:
+            patch_cache_control(response, public=True, no_cache=True)
+        if kind == 'static':
+            patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+
+def serve_static(request, path):
+    return serve(request, path, settings.STATIC_ROOT, 'static')
+
+
+def serve_media(request, path):
+    return serve(request, path, settings.MEDIA_ROOT, 'media')
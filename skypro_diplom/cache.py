@@ -0,0 +1,273 @@
+"""
+Двухуровневый кеш: небольшой LRU в памяти процесса (L1) перед общим кешем (L2, Redis).
+
+Чтение сначала идет в L1, промах - в L2 с сохранением значения в L1 на короткий
+срок. Любая запись проходит в L2, а ключ рассылается остальным процессам через
+шину инвалидации (Redis pub/sub), чтобы они выбросили его из своего L1.
+Атомарные операции (add, incr) всегда выполняются в L2.
+"""
+import pickle
+import threading
+import time
+import uuid
+import weakref
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import BaseCache, DEFAULT_TIMEOUT
+from django.utils.module_loading import import_string
+
+
+class LocalInvalidationBus:
+    """Шина внутри одного процесса: для разработки и тестов без Redis."""
+    _subscribers = {}
+    _lock = threading.Lock()
+
+    def __init__(self, channel, callback, **options):
+        self.channel = channel
+        with self._lock:
+            self._subscribers.setdefault(channel, weakref.WeakSet()).add(self)
+        self._callback = callback
+
+    def start(self):
+        pass
+
+    def publish(self, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(self.channel, ()))
+        for subscriber in subscribers:
+            subscriber._callback(message)
+
+
+class RedisInvalidationBus:
+    """Шина поверх Redis pub/sub, слушатель запускается в фоновом потоке при первой публикации или чтении."""
+
+    def __init__(self, channel, callback, cache_alias='redis', **options):
+        self.channel = channel
+        self.cache_alias = cache_alias
+        self._callback = callback
+        self._listener = None
+        self._lock = threading.Lock()
+
+    def _client(self):
+        return caches[self.cache_alias].client.get_client(write=True)
+
+    def start(self):
+        if self._listener is not None:
+            return
+        with self._lock:
+            if self._listener is not None and self._listener.is_alive():
+                return
+            pubsub = self._client().pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(self.channel)
+            self._listener = threading.Thread(target=self._listen, args=(pubsub,), daemon=True,
+                                              name=f'cache-invalidation-{self.channel}')
+            self._listener.start()
+
+    def _listen(self, pubsub):
+        try:
+            for message in pubsub.listen():
+                data = message['data']
+                self._callback(data.decode() if isinstance(data, bytes) else data)
+        finally:
+            # Потеряли соединение: перезапуск при следующем обращении, L1 пока живет только по TTL
+            self._listener = None
+
+    def publish(self, message):
+        self.start()
+        self._client().publish(self.channel, message)
+
+
+class TieredCache(BaseCache):
+    """
+    Бэкенд кеша с L1 в памяти процесса.
+
+    OPTIONS:
+        L2 - алиас кеша второго уровня;
+        L1_MAX_ENTRIES - размер LRU;
+        L1_TIMEOUT - максимальное время жизни записи в L1, секунд;
+        INVALIDATION_BUS - путь к классу шины инвалидации (None - без рассылки);
+        INVALIDATION_CHANNEL - канал шины.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.l2_alias = options.get('L2', 'redis')
+        self.l1_max_entries = int(options.get('L1_MAX_ENTRIES', 1000))
+        self.l1_timeout = float(options.get('L1_TIMEOUT', 5))
+        self._l1 = OrderedDict()
+        self._l1_lock = threading.Lock()
+        self._node_id = uuid.uuid4().hex
+        self._bus = None
+        bus_path = options.get('INVALIDATION_BUS')
+        if bus_path:
+            bus_class = import_string(bus_path)
+            self._bus = bus_class(options.get('INVALIDATION_CHANNEL', f'cache-invalidation:{location}'),
+                                  self._on_invalidation, **options.get('INVALIDATION_OPTIONS', {}))
+
+    @property
+    def l2(self):
+        return caches[self.l2_alias]
+
+    def _l1_get(self, key):
+        with self._l1_lock:
+            item = self._l1.get(key)
+            if item is None:
+                return self._missing_key
+            expires_at, pickled = item
+            if expires_at <= time.monotonic():
+                del self._l1[key]
+                return self._missing_key
+            self._l1.move_to_end(key)
+        return pickle.loads(pickled)
+
+    def _l1_set(self, key, value, timeout):
+        l1_timeout = self.l1_timeout if timeout is None else min(self.l1_timeout, timeout)
+        if l1_timeout <= 0:
+            self._l1_evict([key])
+            return
+        # Храним копию, как LocMemCache, чтобы изменения объекта вызывающим кодом не попадали в кеш
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._l1_lock:
+            self._l1[key] = (time.monotonic() + l1_timeout, pickled)
+            self._l1.move_to_end(key)
+            while len(self._l1) > self.l1_max_entries:
+                self._l1.popitem(last=False)
+
+    def _l1_evict(self, keys):
+        with self._l1_lock:
+            for key in keys:
+                self._l1.pop(key, None)
+
+    def _invalidate(self, keys):
+        self._l1_evict(keys)
+        if self._bus is not None:
+            for key in keys:
+                self._bus.publish(f'{self._node_id}|{key}')
+
+    def _on_invalidation(self, message):
+        node_id, _, key = message.partition('|')
+        if node_id == self._node_id:
+            return
+        if key == '*':
+            self.clear_l1()
+        else:
+            self._l1_evict([key])
+
+    def _subscribe(self):
+        # Процесс, который только читает, тоже должен получать инвалидации, иначе его L1 живет до TTL
+        if self._bus is not None:
+            self._bus.start()
+
+    def _l2_fetch(self, keys, version):
+        """
+        Значения из L2 и сколько секунд им осталось жить: {key: (value, секунд или None)}.
+
+        Запись из L2 не должна жить в L1 дольше, чем в L2. Для django-redis GET и PTTL
+        уходят одним конвейером - за одно обращение к Redis, как и обычное чтение.
+        Остальные бэкенды время жизни не сообщают, для них срок в L1 - L1_TIMEOUT.
+        """
+        l2 = self.l2
+        client = getattr(l2, 'client', None)
+        if not (hasattr(client, 'get_client') and hasattr(client, 'decode')):
+            return {key: (value, None) for key, value in l2.get_many(keys, version=version).items()}
+        pipeline = client.get_client(write=False).pipeline(transaction=False)
+        for key in keys:
+            redis_key = client.make_key(key, version=version)
+            pipeline.get(redis_key)
+            pipeline.pttl(redis_key)
+        replies = pipeline.execute()
+        # PTTL -1 - ключ без срока
+        return {
+            key: (client.decode(value), None if ms == -1 else max(ms, 0) / 1000)
+            for key, value, ms in zip(keys, replies[::2], replies[1::2]) if value is not None
+        }
+
+    def clear_l1(self):
+        with self._l1_lock:
+            self._l1.clear()
+
+    def _l1_timeout(self, timeout):
+        timeout = self.get_backend_timeout(timeout)
+        return None if timeout is None else timeout - time.time()
+
+    def get(self, key, default=None, version=None):
+        self._subscribe()
+        l1_key = self.make_and_validate_key(key, version=version)
+        value = self._l1_get(l1_key)
+        if value is not self._missing_key:
+            return value
+        found = self._l2_fetch([key], version)
+        if key not in found:
+            return default
+        value, ttl = found[key]
+        self._l1_set(l1_key, value, ttl)
+        return value
+
+    def get_many(self, keys, version=None):
+        self._subscribe()
+        found = {}
+        missing = []
+        for key in keys:
+            value = self._l1_get(self.make_and_validate_key(key, version=version))
+            if value is self._missing_key:
+                missing.append(key)
+            else:
+                found[key] = value
+        if missing:
+            for key, (value, ttl) in self._l2_fetch(missing, version).items():
+                self._l1_set(self.make_and_validate_key(key, version=version), value, ttl)
+                found[key] = value
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        l1_key = self.make_and_validate_key(key, version=version)
+        self.l2.set(key, value, timeout=self._l2_timeout(timeout), version=version)
+        self._invalidate([l1_key])
+        self._l1_set(l1_key, value, self._l1_timeout(timeout))
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.l2.set_many(data, timeout=self._l2_timeout(timeout), version=version)
+        self._invalidate([self.make_and_validate_key(key, version=version) for key in data])
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.l2.add(key, value, timeout=self._l2_timeout(timeout), version=version)
+        if added:
+            self._invalidate([self.make_and_validate_key(key, version=version)])
+        return added
+
+    def incr(self, key, delta=1, version=None):
+        value = self.l2.incr(key, delta, version=version)
+        self._invalidate([self.make_and_validate_key(key, version=version)])
+        return value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.l2.touch(key, timeout=self._l2_timeout(timeout), version=version)
+
+    def delete(self, key, version=None):
+        deleted = self.l2.delete(key, version=version)
+        self._invalidate([self.make_and_validate_key(key, version=version)])
+        return deleted
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        self.l2.delete_many(keys, version=version)
+        self._invalidate([self.make_and_validate_key(key, version=version) for key in keys])
+
+    def has_key(self, key, version=None):
+        self._subscribe()
+        if self._l1_get(self.make_and_validate_key(key, version=version)) is not self._missing_key:
+            return True
+        return self.l2.has_key(key, version=version)
+
+    def clear(self):
+        self.l2.clear()
+        self.clear_l1()
+        if self._bus is not None:
+            self._bus.publish(f'{self._node_id}|*')
+
+    def _l2_timeout(self, timeout):
+        # DEFAULT_TIMEOUT означает TIMEOUT этого кеша, а не L2
+        return self.default_timeout if timeout is DEFAULT_TIMEOUT else timeout
@@ -0,0 +1,129 @@
+"""
+Чтение каталога с реплик, запись и чтение после записи - с основной базы.
+
+ReplicaMiddleware заводит на время запроса состояние маршрутизации. Реплики
+(settings.DATABASE_REPLICAS) читают только безопасные запросы (GET, HEAD)
+и только модели приложений DATABASE_REPLICA_APPS; одна реплика выбирается
+на весь запрос. В основную базу идут:
+  - все запросы вне ReplicaMiddleware (команды, фоновые задачи);
+  - чтения внутри транзакции основной базы;
+  - чтения после записи в том же запросе (запись отмечает db_for_write);
+  - запросы в течение DATABASE_REPLICA_LAG секунд после записи в этой
+    сессии браузера (cookie), чтобы пользователь видел свои изменения,
+    пока реплика догоняет;
+  - блок use_primary() и запрос, для которого вызван pin_primary().
+
+Кешируемые значения (catalog.caching) считаются по основной базе: иначе
+отставшая реплика записала бы в кеш под новым поколением старые данные.
+"""
+import contextvars
+import random
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class RoutingState:
+    __slots__ = ('replicas', 'pinned', 'written', 'replica')
+
+    def __init__(self, replicas):
+        self.replicas = replicas
+        self.pinned = False
+        self.written = False
+        self.replica = None
+
+
+_state = contextvars.ContextVar('db_routing', default=None)
+
+
+def pin_primary():
+    """Остаток текущего запроса читает из основной базы."""
+    state = _state.get()
+    if state is not None:
+        state.pinned = True
+
+
+@contextmanager
+def use_primary():
+    token = _state.set(None)
+    try:
+        yield
+    finally:
+        _state.reset(token)
+
+
+def _replicated(model):
+    return model._meta.app_label in settings.DATABASE_REPLICA_APPS
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if (state is None or not state.replicas or state.pinned or state.written or not _replicated(model)
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        if state.replica is None:
+            state.replica = random.choice(settings.DATABASE_REPLICAS)
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None and _replicated(model):
+            state.written = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики - копии основной базы
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схема попадает на реплики репликацией (или командой sync_replicas)
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaMiddleware:
+    """Состояние маршрутизации на время запроса и cookie чтения из основной базы после записи."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        state = self.make_state(request)
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.process_response(state, response)
+
+    async def __acall__(self, request):
+        state = self.make_state(request)
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.process_response(state, response)
+
+    @staticmethod
+    def make_state(request):
+        return RoutingState(bool(settings.DATABASE_REPLICAS) and request.method in SAFE_METHODS
+                            and settings.DATABASE_PRIMARY_COOKIE not in request.COOKIES)
+
+    @staticmethod
+    def process_response(state, response):
+        if state.written and settings.DATABASE_REPLICAS:
+            response.set_cookie(settings.DATABASE_PRIMARY_COOKIE, '1', max_age=settings.DATABASE_REPLICA_LAG,
+                                httponly=True, samesite='Lax')
+        return response
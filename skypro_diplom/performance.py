@@ -0,0 +1,297 @@
+"""
+Учет запросов к БД и времени ответа по URL name.
+
+PerformanceMiddleware для каждого запроса считает число SQL-запросов, дубли
+(одинаковый SQL с одинаковыми параметрами), время в БД, время рендера шаблона
+и общее время, сверяет их с settings.PERFORMANCE_BUDGETS и копит выборку в
+кеше PERFORMANCE_CACHE_ALIAS (последние PERFORMANCE_SAMPLES_PER_VIEW запросов
+на URL name), откуда ее читают отчет для staff и команда perf_report. Кеш
+должен быть общим для процессов: perf_report запускается отдельным процессом. С PERFORMANCE_PROFILE_RATE > 0
+часть запросов профилируется cProfile, профили самых медленных сохраняются
+в PERFORMANCE_PROFILE_DIR (под ASGI профилируется только поток цикла событий).
+"""
+import cProfile
+import logging
+import os
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connections
+from django.http import JsonResponse
+
+from skypro_diplom.utils import percentile
+
+logger = logging.getLogger(__name__)
+
+SAMPLES_KEY = 'performance:samples:{}'
+VIEWS_KEY = 'performance:views'
+METRICS = ('total_ms', 'queries', 'duplicates', 'db_ms', 'template_ms')
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+def get_cache():
+    return caches[settings.PERFORMANCE_CACHE_ALIAS]
+
+
+def is_process_local():
+    """True, если замеры хранятся в памяти процесса и другой процесс их не увидит."""
+    return isinstance(get_cache(), (LocMemCache, DummyCache))
+
+
+class QueryRecorder:
+    """execute_wrapper для всех соединений: число запросов, дубли и время в БД."""
+
+    def __init__(self):
+        self.count = 0
+        self.db_time = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.count += 1
+            self.statements[sql, repr(params)] += 1
+
+    @property
+    def duplicates(self):
+        return sum(count - 1 for count in self.statements.values())
+
+
+class SampleBuffer:
+    """Накапливает замеры в процессе и сбрасывает их в кеш пачками."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = defaultdict(list)
+        self.pending_count = 0
+        self.flushed_at = time.monotonic()
+
+    def add(self, view_name, sample):
+        with self.lock:
+            self.pending[view_name].append(sample)
+            self.pending_count += 1
+            due = (self.pending_count >= settings.PERFORMANCE_FLUSH_EVERY
+                   or time.monotonic() - self.flushed_at >= settings.PERFORMANCE_FLUSH_INTERVAL)
+            if not due:
+                return
+            pending, self.pending = self.pending, defaultdict(list)
+            self.pending_count = 0
+            self.flushed_at = time.monotonic()
+        self.write(pending)
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, defaultdict(list)
+            self.pending_count = 0
+        self.write(pending)
+
+    @staticmethod
+    def write(pending):
+        if not pending:
+            return
+        limit = settings.PERFORMANCE_SAMPLES_PER_VIEW
+        cache = get_cache()
+        views = set(cache.get(VIEWS_KEY) or ())
+        for view_name, samples in pending.items():
+            key = SAMPLES_KEY.format(view_name)
+            # Чтение-запись без блокировки: при гонке часть замеров теряется, для статистики это допустимо
+            cache.set(key, ((cache.get(key) or []) + samples)[-limit:], None)
+        if not views.issuperset(pending):
+            cache.set(VIEWS_KEY, sorted(views | set(pending)), None)
+
+
+samples = SampleBuffer()
+
+
+def get_report():
+    """{URL name: {'count': n, метрика: {'p50': .., 'p95': .., 'p99': .., 'max': ..}}}."""
+    samples.flush()
+    cache = get_cache()
+    report = {}
+    for view_name in cache.get(VIEWS_KEY) or ():
+        rows = cache.get(SAMPLES_KEY.format(view_name)) or []
+        if not rows:
+            continue
+        report[view_name] = {'count': len(rows)}
+        for metric in METRICS:
+            values = [row[metric] for row in rows]
+            report[view_name][metric] = {
+                'p50': percentile(values, 50),
+                'p95': percentile(values, 95),
+                'p99': percentile(values, 99),
+                'max': max(values),
+            }
+    return report
+
+
+def reset_report():
+    cache = get_cache()
+    for view_name in cache.get(VIEWS_KEY) or ():
+        cache.delete(SAMPLES_KEY.format(view_name))
+    cache.delete(VIEWS_KEY)
+
+
+@staff_member_required
+def performance_report(request):
+    return JsonResponse(get_report(), json_dumps_params={'ensure_ascii': False})
+
+
+def get_budget(view_name):
+    budgets = settings.PERFORMANCE_BUDGETS
+    return {**budgets.get('default', {}), **budgets.get(view_name, {})}
+
+
+class ProfileKeeper:
+    """Хранит на диске профили N самых медленных запросов каждого URL name."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.slowest = defaultdict(list)
+
+    def offer(self, view_name, total_ms, profile):
+        keep = settings.PERFORMANCE_PROFILE_KEEP
+        with self.lock:
+            kept = self.slowest[view_name]
+            if len(kept) >= keep and total_ms <= kept[0][0]:
+                return
+            directory = settings.PERFORMANCE_PROFILE_DIR
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f"{view_name.replace(':', '-')}-{total_ms:.0f}ms-{time.time_ns()}.prof")
+            profile.dump_stats(path)
+            kept.append((total_ms, path))
+            kept.sort()
+            while len(kept) > keep:
+                _, removed = kept.pop(0)
+                if os.path.exists(removed):
+                    os.remove(removed)
+
+
+profiles = ProfileKeeper()
+
+
+class PerformanceMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not settings.PERFORMANCE_ENABLED:
+            return self.get_response(request)
+
+        recorder, profile = self.start(request)
+        self.attach(recorder)
+        started = time.perf_counter()
+        if profile is not None:
+            profile.enable()
+        try:
+            response = self.get_response(request)
+        finally:
+            if profile is not None:
+                profile.disable()
+            self.detach(recorder)
+        self.finish(request, recorder, profile, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        if not settings.PERFORMANCE_ENABLED:
+            return await self.get_response(request)
+
+        recorder, profile = self.start(request)
+        # Запросы к БД из async-кода выполняются в отдельном потоке со своими соединениями
+        await sync_to_async(self.attach)(recorder)
+        started = time.perf_counter()
+        if profile is not None:
+            profile.enable()
+        try:
+            response = await self.get_response(request)
+        finally:
+            if profile is not None:
+                profile.disable()
+            await sync_to_async(self.detach)(recorder)
+        self.finish(request, recorder, profile, time.perf_counter() - started)
+        return response
+
+    @staticmethod
+    def start(request):
+        request._template_started = None
+        request._template_time = 0.0
+        profile = None
+        if settings.PERFORMANCE_PROFILE_RATE and random.random() < settings.PERFORMANCE_PROFILE_RATE:
+            profile = cProfile.Profile()
+        return QueryRecorder(), profile
+
+    @staticmethod
+    def attach(recorder):
+        for connection in connections.all():
+            connection.execute_wrappers.append(recorder)
+
+    @staticmethod
+    def detach(recorder):
+        for connection in connections.all():
+            if recorder in connection.execute_wrappers:
+                connection.execute_wrappers.remove(recorder)
+
+    def finish(self, request, recorder, profile, total):
+        match = request.resolver_match
+        view_name = match.view_name if match is not None and match.view_name else 'unresolved'
+        sample = {
+            'total_ms': total * 1000,
+            'queries': recorder.count,
+            'duplicates': recorder.duplicates,
+            'db_ms': recorder.db_time * 1000,
+            'template_ms': request._template_time * 1000,
+        }
+        samples.add(view_name, sample)
+        if profile is not None:
+            profiles.offer(view_name, sample['total_ms'], profile)
+        self.check_budget(view_name, sample, recorder)
+
+    def process_template_response(self, request, response):
+        if not hasattr(request, '_template_time'):
+            # Учет выключен
+            return response
+        request._template_started = time.perf_counter()
+
+        def finished(response):
+            request._template_time += time.perf_counter() - request._template_started
+
+        response.add_post_render_callback(finished)
+        return response
+
+    def check_budget(self, view_name, sample, recorder):
+        budget = get_budget(view_name)
+        problems = [
+            f'{metric} {sample[metric]:.0f} > {budget[metric]}'
+            for metric in ('queries', 'duplicates', 'total_ms') if metric in budget and sample[metric] > budget[metric]
+        ]
+        if not problems:
+            return
+        message = f"{view_name}: превышен бюджет ({', '.join(problems)})"
+        duplicated = [sql for (sql, _), count in recorder.statements.most_common(3) if count > 1]
+        if duplicated:
+            message += '; повторяются: ' + ' | '.join(duplicated)
+        # Время в тестах нестабильно, поэтому исключение только за запросы
+        if settings.PERFORMANCE_BUDGET_RAISE and any(not problem.startswith('total_ms') for problem in problems):
+            raise BudgetExceeded(message)
+        logger.warning(message)
@@ -9,8 +9,12 @@ https://docs.djangoproject.com/en/5.0/topics/settings/
 For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
+import copy
 import os
 from pathlib import Path
+
+import django
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -42,9 +46,12 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'users',
     'catalog',
+    'tasks',
 ]
 
 MIDDLEWARE = [
+    'skypro_diplom.performance.PerformanceMiddleware',
+    'skypro_diplom.db_router.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -56,12 +63,22 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'skypro_diplom.urls'
 
+# Скомпилированные шаблоны хранятся в памяти процесса (cached.Loader): разбор
+# файла выполняется один раз. runserver сбрасывает этот кеш при изменении шаблона,
+# TEMPLATE_CACHE=0 отключает его совсем
+TEMPLATE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+if os.getenv('TEMPLATE_CACHE', '1') != '0':
+    TEMPLATE_LOADERS = [('django.template.loaders.cached.Loader', TEMPLATE_LOADERS)]
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
+            'loaders': TEMPLATE_LOADERS,
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -77,17 +94,56 @@ WSGI_APPLICATION = 'skypro_diplom.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
+# DB_ENGINE: sqlite3 (NAME_POSTGRES - путь к файлу) или postgresql
+DB_ENGINE = os.getenv('DB_ENGINE') or 'sqlite3'
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': f'django.db.backends.{DB_ENGINE}',
         'NAME': os.getenv("NAME_POSTGRES"),
         'USER': os.getenv("USER_POSTGRES"),
-        'HOST': '127.0.0.1',
-        'PORT': 5432,
+        'HOST': os.getenv('HOST_POSTGRES') or '127.0.0.1',
+        'PORT': int(os.getenv('PORT_POSTGRES') or 5432),
         'PASSWORD': os.getenv("USER_PASSWORD_POSTGRES"),
+        # Соединение живет между запросами, перед повторным использованием проверяется
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE') or 60),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Пул соединений psycopg (DB_POOL_MAX_SIZE > 0) поддерживается Django начиная с 5.1
+DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE') or 0)
+if DB_POOL_MAX_SIZE:
+    if DB_ENGINE != 'postgresql' or django.VERSION < (5, 1):
+        raise ImproperlyConfigured('DB_POOL_MAX_SIZE требует DB_ENGINE=postgresql и Django 5.1+')
+    DATABASES['default']['OPTIONS'] = {'pool': {
+        'min_size': int(os.getenv('DB_POOL_MIN_SIZE') or 1),
+        'max_size': DB_POOL_MAX_SIZE,
+        'timeout': int(os.getenv('DB_POOL_TIMEOUT') or 10),
+    }}
+    # С пулом соединения возвращаются в пул после запроса
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+
+# Реплики для чтения каталога (skypro_diplom.db_router), через запятую: для sqlite3 - пути к файлам
+# (копии основной базы делает команда sync_replicas), для postgresql - HOST или HOST:PORT
+for number, replica in enumerate(filter(None, (os.getenv('DB_REPLICAS') or '').split(',')), 1):
+    params = copy.deepcopy(DATABASES['default'])
+    if DB_ENGINE == 'sqlite3':
+        params['NAME'] = replica.strip()
+    else:
+        host, _, port = replica.strip().partition(':')
+        params.update(HOST=host, PORT=int(port) if port else params['PORT'])
+    # В тестах реплика читает тестовую основную базу
+    params['TEST'] = {'MIRROR': 'default'}
+    DATABASES[f'replica{number}'] = params
+
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_REPLICA_APPS = ('catalog',)
+DATABASE_ROUTERS = ['skypro_diplom.db_router.PrimaryReplicaRouter']
+# Сколько секунд после записи сессия читает из основной базы: не меньше отставания реплик
+DATABASE_REPLICA_LAG = int(os.getenv('DB_REPLICA_LAG') or 5)
+DATABASE_PRIMARY_COOKIE = 'db_primary'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -139,15 +195,163 @@ EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD')
 EMAIL_USE_TLS = True
 EMAIL_USE_SSL = False
 
-CACHE_ENABLED = True
+# Очередь исходящих писем (users.OutgoingEmail), отправляет команда send_outbox
+OUTBOX_MAX_ATTEMPTS = 5
+OUTBOX_RETRY_BACKOFF = 60
+OUTBOX_CLAIM_TIMEOUT = 5 * 60
+
+# Фоновые задачи (tasks.queue): выполняет команда runworker, при TASKS_EAGER=1 - сам процесс
+# после коммита транзакции, без воркера. Паузы и сроки в секундах
+TASKS_EAGER = (os.getenv('TASKS_EAGER') or '0') == '1'
+TASKS_PROCESSES = int(os.getenv('TASKS_PROCESSES') or 2)
+TASKS_MAX_ATTEMPTS = 5
+TASKS_RETRY_BACKOFF = 10
+TASKS_TIMEOUT = 5 * 60
+TASKS_CLAIM_GRACE = 60
+TASKS_POLL_INTERVAL = 1
+TASKS_KEEP_DONE = 7 * 24 * 60 * 60
+# Сколько повторять захват и запись результата задачи, пока SQLite занят другой транзакцией
+TASKS_LOCK_TIMEOUT = 30
+TASKS_LOCK_BACKOFF = 0.05
 
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'unique-snowflake',
+CACHE_ENABLED = True
+CATALOG_CACHE_TTL = 60 * 60
+PRODUCT_FRAGMENT_TIMEOUT = 60 * 15
+
+# CACHE_BACKEND=redis включает Redis (L2) с локальным LRU в каждом процессе (L1),
+# иначе используется LocMemCache
+CACHE_BACKEND = os.getenv('CACHE_BACKEND') or 'locmem'
+REDIS_URL = os.getenv('REDIS_URL') or 'redis://127.0.0.1:6379/1'
+
+if CACHE_BACKEND == 'redis':
+    CACHES = {
+        'default': {
+            'BACKEND': 'skypro_diplom.cache.TieredCache',
+            'LOCATION': 'catalog',
+            'OPTIONS': {
+                'L2': 'redis',
+                'L1_MAX_ENTRIES': int(os.getenv('CACHE_L1_MAX_ENTRIES') or 1000),
+                'L1_TIMEOUT': float(os.getenv('CACHE_L1_TIMEOUT') or 5),
+                'INVALIDATION_BUS': 'skypro_diplom.cache.RedisInvalidationBus',
+                'INVALIDATION_OPTIONS': {'cache_alias': 'redis'},
+            },
+        },
+        'redis': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': REDIS_URL,
+            'OPTIONS': {
+                'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+                'COMPRESSOR': 'django_redis.compressors.zlib.ZlibCompressor',
+                'SOCKET_CONNECT_TIMEOUT': 5,
+                'SOCKET_TIMEOUT': 5,
+                'CONNECTION_POOL_KWARGS': {
+                    'max_connections': int(os.getenv('REDIS_MAX_CONNECTIONS') or 50),
+                    'retry_on_timeout': True,
+                    'health_check_interval': 30,
+                },
+            },
+        },
     }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'unique-snowflake',
+        },
+        # Замеры skypro_diplom.performance: у LocMemCache каждый процесс видел бы только свои
+        'performance': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv('PERFORMANCE_SAMPLES_DIR') or os.path.join(BASE_DIR, 'perf_samples'),
+        },
+    }
+
+# Сессии: cached_db читает сессию из кеша и пишет в кеш и БД. По умолчанию включен
+# только с Redis: LocMemCache у каждого процесса свой, и выход в одном процессе
+# не сбросил бы сессию, закешированную в другом
+SESSION_ENGINE = 'django.contrib.sessions.backends.' + (
+    os.getenv('SESSION_ENGINE') or ('cached_db' if CACHE_BACKEND == 'redis' else 'db'))
+# Сессии хранятся в Redis напрямую, мимо локального L1
+SESSION_CACHE_ALIAS = 'redis' if CACHE_BACKEND == 'redis' else 'default'
+
+# Пользователь сессии берется из кеша (users.services.user_cache), 0 - отключено
+USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL') or 300)
+
+# PASSWORD_HASHER=scrypt|argon2|pbkdf2 - алгоритм новых хешей паролей. По замерам benchmarks.bench_auth
+# проверка пароля scrypt занимает ~55 мс против ~300 мс у PBKDF2 и ~270 мс у Argon2 с настройками Django.
+# Остальные алгоритмы остаются в списке: старые хеши проверяются ими и пересчитываются при входе
+PASSWORD_HASHER = os.getenv('PASSWORD_HASHER') or 'scrypt'
+_PASSWORD_HASHERS = {
+    'pbkdf2': 'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'scrypt': 'django.contrib.auth.hashers.ScryptPasswordHasher',
+    'argon2': 'django.contrib.auth.hashers.Argon2PasswordHasher',
 }
+PASSWORD_HASHERS = [
+    _PASSWORD_HASHERS[PASSWORD_HASHER],
+    *(hasher for name, hasher in _PASSWORD_HASHERS.items() if name != PASSWORD_HASHER),
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+]
+
+# Уменьшенные копии картинок продуктов (catalog.images), ширины в пикселях
+PRODUCT_IMAGE_PRESETS = {
+    'card': {'widths': (320, 640), 'sizes': '(min-width: 768px) 33vw, 100vw'},
+    'detail': {'widths': (600, 1200), 'sizes': '(min-width: 768px) 50vw, 100vw'},
+}
+
+# Async-представления списка и карточек продуктов (имеет смысл только под ASGI)
+CATALOG_ASYNC_VIEWS = (os.getenv('CATALOG_ASYNC_VIEWS') or '0') == '1'
+
+# Складской учет (catalog.stock): сколько секунд повторять операцию, пока SQLite занят другой
+# транзакцией, и возраст движений (секунд), которые попадают в снимок остатков
+STOCK_LOCK_TIMEOUT = 30
+STOCK_LOCK_BACKOFF = 0.01
+STOCK_SNAPSHOT_LAG = 60
+
+# Выгрузка журнала изменений отдает записи старше стольких секунд (catalog.changes)
+CATALOG_CHANGES_LAG = int(os.getenv('CATALOG_CHANGES_LAG') or 10)
+
+# Входит в ETag страниц каталога (catalog.conditional): меняется при выкладке, чтобы браузеры
+# не получали 304 на страницы, сверстанные прежними шаблонами
+CONDITIONAL_GET_VERSION = os.getenv('CONDITIONAL_GET_VERSION') or ''
+
+# Максимум операций в одном запросе пакетного API продуктов
+PRODUCT_BATCH_MAX_OPERATIONS = 1000
+
+# Границы диапазонов цен для фасетов поиска
+SEARCH_PRICE_BUCKETS = (0, 100, 500, 1000, 5000)
+
+# Учет запросов к БД и времени ответа (skypro_diplom.performance), по умолчанию только при DEBUG:
+# каждый запрос к БД проходит через обертку, а замеры пишутся в кеш.
+# Бюджеты по URL name, 'default' - для всех; превышение пишется в лог, при
+# PERFORMANCE_BUDGET_RAISE=1 (например, в CI) превышение по числу запросов вызывает исключение
+PERFORMANCE_ENABLED = (os.getenv('PERFORMANCE_ENABLED') or ('1' if DEBUG else '0')) == '1'
+PERFORMANCE_BUDGETS = {
+    'default': {'queries': 30, 'duplicates': 5, 'total_ms': 500},
+}
+PERFORMANCE_BUDGET_RAISE = os.getenv('PERFORMANCE_BUDGET_RAISE') == '1'
+# Кеш замеров, общий для всех процессов: их пишут воркеры сервера, а читает команда perf_report
+PERFORMANCE_CACHE_ALIAS = 'redis' if CACHE_BACKEND == 'redis' else 'performance'
+PERFORMANCE_SAMPLES_PER_VIEW = 1000
+PERFORMANCE_FLUSH_EVERY = 50
+PERFORMANCE_FLUSH_INTERVAL = 10
+# Доля запросов, профилируемых cProfile, и сколько самых медленных профилей хранить на URL name
+PERFORMANCE_PROFILE_RATE = float(os.getenv('PERFORMANCE_PROFILE_RATE') or 0)
+PERFORMANCE_PROFILE_KEEP = 5
+PERFORMANCE_PROFILE_DIR = os.getenv('PERFORMANCE_PROFILE_DIR') or os.path.join(BASE_DIR, 'profiles')
+
+# Запрещенные слова в названиях и описаниях продуктов, у каждой формы свой список (catalog.moderation).
+# Слова из файла BANNED_WORDS_FILE (по слову на строку) добавляются ко всем спискам
+BANNED_WORDS = {
+    # ProductCreateForm и пакетный API
+    'en': ['casino', 'cryptocurrency', 'crypto', 'exchange', 'cheap', 'free', 'scam', 'police', 'radar'],
+    # ProductForm
+    'ru': ['казино', 'криптовалюта', 'крипта', 'биржа', 'дешево', 'бесплатно', 'обман', 'полиция', 'радар'],
+}
+BANNED_WORDS_FILE = os.getenv('BANNED_WORDS_FILE')
+
 AUTH_USER_MODEL = 'users.User'
+# Права и пользователь сессии кешируются (users.services.permissions, users.services.user_cache)
+AUTHENTICATION_BACKENDS = ['users.backends.CachedModelBackend']
 LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/'
 # LOGIN_URL = 'users:login'
@@ -156,6 +360,27 @@ LOGOUT_REDIRECT_URL = '/'
 
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
+# Сюда collectstatic собирает файлы с хешем в имени и их сжатые варианты (.gz, .br)
+STATIC_ROOT = os.getenv('STATIC_ROOT') or os.path.join(BASE_DIR, 'staticfiles')
+
+# Загрузки пользователей, имена с хешем содержимого (skypro_diplom.storage).
+# Раньше файлы лежали в корне проекта (./products/): при обновлении существующей
+# установки каталог products/ нужно перенести в MEDIA_ROOT, имена в базе не меняются
+MEDIA_URL = '/media/'
+MEDIA_ROOT = os.getenv('MEDIA_ROOT') or os.path.join(BASE_DIR, 'media')
+
+STORAGES = {
+    'default': {'BACKEND': 'skypro_diplom.storage.HashedMediaStorage'},
+    'staticfiles': {'BACKEND': 'skypro_diplom.storage.CompressedManifestStaticFilesStorage'},
+}
+
+# Отдача статики и медиа приложением (skypro_diplom.assets), по умолчанию только при DEBUG:
+# в продакшене /static/ и /media/ отдает веб-сервер, SERVE_ASSETS=1 включает отдачу Django.
+# ASSET_SENDFILE: '' - отдает Django, 'x-accel' - nginx по X-Accel-Redirect на ASSET_ACCEL_PREFIX,
+# 'x-sendfile' - Apache/lighttpd
+SERVE_ASSETS = (os.getenv('SERVE_ASSETS') or ('1' if DEBUG else '0')) == '1'
+ASSET_SENDFILE = os.getenv('ASSET_SENDFILE') or ''
+ASSET_ACCEL_PREFIX = os.getenv('ASSET_ACCEL_PREFIX') or '/internal/'
 
 CSRF_COOKIE_SECURE = False
 CSRF_COOKIE_HTTPONLY = False
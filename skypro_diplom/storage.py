@@ -0,0 +1,104 @@
+"""
+Хранилища статики и медиа с хешем содержимого в именах файлов.
+
+Статика: ManifestStaticFilesStorage (collectstatic пишет css/site.<хеш>.css
+и манифест), а текстовые файлы дополнительно сжимаются в .gz и .br рядом
+с оригиналом - при отдаче не тратится время на сжатие. Если файла нет
+в манифесте (collectstatic не запускался, например в тестах), {% static %}
+отдает имя без хеша вместо ошибки.
+
+Медиа: загрузка сохраняется как products/photo.<хеш>.jpg, одинаковые файлы
+хранятся один раз. Имена, в которых хеш уже есть (копии картинок
+catalog.images), сохраняются как есть.
+
+Файлы с хешем в имени никогда не меняются, skypro_diplom.assets отдает их
+с Cache-Control: immutable.
+"""
+import gzip
+import hashlib
+import os
+import re
+
+import brotli
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile, File
+from django.core.files.storage import FileSystemStorage
+
+HASH_LENGTH = 12
+# photo.0123456789ab.jpg (статика и загрузки) или products/thumbs/<16 знаков>/640.webp (копии картинок)
+HASHED_NAME = re.compile(r'\.[0-9a-f]{12}\.[^/.]+$|(^|/)thumbs/[0-9a-f]{16}/[^/]+$')
+
+COMPRESSIBLE = ('.css', '.js', '.mjs', '.json', '.map', '.svg', '.txt', '.xml', '.html', '.ico')
+COMPRESS_MIN_SIZE = 256
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def is_hashed(name):
+    return bool(HASHED_NAME.search(name))
+
+
+def compress(content):
+    """{суффикс: сжатое содержимое} для вариантов, которые меньше исходного."""
+    variants = {
+        '.br': brotli.compress(content, quality=11),
+        '.gz': gzip.compress(content, compresslevel=9, mtime=0),
+    }
+    return {suffix: data for suffix, data in variants.items() if len(data) < len(content)}
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    manifest_strict = False
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            # Файла нет ни в манифесте, ни на диске
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        hashed_names = set()
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            if hashed_name and not isinstance(processed, Exception):
+                hashed_names.add(hashed_name)
+            yield name, hashed_name, processed
+        if dry_run:
+            return
+        for hashed_name in sorted(hashed_names):
+            if hashed_name.endswith(COMPRESSIBLE):
+                self.compress_file(hashed_name)
+
+    def compress_file(self, name):
+        with self.open(name) as f:
+            content = f.read()
+        if len(content) < COMPRESS_MIN_SIZE:
+            return
+        for suffix, data in compress(content).items():
+            if self.exists(name + suffix):
+                self.delete(name + suffix)
+            self._save(name + suffix, ContentFile(data))
+
+
+class HashedMediaStorage(FileSystemStorage):
+    def hashed_name(self, name, content, max_length=None):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        root, ext = os.path.splitext(name)
+        suffix = f'.{digest.hexdigest()[:HASH_LENGTH]}{ext}'
+        if max_length is not None:
+            root = root[:max_length - len(suffix)]
+        return root + suffix
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        if not is_hashed(name):
+            name = self.hashed_name(name, content, max_length)
+            if self.exists(name):
+                # Такой же файл уже загружен
+                return name
+        return super().save(name, content, max_length)
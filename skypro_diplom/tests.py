@@ -0,0 +1,404 @@
+import gzip
+import io
+import os
+import shutil
+import tempfile
+import time
+from unittest import mock
+
+import brotli
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache, caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import CommandError, call_command
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.templatetags.static import static
+from django.urls import reverse
+
+from catalog.conditional import get_validators
+from catalog.models import Product
+from skypro_diplom import performance
+from skypro_diplom.cache import TieredCache
+from skypro_diplom.db_router import PrimaryReplicaRouter, ReplicaMiddleware, pin_primary, use_primary
+
+TIERED_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'shared',
+    },
+}
+
+
+def make_tiered_cache(**options):
+    params = {
+        'OPTIONS': {
+            'L2': 'shared',
+            'L1_TIMEOUT': 60,
+            'INVALIDATION_BUS': 'skypro_diplom.cache.LocalInvalidationBus',
+            'INVALIDATION_CHANNEL': 'test',
+            **options,
+        },
+    }
+    return TieredCache('test', params)
+
+
+class FakeRedisClient:
+    """Клиент django-redis в объеме, который использует TieredCache: конвейер GET/PTTL."""
+
+    def __init__(self, data, pttl_ms):
+        self.data = data
+        self.pttl_ms = pttl_ms
+        self.executed = 0
+
+    def make_key(self, key, version=None):
+        return key
+
+    def decode(self, value):
+        return value
+
+    def get_client(self, write=True):
+        return self
+
+    def pipeline(self, transaction=True):
+        commands = []
+        client = self
+
+        class Pipeline:
+            def get(self, key):
+                commands.append(client.data.get(key))
+
+            def pttl(self, key):
+                commands.append(client.pttl_ms if key in client.data else -2)
+
+            def execute(self):
+                client.executed += 1
+                return commands
+
+        return Pipeline()
+
+
+@override_settings(CACHES=TIERED_CACHES)
+class TieredCacheTests(SimpleTestCase):
+    def setUp(self):
+        caches['shared'].clear()
+        # Два экземпляра имитируют два воркера с общим L2
+        self.first = make_tiered_cache()
+        self.second = make_tiered_cache()
+
+    def test_read_through_and_l1_hit(self):
+        self.first.set('key', 'value')
+        self.assertEqual(self.second.get('key'), 'value')
+        with mock.patch.object(caches['shared'], 'get') as l2_get:
+            self.assertEqual(self.second.get('key'), 'value')
+        l2_get.assert_not_called()
+
+    def test_write_invalidates_other_l1(self):
+        self.first.set('key', 'old')
+        self.assertEqual(self.second.get('key'), 'old')
+        self.first.set('key', 'new')
+        self.assertEqual(self.second.get('key'), 'new')
+
+    def test_incr_and_delete_invalidate_other_l1(self):
+        self.first.set('counter', 1)
+        self.assertEqual(self.second.get('counter'), 1)
+        self.first.incr('counter')
+        self.assertEqual(self.second.get('counter'), 2)
+        self.first.delete('counter')
+        self.assertIsNone(self.second.get('counter'))
+
+    def test_get_many_mixes_tiers(self):
+        self.first.set_many({'a': 1, 'b': 2})
+        self.second.get('a')
+        self.assertEqual(self.second.get_many(['a', 'b', 'c']), {'a': 1, 'b': 2})
+
+    def test_add_goes_to_l2(self):
+        self.assertTrue(self.first.add('lock', 1))
+        self.assertFalse(self.second.add('lock', 1))
+
+    def test_lru_eviction(self):
+        cache = make_tiered_cache(L1_MAX_ENTRIES=2, INVALIDATION_BUS=None)
+        for key in ('a', 'b', 'c'):
+            cache.set(key, key)
+        self.assertEqual(list(cache._l1), [cache.make_key('b'), cache.make_key('c')])
+        self.assertEqual(cache.get('a'), 'a')
+
+    def test_l1_returns_copies(self):
+        self.first.set('list', [1])
+        self.first.get('list').append(2)
+        self.assertEqual(self.first.get('list'), [1])
+
+    def test_l1_does_not_outlive_l2(self):
+        client = FakeRedisClient({'a': 'value', 'b': 'other'}, pttl_ms=500)
+        with mock.patch.object(caches['shared'], 'client', client, create=True):
+            self.assertEqual(self.second.get('a'), 'value')
+            self.assertEqual(self.second.get_many(['b', 'c']), {'b': 'other'})
+        # GET и PTTL - одно обращение к Redis на каждое чтение из L2
+        self.assertEqual(client.executed, 2)
+        for key in ('a', 'b'):
+            expires_at, _ = self.second._l1[self.second.make_key(key)]
+            self.assertLessEqual(expires_at - time.monotonic(), 0.5)
+
+    def test_reader_subscribes_to_invalidations(self):
+        with mock.patch('skypro_diplom.cache.RedisInvalidationBus.start') as start:
+            reader = make_tiered_cache(INVALIDATION_BUS='skypro_diplom.cache.RedisInvalidationBus')
+            reader.get('key')
+        start.assert_called()
+
+    def test_clear(self):
+        self.first.set('key', 'value')
+        self.second.get('key')
+        self.first.clear()
+        self.assertIsNone(self.second.get('key'))
+
+
+class PerformanceMiddlewareTests(TestCase):
+    def setUp(self):
+        # Замеры пишутся во временный файловый кеш, а не в perf_samples проекта
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        samples_cache = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory}
+        settings_override = override_settings(CACHES={**settings.CACHES, 'performance': samples_cache},
+                                              PERFORMANCE_CACHE_ALIAS='performance', PERFORMANCE_ENABLED=True)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        cache.clear()
+        performance.samples.flush()
+        performance.reset_report()
+
+    def test_records_samples_per_url_name(self):
+        self.client.get(reverse('catalog:home'))
+        self.client.get(reverse('catalog:home'))
+        stats = performance.get_report()['catalog:home']
+        self.assertEqual(stats['count'], 2)
+        self.assertGreater(stats['queries']['p50'], 0)
+        self.assertGreater(stats['template_ms']['max'], 0)
+        self.assertGreaterEqual(stats['total_ms']['p99'], stats['db_ms']['p99'])
+
+    def test_counts_duplicate_queries(self):
+        recorder = performance.QueryRecorder()
+        for sql in ('SELECT 1', 'SELECT 1', 'SELECT 2'):
+            recorder(lambda *args: None, sql, (), False, {})
+        self.assertEqual(recorder.count, 3)
+        self.assertEqual(recorder.duplicates, 1)
+
+    @override_settings(PERFORMANCE_BUDGETS={'catalog:home': {'queries': 0}}, PERFORMANCE_BUDGET_RAISE=True)
+    def test_budget_raises_in_tests(self):
+        with self.assertRaises(performance.BudgetExceeded):
+            self.client.get(reverse('catalog:home'))
+
+    @override_settings(PERFORMANCE_BUDGETS={'catalog:home': {'queries': 0}}, PERFORMANCE_BUDGET_RAISE=False)
+    def test_budget_logged_in_production(self):
+        with self.assertLogs('skypro_diplom.performance', 'WARNING') as logs:
+            response = self.client.get(reverse('catalog:home'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('catalog:home', logs.output[0])
+
+    @override_settings(PERFORMANCE_BUDGETS={'default': {'total_ms': 0}}, PERFORMANCE_BUDGET_RAISE=True)
+    def test_latency_budget_only_logged(self):
+        with self.assertLogs('skypro_diplom.performance', 'WARNING'):
+            self.client.get(reverse('catalog:home'))
+
+    def test_profiles_slowest_requests(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(PERFORMANCE_PROFILE_RATE=1, PERFORMANCE_PROFILE_DIR=directory,
+                                   PERFORMANCE_PROFILE_KEEP=2):
+                for _ in range(4):
+                    self.client.get(reverse('catalog:home'))
+            self.assertEqual(len(os.listdir(directory)), 2)
+        performance.profiles.slowest.clear()
+
+    def test_samples_visible_to_other_process(self):
+        self.client.get(reverse('catalog:home'))
+        performance.samples.flush()
+        self.assertFalse(performance.is_process_local())
+        # Новый экземпляр бэкенда - как в процессе команды perf_report
+        other = caches.create_connection(settings.PERFORMANCE_CACHE_ALIAS)
+        self.assertIn('catalog:home', other.get(performance.VIEWS_KEY))
+
+    @override_settings(PERFORMANCE_CACHE_ALIAS='local', CACHES={
+        **settings.CACHES, 'local': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_report_command_refuses_process_local_cache(self):
+        with self.assertRaises(CommandError):
+            call_command('perf_report', stdout=io.StringIO())
+
+    def test_report_is_staff_only(self):
+        self.client.get(reverse('catalog:home'))
+        user = get_user_model().objects.create_user(email='staff@example.com', password='password123')
+        self.client.force_login(user)
+        response = self.client.get(reverse('performance_report'))
+        self.assertEqual(response.status_code, 302)
+
+        user.is_staff = True
+        user.save()
+        response = self.client.get(reverse('performance_report'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('catalog:home', response.json())
+
+    def test_command_prints_percentiles(self):
+        self.client.get(reverse('catalog:home'))
+        out = io.StringIO()
+        call_command('perf_report', '--reset', stdout=out)
+        self.assertIn('catalog:home', out.getvalue())
+        self.assertIn('p95', out.getvalue())
+        self.assertEqual(performance.get_report(), {})
+
+
+class AssetPipelineTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        source = os.path.join(directory.name, 'source')
+        os.makedirs(os.path.join(source, 'css'))
+        self.css = b''.join(b'.card-%d { margin: %dpx; }\n' % (i, i) for i in range(100))
+        with open(os.path.join(source, 'css', 'site.css'), 'wb') as f:
+            f.write(self.css)
+        # Без статики admin: collectstatic обрабатывает только файл теста
+        settings_override = self.settings(STATICFILES_DIRS=[source],
+                                           STATICFILES_FINDERS=['django.contrib.staticfiles.finders.FileSystemFinder'],
+                                           STATIC_ROOT=os.path.join(directory.name, 'static'),
+                                           MEDIA_ROOT=os.path.join(directory.name, 'media'))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+        self.url = static('css/site.css')
+
+    def test_collectstatic_hashes_and_precompresses(self):
+        self.assertRegex(self.url, r'^/static/css/site\.[0-9a-f]{12}\.css$')
+        name = self.url[len('/static/'):]
+        self.assertTrue(staticfiles_storage.exists(name + '.gz'))
+        self.assertTrue(staticfiles_storage.exists(name + '.br'))
+
+    def test_hashed_static_is_immutable_and_precompressed(self):
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip, deflate, br')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(brotli.decompress(b''.join(response.streaming_content)), self.css)
+
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), self.css)
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get('/static/css/site.css')
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertEqual(b''.join(response.streaming_content), self.css)
+
+    def test_range_requests(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(self.css)}')
+        self.assertEqual(b''.join(response.streaming_content), self.css[10:20])
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-5')
+        self.assertEqual(b''.join(response.streaming_content), self.css[-5:])
+
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.css)}-')
+        self.assertEqual(response.status_code, 416)
+
+        # If-Range с другим ETag: файл изменился, отдается целиком
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"other"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.css)
+
+    def test_missing_and_outside_files(self):
+        self.assertEqual(self.client.get('/static/css/missing.css').status_code, 404)
+        self.assertEqual(self.client.get('/media/../static/css/site.css').status_code, 404)
+
+    @override_settings(ASSET_SENDFILE='x-accel', ASSET_ACCEL_PREFIX='/internal/')
+    def test_x_accel_redirect(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], '/internal' + self.url)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['Content-Type'], 'text/css')
+
+    def test_media_names_contain_content_hash(self):
+        name = default_storage.save('products/photo.jpg', ContentFile(b'image'))
+        self.assertRegex(name, r'^products/photo\.[0-9a-f]{12}\.jpg$')
+        self.assertEqual(default_storage.save('products/photo.jpg', ContentFile(b'image')), name)
+        self.assertNotEqual(default_storage.save('products/photo.jpg', ContentFile(b'other')), name)
+        thumb = 'products/thumbs/0123456789abcdef/320.webp'
+        self.assertEqual(default_storage.save(thumb, ContentFile(b'thumb')), thumb)
+
+        response = self.client.get(default_storage.url(name))
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(b''.join(response.streaming_content), b'image')
+
+
+@override_settings(DATABASE_REPLICAS=['replica1', 'replica2'], DATABASE_REPLICA_LAG=5)
+class ReplicaRoutingTests(SimpleTestCase):
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+        self.factory = RequestFactory()
+
+    def route(self, request, *actions):
+        """Выполняет actions внутри ReplicaMiddleware, возвращает (базы чтения Product по шагам, ответ)."""
+        reads = []
+
+        def view(request):
+            for action in actions:
+                action()
+                reads.append(self.router.db_for_read(Product))
+            return HttpResponse()
+
+        response = ReplicaMiddleware(view)(request)
+        return reads, response
+
+    def test_safe_requests_read_catalog_from_one_replica(self):
+        reads, response = self.route(self.factory.get('/'), lambda: None, lambda: None)
+        self.assertIn(reads[0], ('replica1', 'replica2'))
+        self.assertEqual(reads[0], reads[1])
+        self.assertNotIn(settings.DATABASE_PRIMARY_COOKIE, response.cookies)
+
+    def test_users_and_requests_outside_middleware_use_primary(self):
+        self.assertEqual(self.router.db_for_read(Product), 'default')
+        reads = []
+        ReplicaMiddleware(lambda request: reads.append(self.router.db_for_read(get_user_model())) or HttpResponse())(
+            self.factory.get('/'))
+        self.assertEqual(reads, ['default'])
+
+    def test_read_after_write_is_sticky(self):
+        reads, response = self.route(self.factory.get('/'), lambda: None,
+                                     lambda: self.router.db_for_write(Product), lambda: None)
+        self.assertNotEqual(reads[0], 'default')
+        self.assertEqual(reads[1:], ['default', 'default'])
+        cookie = response.cookies[settings.DATABASE_PRIMARY_COOKIE]
+        self.assertEqual(cookie['max-age'], 5)
+
+        request = self.factory.get('/')
+        request.COOKIES[settings.DATABASE_PRIMARY_COOKIE] = '1'
+        self.assertEqual(self.route(request, lambda: None)[0], ['default'])
+
+    def test_unsafe_methods_pinned_and_recent_changes_use_primary(self):
+        self.assertEqual(self.route(self.factory.post('/'), lambda: None)[0], ['default'])
+        self.assertEqual(self.route(self.factory.get('/'), pin_primary)[0], ['default'])
+
+        def inside_use_primary():
+            with use_primary():
+                reads.append(self.router.db_for_read(Product))
+
+        reads = []
+        self.route(self.factory.get('/'), inside_use_primary)
+        self.assertEqual(reads, ['default'])
+
+        cache.clear()
+        # Поколение, впервые встреченное только что, могло еще не дойти до реплики
+        reads, _ = self.route(self.factory.get('/'), lambda: get_validators(self.factory.get('/'), ['product']))
+        self.assertEqual(reads, ['default'])
+        with mock.patch('catalog.conditional.time.time', return_value=time.time() + 10):
+            reads, _ = self.route(self.factory.get('/'), lambda: get_validators(self.factory.get('/'), ['product']))
+        self.assertNotEqual(reads, ['default'])
+
+    def test_writes_and_migrations_go_to_primary(self):
+        self.assertEqual(self.router.db_for_write(Product), 'default')
+        self.assertTrue(self.router.allow_migrate('default', 'catalog'))
+        self.assertFalse(self.router.allow_migrate('replica1', 'catalog'))
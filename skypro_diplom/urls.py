@@ -14,11 +14,26 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import re
+
+from django.conf import settings
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
+
+from skypro_diplom.assets import serve_media, serve_static
+from skypro_diplom.performance import performance_report
 
 urlpatterns = [
+    path('admin/performance/', performance_report, name='performance_report'),
     path('admin/', admin.site.urls),
     path('', include('catalog.urls', namespace='catalog')),
     path('users/', include('users.urls', namespace='users')),
 ]
+
+# Статика и медиа с долгим кешированием (skypro_diplom.assets); за nginx можно отключить
+# или передавать отдачу ему через ASSET_SENDFILE
+if settings.SERVE_ASSETS:
+    urlpatterns += [
+        re_path(r'^%s(?P<path>.+)$' % re.escape(settings.STATIC_URL.lstrip('/')), serve_static, name='static'),
+        re_path(r'^%s(?P<path>.+)$' % re.escape(settings.MEDIA_URL.lstrip('/')), serve_media, name='media'),
+    ]
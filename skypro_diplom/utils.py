@@ -0,0 +1,41 @@
+"""Вспомогательные функции, общие для приложений проекта."""
+import functools
+import random
+import time
+
+from django.conf import settings
+from django.db import OperationalError, transaction
+
+
+def percentile(values, q):
+    values = sorted(values)
+    if not values:
+        return None
+    index = min(len(values) - 1, max(0, round(q / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def retry_locked(timeout_setting, backoff_setting):
+    """
+    Декоратор: повторяет операцию, если SQLite занят другой транзакцией.
+
+    timeout_setting и backoff_setting - имена настроек: сколько секунд повторять
+    и начальная пауза между попытками. Внутри atomic-блока ошибка не перехватывается:
+    повторять нужно всю внешнюю транзакцию.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            deadline = time.monotonic() + getattr(settings, timeout_setting)
+            attempt = 0
+            while True:
+                try:
+                    return func(*args, **kwargs)
+                except OperationalError as e:
+                    if ('locked' not in str(e) or transaction.get_connection().in_atomic_block
+                            or time.monotonic() >= deadline):
+                        raise
+                time.sleep(random.uniform(0, getattr(settings, backoff_setting) * 2 ** min(attempt, 5)))
+                attempt += 1
+        return wrapper
+    return decorator
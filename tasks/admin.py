@@ -0,0 +1,17 @@
+from django.contrib import admin
+
+from tasks.models import Task
+from tasks.queue import requeue
+
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ('name', 'queue', 'status', 'attempts', 'run_after', 'wait_ms', 'duration_ms', 'finished_at')
+    list_filter = ('status', 'queue', 'name')
+    readonly_fields = ('attempts', 'claimed_by', 'last_error', 'started_at', 'finished_at', 'wait_ms', 'duration_ms')
+    actions = ('requeue_tasks',)
+
+    @admin.action(description='Вернуть в очередь')
+    def requeue_tasks(self, request, queryset):
+        count = requeue(queryset)
+        self.message_user(request, f'Возвращено в очередь: {count}')
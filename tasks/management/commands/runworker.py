@@ -0,0 +1,39 @@
+import signal
+
+from django.conf import settings
+from django.core.management import BaseCommand
+
+from tasks.worker import Worker
+
+
+class Command(BaseCommand):
+    help = 'Выполнение фоновых задач из очереди в пуле процессов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=settings.TASKS_PROCESSES,
+                            help='размер пула процессов, 0 - выполнять задачи в этом процессе')
+        parser.add_argument('--queue', action='append', dest='queues', help='только эти очереди (можно несколько)')
+        parser.add_argument('--burst', action='store_true', help='завершиться, когда очередь опустеет')
+        parser.add_argument('--interval', type=float, default=settings.TASKS_POLL_INTERVAL,
+                            help='пауза между опросами пустой очереди, секунд')
+        parser.add_argument('--max-tasks-per-child', type=int, default=None,
+                            help='перезапускать процесс пула после стольких задач')
+
+    def handle(self, *args, **options):
+        worker = Worker(processes=options['processes'], queues=options['queues'], burst=options['burst'],
+                        poll_interval=options['interval'], max_tasks_per_child=options['max_tasks_per_child'],
+                        stdout=self.stdout if options['verbosity'] > 1 else None)
+        # Останавливаемся мягко: новые задачи не берутся, начатые завершаются
+        previous = {signum: signal.signal(signum, worker.stop) for signum in (signal.SIGTERM, signal.SIGINT)}
+        try:
+            summary = worker.run()
+        finally:
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
+        if not summary:
+            self.stdout.write('Задач не было')
+            return
+        self.stdout.write(f"{'задача':<48}{'готово':>8}{'повтор':>8}{'dead':>6}{'p50':>9}{'p95':>9}{'max':>9}")
+        for name, row in summary.items():
+            timings = ''.join(f'{row[key] or 0:>9.0f}' for key in ('p50_ms', 'p95_ms', 'max_ms'))
+            self.stdout.write(f"{name:<48}{row['done']:>8}{row['retry']:>8}{row['dead']:>6}{timings}")
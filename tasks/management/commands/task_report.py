@@ -0,0 +1,22 @@
+from django.core.management import BaseCommand
+
+from tasks.queue import get_stats
+
+
+class Command(BaseCommand):
+    help = 'Состояние очереди и перцентили времени выполнения и ожидания по задачам'
+
+    def handle(self, *args, **options):
+        stats = get_stats()
+        if not stats:
+            self.stdout.write('Задач нет')
+            return
+        self.stdout.write(f"{'задача':<48}{'ждет':>6}{'идет':>6}{'готово':>8}{'dead':>6}{'повторов':>10}  "
+                          f"{'метрика':<12}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+        for name, row in sorted(stats.items()):
+            counts = f"{name:<48}{row['pending']:>6}{row['running']:>6}{row['done']:>8}{row['dead']:>6}" \
+                     f"{row['retries']:>10}"
+            for i, metric in enumerate(('duration_ms', 'wait_ms')):
+                values = row.get(metric)
+                timings = ''.join(f'{(values or {}).get(p) or 0:>9.0f}' for p in ('p50', 'p95', 'p99', 'max'))
+                self.stdout.write(f"{counts if i == 0 else '':<84}  {metric:<12}{timings}")
@@ -0,0 +1,42 @@
+# Generated by Django 5.0.6 on 2026-10-18 12:00
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Task',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, verbose_name='задача')),
+                ('queue', models.CharField(default='default', max_length=50, verbose_name='очередь')),
+                ('args', models.JSONField(blank=True, default=list, verbose_name='аргументы')),
+                ('kwargs', models.JSONField(blank=True, default=dict, verbose_name='именованные аргументы')),
+                ('priority', models.SmallIntegerField(default=0, verbose_name='приоритет')),
+                ('status', models.CharField(choices=[('pending', 'ожидает'), ('running', 'выполняется'), ('done', 'выполнена'), ('dead', 'не выполнена')], default='pending', max_length=10, verbose_name='статус')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='попыток')),
+                ('max_attempts', models.PositiveIntegerField(default=1, verbose_name='попыток максимум')),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now, verbose_name='выполнить после')),
+                ('claimed_by', models.CharField(blank=True, max_length=32, verbose_name='метка воркера')),
+                ('last_error', models.TextField(blank=True, verbose_name='последняя ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='создана')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='начата')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='завершена')),
+                ('wait_ms', models.FloatField(blank=True, null=True, verbose_name='ожидание, мс')),
+                ('duration_ms', models.FloatField(blank=True, null=True, verbose_name='выполнение, мс')),
+            ],
+            options={
+                'verbose_name': 'фоновая задача',
+                'verbose_name_plural': 'фоновые задачи',
+                'indexes': [models.Index(fields=['status', 'run_after'], name='tasks_task_status_03f913_idx'), models.Index(fields=['claimed_by'], name='tasks_task_claimed_fe82d3_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+from django.db import models
+from django.utils import timezone
+
+
+class Task(models.Model):
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_DEAD = 'dead'
+    STATUS_CHOICES = (
+        (STATUS_PENDING, 'ожидает'),
+        (STATUS_RUNNING, 'выполняется'),
+        (STATUS_DONE, 'выполнена'),
+        (STATUS_DEAD, 'не выполнена'),
+    )
+
+    name = models.CharField(max_length=200, verbose_name='задача')
+    queue = models.CharField(max_length=50, default='default', verbose_name='очередь')
+    args = models.JSONField(default=list, blank=True, verbose_name='аргументы')
+    kwargs = models.JSONField(default=dict, blank=True, verbose_name='именованные аргументы')
+    priority = models.SmallIntegerField(default=0, verbose_name='приоритет')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING, verbose_name='статус')
+    attempts = models.PositiveIntegerField(default=0, verbose_name='попыток')
+    max_attempts = models.PositiveIntegerField(default=1, verbose_name='попыток максимум')
+    run_after = models.DateTimeField(default=timezone.now, verbose_name='выполнить после')
+    claimed_by = models.CharField(max_length=32, blank=True, verbose_name='метка воркера')
+    last_error = models.TextField(blank=True, verbose_name='последняя ошибка')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='создана')
+    started_at = models.DateTimeField(blank=True, null=True, verbose_name='начата')
+    finished_at = models.DateTimeField(blank=True, null=True, verbose_name='завершена')
+    wait_ms = models.FloatField(blank=True, null=True, verbose_name='ожидание, мс')
+    duration_ms = models.FloatField(blank=True, null=True, verbose_name='выполнение, мс')
+
+    def __str__(self):
+        return f'{self.name} #{self.pk}'
+
+    class Meta:
+        verbose_name = 'фоновая задача'
+        verbose_name_plural = 'фоновые задачи'
+        indexes = [
+            models.Index(fields=('status', 'run_after')),
+            models.Index(fields=('claimed_by',)),
+        ]
@@ -0,0 +1,27 @@
+"""
+Функции процессов пула воркера.
+
+Пул запускается методом spawn: процессы не наследуют соединения с БД
+и сокеты главного процесса. Модуль импортируется в новом процессе до
+django.setup(), поэтому модели и tasks.queue импортируются внутри функций.
+"""
+import signal
+
+import django
+from django.db import close_old_connections
+
+
+def init_process():
+    # Ctrl+C получает вся группа процессов: останавливает работу главный процесс
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    django.setup()
+
+
+def run(name, args, kwargs, timeout):
+    from tasks.queue import execute
+
+    close_old_connections()
+    try:
+        return execute(name, args, kwargs, timeout)
+    finally:
+        close_old_connections()
@@ -0,0 +1,289 @@
+"""
+Фоновые задачи в очереди на основе БД, без внешнего брокера.
+
+Задача - функция с декоратором @task в модуле tasks.py приложения:
+
+    @task(timeout=120, concurrency=2)
+    def generate_image_derivatives(product_pk):
+        ...
+
+    generate_image_derivatives.enqueue(product.pk)
+
+enqueue() пишет строку Task в текущей транзакции: воркер увидит задачу только
+после коммита, при откате она пропадет вместе с остальными изменениями.
+Аргументы должны сериализоваться в JSON. Выполняет задачи команда runworker
+(tasks.worker), при TASKS_EAGER задача выполняется в том же процессе
+в transaction.on_commit - для разработки без воркера.
+
+Упавшая задача повторяется через backoff * 2^(попытка-1) секунд. После
+max_attempts попыток она остается в таблице со статусом dead (dead letter):
+ее видно в админке, оттуда же ее можно вернуть в очередь.
+"""
+import logging
+import signal
+import threading
+import time
+import traceback
+import uuid
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from datetime import timedelta
+from importlib import import_module
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from skypro_diplom import utils
+from tasks.models import Task
+
+logger = logging.getLogger(__name__)
+
+# Захват задач и запись результата повторяются, пока SQLite занят другой транзакцией,
+# иначе "database is locked" завершает воркер
+retry_locked = utils.retry_locked('TASKS_LOCK_TIMEOUT', 'TASKS_LOCK_BACKOFF')
+
+# Параметры задачи, для которых при None берется значение из настроек
+DEFAULTS = {
+    'max_attempts': 'TASKS_MAX_ATTEMPTS',
+    'backoff': 'TASKS_RETRY_BACKOFF',
+    'timeout': 'TASKS_TIMEOUT',
+}
+
+_registry = {}
+
+
+class TaskTimeout(Exception):
+    pass
+
+
+def task(func=None, *, name=None, queue='default', max_attempts=None, backoff=None, timeout=None, concurrency=None):
+    """
+    Регистрирует функцию как фоновую задачу и добавляет ей метод enqueue(*args, **kwargs).
+
+    timeout - секунд на одну попытку, concurrency - сколько таких задач один воркер
+    выполняет одновременно (None - сколько позволяет число процессов).
+    """
+    def decorator(func):
+        func.task_name = name or f'{func.__module__}.{func.__name__}'
+        func.task_options = {'queue': queue, 'max_attempts': max_attempts, 'backoff': backoff, 'timeout': timeout,
+                             'concurrency': concurrency}
+        func.enqueue = lambda *args, **kwargs: enqueue(func, args, kwargs)
+        _registry[func.task_name] = func
+        return func
+    return decorator(func) if func is not None else decorator
+
+
+def get_task(name):
+    func = _registry.get(name)
+    if func is None and '.' in name:
+        # Модуль задачи мог быть еще не импортирован; вызвать можно только функцию с @task
+        try:
+            import_module(name.rpartition('.')[0])
+        except ImportError:
+            pass
+        func = _registry.get(name)
+    return func
+
+
+def get_option(name, option):
+    func = get_task(name)
+    value = func.task_options.get(option) if func is not None else None
+    if value is None and option in DEFAULTS:
+        value = getattr(settings, DEFAULTS[option])
+    return value
+
+
+def enqueue(func, args=(), kwargs=None, delay=0, priority=0, unique=False):
+    """
+    Ставит задачу в очередь в текущей транзакции, возвращает Task.
+
+    func - функция с @task или ее имя; delay - секунд до первой попытки;
+    unique - не ставить, если такая же задача с теми же аргументами уже ждет.
+    """
+    name = func if isinstance(func, str) else func.task_name
+    args, kwargs = list(args), dict(kwargs or {})
+    if unique:
+        existing = Task.objects.filter(name=name, status=Task.STATUS_PENDING, args=args, kwargs=kwargs).first()
+        if existing is not None:
+            return existing
+    record = Task.objects.create(
+        name=name, args=args, kwargs=kwargs, priority=priority,
+        queue=get_option(name, 'queue') or 'default',
+        max_attempts=get_option(name, 'max_attempts'),
+        run_after=timezone.now() + timedelta(seconds=delay),
+    )
+    if settings.TASKS_EAGER and not delay:
+        transaction.on_commit(lambda: run_now(record.pk))
+    return record
+
+
+def _at_limit(name, running):
+    limit = get_option(name, 'concurrency')
+    return limit is not None and running >= limit
+
+
+@retry_locked
+def claim(limit, running=(), queues=None, pks=None):
+    """
+    Забирает до limit задач, готовых к выполнению, с учетом concurrency.
+
+    running - имена задач, которые воркер уже выполняет. Задача помечается
+    выполняемой до now + timeout + TASKS_CLAIM_GRACE: если воркер упадет, после
+    этого срока ее заберет другой. Возвращает Task с атрибутом wait_ms - сколько
+    задача ждала в очереди после срока run_after.
+    """
+    now = timezone.now()
+    running = Counter(running)
+    tasks = Task.objects.filter(status__in=(Task.STATUS_PENDING, Task.STATUS_RUNNING), run_after__lte=now)
+    if queues:
+        tasks = tasks.filter(queue__in=queues)
+    if pks is not None:
+        tasks = tasks.filter(pk__in=pks)
+    saturated = [name for name, count in running.items() if _at_limit(name, count)]
+    if saturated:
+        tasks = tasks.exclude(name__in=saturated)
+
+    token = uuid.uuid4().hex
+    waits = {}
+    with transaction.atomic():
+        candidates = (
+            tasks.select_for_update(skip_locked=True)
+            .order_by('-priority', 'run_after', 'pk')
+            .values_list('pk', 'name', 'status', 'attempts', 'max_attempts', 'run_after')[:limit * 4]
+        )
+        by_timeout, abandoned = defaultdict(list), []
+        for pk, name, status, attempts, max_attempts, run_after in candidates:
+            if status == Task.STATUS_RUNNING and attempts >= max_attempts:
+                # Воркер не завершил последнюю попытку (упал или был убит)
+                abandoned.append(pk)
+                continue
+            if len(waits) >= limit or _at_limit(name, running[name]):
+                continue
+            running[name] += 1
+            waits[pk] = (now - run_after).total_seconds() * 1000
+            by_timeout[get_option(name, 'timeout')].append(pk)
+        if abandoned:
+            Task.objects.filter(pk__in=abandoned, status=Task.STATUS_RUNNING).update(
+                status=Task.STATUS_DEAD, claimed_by='', finished_at=now,
+                last_error='Воркер не завершил задачу за отведенное время')
+            logger.error('Задачи %s не завершены воркером, попытки исчерпаны', abandoned)
+        for timeout, pks in by_timeout.items():
+            # Условие повторяется: задачу, которую уже забрал или выполнил другой воркер, не перехватываем
+            Task.objects.filter(pk__in=pks, status__in=(Task.STATUS_PENDING, Task.STATUS_RUNNING),
+                                run_after__lte=now).update(
+                status=Task.STATUS_RUNNING, claimed_by=token, attempts=F('attempts') + 1, started_at=now,
+                run_after=now + timedelta(seconds=timeout + settings.TASKS_CLAIM_GRACE),
+            )
+    claimed = list(Task.objects.filter(claimed_by=token).order_by('-priority', 'pk'))
+    for record in claimed:
+        record.wait_ms = waits[record.pk]
+    return claimed
+
+
+@contextmanager
+def _time_limit(seconds):
+    # SIGALRM доступен только в главном потоке: в потоках runserver ограничения нет
+    if not seconds or not hasattr(signal, 'SIGALRM') or threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    def expire(signum, frame):
+        raise TaskTimeout(f'Задача выполнялась дольше {seconds} с')
+
+    previous = signal.signal(signal.SIGALRM, expire)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def execute(name, args, kwargs, timeout=None):
+    """Выполняет задачу, возвращает (миллисекунд, текст ошибки или None)."""
+    started = time.perf_counter()
+    try:
+        func = get_task(name)
+        if func is None:
+            raise LookupError(f'Задача {name} не зарегистрирована')
+        with _time_limit(timeout):
+            func(*args, **kwargs)
+    except Exception:
+        return (time.perf_counter() - started) * 1000, traceback.format_exc()
+    return (time.perf_counter() - started) * 1000, None
+
+
+def retry_delay(name, attempts):
+    return timedelta(seconds=get_option(name, 'backoff') * 2 ** (attempts - 1))
+
+
+@retry_locked
+def finish(record, duration_ms, error):
+    """Записывает результат попытки: выполнена, повтор после паузы или dead. Возвращает новый статус."""
+    now = timezone.now()
+    values = {'claimed_by': '', 'finished_at': now, 'duration_ms': duration_ms,
+              'wait_ms': getattr(record, 'wait_ms', None)}
+    if error is None:
+        values.update(status=Task.STATUS_DONE, last_error='')
+    elif record.attempts >= record.max_attempts:
+        values.update(status=Task.STATUS_DEAD, last_error=error)
+        logger.error('Задача %s не выполнена после %s попыток:\n%s', record, record.attempts, error)
+    else:
+        values.update(status=Task.STATUS_PENDING, last_error=error,
+                      run_after=now + retry_delay(record.name, record.attempts))
+        logger.warning('Задача %s, попытка %s:\n%s', record, record.attempts, error)
+    # Если срок захвата истек и задачу забрал другой воркер, результат записывает он
+    Task.objects.filter(pk=record.pk, claimed_by=record.claimed_by).update(**values)
+    for field, value in values.items():
+        setattr(record, field, value)
+    return record.status
+
+
+def run_now(pk):
+    """Выполняет задачу pk в текущем процессе (TASKS_EAGER), если она еще не выполнена."""
+    for record in claim(1, pks=[pk]):
+        finish(record, *execute(record.name, record.args, record.kwargs, get_option(record.name, 'timeout')))
+
+
+def requeue(queryset):
+    """Возвращает задачи (обычно dead) в очередь с новым счетчиком попыток."""
+    return queryset.exclude(status=Task.STATUS_RUNNING).update(
+        status=Task.STATUS_PENDING, attempts=0, claimed_by='', run_after=timezone.now())
+
+
+@retry_locked
+def purge():
+    """Удаляет выполненные задачи старше TASKS_KEEP_DONE секунд, dead остаются."""
+    threshold = timezone.now() - timedelta(seconds=settings.TASKS_KEEP_DONE)
+    deleted, _ = Task.objects.filter(status=Task.STATUS_DONE, finished_at__lt=threshold).delete()
+    return deleted
+
+
+def get_stats():
+    """
+    {имя задачи: {'pending': .., 'running': .., 'done': .., 'dead': .., 'retries': ..,
+    'duration_ms': {'p50': .., 'p95': .., 'p99': .., 'max': ..}, 'wait_ms': {...}}}.
+    """
+    stats = defaultdict(lambda: {'pending': 0, 'running': 0, 'done': 0, 'dead': 0, 'retries': 0})
+    for name, status, count in Task.objects.order_by().values_list('name', 'status').annotate(count=Count('pk')):
+        stats[name][status] = count
+    samples = defaultdict(lambda: {'duration_ms': [], 'wait_ms': [], 'retries': 0})
+    finished = Task.objects.filter(status__in=(Task.STATUS_DONE, Task.STATUS_DEAD)).exclude(duration_ms=None)
+    for name, attempts, duration, wait in finished.values_list('name', 'attempts', 'duration_ms', 'wait_ms'):
+        samples[name]['duration_ms'].append(duration)
+        if wait is not None:
+            samples[name]['wait_ms'].append(wait)
+        samples[name]['retries'] += attempts - 1
+    for name, rows in samples.items():
+        stats[name]['retries'] = rows['retries']
+        for metric in ('duration_ms', 'wait_ms'):
+            values = rows[metric]
+            stats[name][metric] = {
+                'p50': utils.percentile(values, 50),
+                'p95': utils.percentile(values, 95),
+                'p99': utils.percentile(values, 99),
+                'max': max(values, default=None),
+            }
+    return dict(stats)
@@ -0,0 +1,180 @@
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import OperationalError, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from tasks.models import Task
+from tasks.queue import claim, enqueue, get_stats, requeue, task
+from tasks.worker import Worker
+
+CALLS = []
+
+
+@task(max_attempts=2, backoff=10)
+def record_call(value):
+    CALLS.append(value)
+
+
+@task(max_attempts=2, backoff=10)
+def fail_always():
+    raise ValueError('boom')
+
+
+@task(timeout=0.1, max_attempts=1)
+def sleep_too_long():
+    time.sleep(5)
+
+
+@task(concurrency=1)
+def limited():
+    pass
+
+
+@task
+def square(value):
+    return value * value
+
+
+class TaskQueueTests(TestCase):
+    def setUp(self):
+        CALLS.clear()
+
+    def run_worker(self, **kwargs):
+        return Worker(processes=0, burst=True, **kwargs).run()
+
+    def test_rollback_drops_task(self):
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                record_call.enqueue(1)
+                raise RuntimeError
+        self.assertFalse(Task.objects.exists())
+
+    @override_settings(TASKS_EAGER=True)
+    def test_eager_runs_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            record = record_call.enqueue(1)
+            self.assertEqual(CALLS, [])
+        self.assertEqual(CALLS, [1])
+        record.refresh_from_db()
+        self.assertEqual((record.status, record.attempts), (Task.STATUS_DONE, 1))
+        self.assertIsNotNone(record.duration_ms)
+
+    def test_worker_runs_tasks_in_order(self):
+        for value in range(3):
+            record_call.enqueue(value)
+        enqueue(record_call, args=(10,), priority=1)
+        enqueue(record_call, args=(20,), delay=60)
+        summary = self.run_worker()
+        self.assertEqual(CALLS, [10, 0, 1, 2])
+        self.assertEqual(summary[record_call.task_name]['done'], 4)
+        self.assertEqual(Task.objects.filter(status=Task.STATUS_DONE).count(), 4)
+        self.assertEqual(Task.objects.get(status=Task.STATUS_PENDING).args, [20])
+
+    def test_retry_with_backoff_then_dead_letter(self):
+        record = fail_always.enqueue()
+        with self.assertLogs('tasks.queue', 'WARNING'):
+            self.run_worker()
+        record.refresh_from_db()
+        self.assertEqual((record.status, record.attempts), (Task.STATUS_PENDING, 1))
+        self.assertGreater(record.run_after, timezone.now() + timedelta(seconds=5))
+        self.assertIn('boom', record.last_error)
+
+        # До истечения паузы задача не берется повторно
+        self.assertEqual(self.run_worker(), {})
+        Task.objects.update(run_after=timezone.now())
+        with self.assertLogs('tasks.queue', 'ERROR'):
+            summary = self.run_worker()
+        self.assertEqual(summary[fail_always.task_name]['dead'], 1)
+        record.refresh_from_db()
+        self.assertEqual((record.status, record.attempts), (Task.STATUS_DEAD, 2))
+
+        self.assertEqual(requeue(Task.objects.filter(status=Task.STATUS_DEAD)), 1)
+        record.refresh_from_db()
+        self.assertEqual((record.status, record.attempts), (Task.STATUS_PENDING, 0))
+
+    def test_timeout(self):
+        record = sleep_too_long.enqueue()
+        started = time.monotonic()
+        with self.assertLogs('tasks.queue', 'ERROR'):
+            self.run_worker()
+        self.assertLess(time.monotonic() - started, 2)
+        record.refresh_from_db()
+        self.assertEqual(record.status, Task.STATUS_DEAD)
+        self.assertIn('TaskTimeout', record.last_error)
+
+    def test_concurrency_limit(self):
+        for _ in range(3):
+            limited.enqueue()
+        record_call.enqueue(1)
+        claimed = claim(10)
+        self.assertEqual(sorted(record.name for record in claimed), [limited.task_name, record_call.task_name])
+        Task.objects.filter(status=Task.STATUS_RUNNING).update(status=Task.STATUS_PENDING,
+                                                              run_after=timezone.now())
+        self.assertEqual(claim(10, running=[limited.task_name])[0].name, record_call.task_name)
+
+    def test_stale_claim_is_retried_then_dead(self):
+        record = record_call.enqueue(1)
+        expired = timezone.now() - timedelta(seconds=1)
+        Task.objects.filter(pk=record.pk).update(status=Task.STATUS_RUNNING, attempts=1, run_after=expired)
+        claimed, = claim(1)
+        self.assertEqual(claimed.attempts, 2)
+
+        Task.objects.filter(pk=record.pk).update(run_after=expired)
+        with self.assertLogs('tasks.queue', 'ERROR'):
+            self.assertEqual(claim(1), [])
+        record.refresh_from_db()
+        self.assertEqual(record.status, Task.STATUS_DEAD)
+
+    def test_unique(self):
+        first = enqueue(record_call, args=(1,), unique=True)
+        self.assertEqual(enqueue(record_call, args=(1,), unique=True), first)
+        self.assertNotEqual(enqueue(record_call, args=(2,), unique=True), first)
+
+    def test_process_pool(self):
+        record = square.enqueue(3)
+        summary = Worker(processes=1, burst=True, poll_interval=0.05).run()
+        self.assertEqual(summary[square.task_name]['done'], 1)
+        record.refresh_from_db()
+        self.assertEqual(record.status, Task.STATUS_DONE)
+
+    def test_commands_report_timings(self):
+        record_call.enqueue(1)
+        fail_always.enqueue()
+        out = StringIO()
+        with self.assertLogs('tasks.queue', 'WARNING'):
+            call_command('runworker', processes=0, burst=True, stdout=out)
+        self.assertIn(record_call.task_name, out.getvalue())
+
+        stats = get_stats()
+        self.assertEqual(stats[record_call.task_name]['done'], 1)
+        self.assertIsNotNone(stats[record_call.task_name]['duration_ms']['p50'])
+        self.assertEqual(stats[fail_always.task_name]['pending'], 1)
+        out = StringIO()
+        call_command('task_report', stdout=out)
+        self.assertIn('duration_ms', out.getvalue())
+
+
+class LockedDatabaseTests(TransactionTestCase):
+    def setUp(self):
+        CALLS.clear()
+
+    @override_settings(TASKS_LOCK_BACKOFF=0)
+    def test_worker_retries_when_database_locked(self):
+        record_call.enqueue(1)
+        now = timezone.now
+        errors = [OperationalError('database is locked')]
+
+        def locked_once():
+            if errors:
+                raise errors.pop()
+            return now()
+
+        with mock.patch('tasks.queue.timezone.now', side_effect=locked_once):
+            summary = Worker(processes=0, burst=True).run()
+        self.assertEqual(CALLS, [1])
+        self.assertEqual(summary[record_call.task_name]['done'], 1)
@@ -0,0 +1,150 @@
+"""
+Воркер очереди задач.
+
+Главный процесс забирает задачи из БД (tasks.queue.claim) по числу свободных
+процессов пула, с учетом concurrency каждой задачи, и записывает результат
+каждой попытки. Задачи выполняются в пуле процессов (tasks.pool), при
+processes=0 - в самом главном процессе, по одной.
+
+Время выполнения и ожидания в очереди сохраняется в строке задачи (отчет
+по всем воркерам - команда task_report) и копится воркером для сводки при остановке.
+"""
+import logging
+import multiprocessing
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from skypro_diplom.utils import percentile
+from tasks import pool
+from tasks.queue import claim, execute, finish, get_option, purge
+
+logger = logging.getLogger(__name__)
+
+PURGE_INTERVAL = 10 * 60
+
+
+class Worker:
+    def __init__(self, processes=1, queues=None, burst=False, poll_interval=None, max_tasks_per_child=None,
+                 stdout=None):
+        self.processes = processes
+        self.queues = queues
+        self.burst = burst
+        self.poll_interval = settings.TASKS_POLL_INTERVAL if poll_interval is None else poll_interval
+        self.max_tasks_per_child = max_tasks_per_child
+        self.stdout = stdout
+        self.stopping = False
+        self.running = {}
+        self.durations = defaultdict(list)
+        self.outcomes = Counter()
+        self.purged_at = None
+
+    def stop(self, *args):
+        self.stopping = True
+
+    def make_pool(self):
+        return ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context('spawn'),
+                                   initializer=pool.init_process, max_tasks_per_child=self.max_tasks_per_child)
+
+    def run(self):
+        """Выполняет задачи до stop() (в режиме burst - пока очередь не опустеет), возвращает сводку."""
+        executor = self.make_pool() if self.processes else None
+        try:
+            while not self.stopping:
+                close_old_connections()
+                self.purge_if_due()
+                claimed = self.fill(executor)
+                if self.running:
+                    done, _ = wait(self.running, timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                    if self.collect(done):
+                        executor.shutdown(wait=False, cancel_futures=True)
+                        executor = self.make_pool()
+                elif not claimed:
+                    if self.burst:
+                        break
+                    time.sleep(self.poll_interval)
+            if self.running:
+                self.collect(wait(self.running).done)
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=True, cancel_futures=True)
+            close_old_connections()
+        return self.summary()
+
+    def fill(self, executor):
+        """Забирает задачи на свободные места; без пула выполняет одну задачу сразу."""
+        if executor is None:
+            claimed = claim(1, queues=self.queues)
+            for record in claimed:
+                self.complete(record, *execute(record.name, record.args, record.kwargs,
+                                               get_option(record.name, 'timeout')))
+            return claimed
+        free = self.processes - len(self.running)
+        if free <= 0:
+            return []
+        claimed = claim(free, running=[record.name for record in self.running.values()], queues=self.queues)
+        for record in claimed:
+            future = executor.submit(pool.run, record.name, record.args, record.kwargs,
+                                     get_option(record.name, 'timeout'))
+            self.running[future] = record
+        return claimed
+
+    def collect(self, futures):
+        """Записывает результаты завершенных задач; True, если пул сломан (процесс убит) и нужен новый."""
+        broken = False
+        for future in futures:
+            record = self.running.pop(future)
+            try:
+                duration_ms, error = future.result()
+            except BrokenProcessPool as e:
+                broken = True
+                duration_ms, error = None, f'Процесс пула завершился аварийно: {e!r}'
+            except Exception as e:
+                duration_ms, error = None, repr(e)
+            self.complete(record, duration_ms, error)
+        if broken:
+            # Остальные задачи сломанного пула тоже не завершатся
+            for future, record in list(self.running.items()):
+                self.running.pop(future)
+                self.complete(record, None, 'Процесс пула завершился аварийно')
+        return broken
+
+    def complete(self, record, duration_ms, error):
+        status = finish(record, duration_ms, error)
+        self.outcomes[record.name, status] += 1
+        if duration_ms is not None:
+            self.durations[record.name].append(duration_ms)
+        self.log(f'{record}: {record.get_status_display()}, попытка {record.attempts}, '
+                 f'{duration_ms or 0:.0f} мс, ожидание {record.wait_ms or 0:.0f} мс')
+
+    def purge_if_due(self):
+        now = time.monotonic()
+        if self.purged_at is not None and now - self.purged_at < PURGE_INTERVAL:
+            return
+        self.purged_at = now
+        deleted = purge()
+        if deleted:
+            self.log(f'Удалено выполненных задач: {deleted}')
+
+    def summary(self):
+        """{имя задачи: {'done': .., 'retry': .., 'dead': .., 'p50_ms': .., 'p95_ms': .., 'max_ms': ..}}."""
+        names = {name for name, _ in self.outcomes} | set(self.durations)
+        return {
+            name: {
+                'done': self.outcomes[name, 'done'],
+                'retry': self.outcomes[name, 'pending'],
+                'dead': self.outcomes[name, 'dead'],
+                'p50_ms': percentile(self.durations[name], 50),
+                'p95_ms': percentile(self.durations[name], 95),
+                'max_ms': max(self.durations[name], default=None),
+            }
+            for name in sorted(names)
+        }
+
+    def log(self, message):
+        if self.stdout is not None:
+            self.stdout.write(message)
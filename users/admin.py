@@ -1,8 +1,14 @@
 from django.contrib import admin
 
-from users.models import User
+from users.models import User, OutgoingEmail
 
 
 @admin.register(User)
 class UserAdmin(admin.ModelAdmin):
-    list_display = ('email', 'first_name', 'last_name')
\ No newline at end of file
+    list_display = ('email', 'first_name', 'last_name')
+
+
+@admin.register(OutgoingEmail)
+class OutgoingEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status',)
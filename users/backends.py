@@ -0,0 +1,22 @@
+from django.contrib.auth.backends import ModelBackend
+
+from users.services.permissions import get_permissions
+from users.services.user_cache import get_cached_user
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    ModelBackend с кешем: пользователь сессии берется из users.services.user_cache,
+    права - из users.services.permissions, а не двумя запросами на объект пользователя.
+    """
+
+    def get_user(self, user_id):
+        user = get_cached_user(user_id)
+        return user if user is not None and self.user_can_authenticate(user) else None
+
+    def get_all_permissions(self, user_obj, obj=None):
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return set()
+        if not hasattr(user_obj, '_perm_cache'):
+            user_obj._perm_cache = get_permissions(user_obj)
+        return user_obj._perm_cache
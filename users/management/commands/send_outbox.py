@@ -0,0 +1,24 @@
+import time
+
+from django.core.management import BaseCommand
+
+from users.services.outbox import send_batch
+
+
+class Command(BaseCommand):
+    help = 'Отправка писем из очереди пачками через одно SMTP-соединение'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--loop', action='store_true', help='работать постоянно, опрашивая очередь')
+        parser.add_argument('--interval', type=float, default=5, help='пауза между опросами пустой очереди, секунд')
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = send_batch(options['batch_size'])
+            if sent or failed:
+                self.stdout.write(f'Отправлено: {sent}, с ошибкой: {failed}')
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
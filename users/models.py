@@ -1,6 +1,7 @@
 from django.contrib.auth.base_user import BaseUserManager
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.utils import timezone
 
 
 class UserManager(BaseUserManager):
@@ -55,3 +56,35 @@ class User(AbstractUser):
     REQUIRED_FIELDS = []
 
 
+class OutgoingEmail(models.Model):
+    STATUS_PENDING = 'pending'
+    STATUS_SENDING = 'sending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = (
+        (STATUS_PENDING, 'ожидает отправки'),
+        (STATUS_SENDING, 'отправляется'),
+        (STATUS_SENT, 'отправлено'),
+        (STATUS_FAILED, 'не удалось отправить'),
+    )
+
+    subject = models.CharField(max_length=255, verbose_name='тема')
+    body = models.TextField(verbose_name='текст')
+    from_email = models.CharField(max_length=254, blank=True, null=True, verbose_name='отправитель')
+    to = models.JSONField(verbose_name='получатели')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING, verbose_name='статус')
+    attempts = models.PositiveIntegerField(default=0, verbose_name='попыток')
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name='следующая попытка')
+    last_error = models.TextField(blank=True, verbose_name='последняя ошибка')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='создано')
+    sent_at = models.DateTimeField(blank=True, null=True, verbose_name='отправлено')
+
+    def __str__(self):
+        return f'{self.subject} -> {", ".join(self.to)}'
+
+    class Meta:
+        verbose_name = 'исходящее письмо'
+        verbose_name_plural = 'исходящие письма'
+        indexes = [
+            models.Index(fields=('status', 'next_attempt_at')),
+        ]
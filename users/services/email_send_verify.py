@@ -1,10 +1,10 @@
 from django.contrib.auth.tokens import default_token_generator
 from django.contrib.sites.shortcuts import get_current_site
-from django.core.mail import EmailMessage
 from django.template.loader import render_to_string
 from django.utils.http import urlsafe_base64_encode
 
 from skypro_diplom import settings
+from users.services.outbox import enqueue_email
 
 
 def send_mail_for_verify(request, user):
@@ -17,14 +17,14 @@ def send_mail_for_verify(request, user):
         'uid': urlsafe_base64_encode(force_bytes(user.pk))
     }
     message = render_to_string(
-        'users/verify_email.html',
+        'verify_email.html',
         context=context,
         )
 
-    email = EmailMessage(
+    # Письмо уходит через очередь: отправляет команда send_outbox, а не запрос
+    return enqueue_email(
         'Верификация учетной записи',
         message,
         from_email=settings.EMAIL_HOST_USER,
         to=[user.email]
         )
-    email.send()
\ No newline at end of file
@@ -0,0 +1,97 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from users.models import OutgoingEmail
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_email(subject, body, to, from_email=None):
+    """
+    Кладет письмо в очередь; запись и фоновая задача отправки (users.tasks.send_outbox)
+    создаются в текущей транзакции запроса.
+    """
+    from users.tasks import send_outbox
+
+    email = OutgoingEmail.objects.create(subject=subject, body=body, to=list(to), from_email=from_email)
+    send_outbox.enqueue()
+    return email
+
+
+def claim_batch(batch_size):
+    """
+    Забирает пачку писем на отправку.
+
+    Письма помечаются как отправляемые до now + OUTBOX_CLAIM_TIMEOUT: если воркер упадет,
+    после этого срока их заберет другой.
+    """
+    now = timezone.now()
+    claim_until = now + timedelta(seconds=settings.OUTBOX_CLAIM_TIMEOUT)
+    with transaction.atomic():
+        pks = list(
+            OutgoingEmail.objects
+            .select_for_update(skip_locked=True)
+            .filter(status__in=(OutgoingEmail.STATUS_PENDING, OutgoingEmail.STATUS_SENDING), next_attempt_at__lte=now)
+            .order_by('next_attempt_at')
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        OutgoingEmail.objects.filter(pk__in=pks).update(status=OutgoingEmail.STATUS_SENDING,
+                                                        next_attempt_at=claim_until)
+    return list(OutgoingEmail.objects.filter(pk__in=pks).order_by('pk'))
+
+
+def retry_delay(attempts):
+    return timedelta(seconds=settings.OUTBOX_RETRY_BACKOFF * 2 ** (attempts - 1))
+
+
+def _mark_failed(email, error, now):
+    email.last_error = repr(error)
+    if email.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+        email.status = OutgoingEmail.STATUS_FAILED
+        logger.error('Письмо %s не отправлено после %s попыток: %r', email.pk, email.attempts, error)
+    else:
+        email.status = OutgoingEmail.STATUS_PENDING
+        email.next_attempt_at = now + retry_delay(email.attempts)
+
+
+def send_batch(batch_size=100, connection=None):
+    """Отправляет одну пачку через одно SMTP-соединение, возвращает (отправлено, с ошибкой)."""
+    emails = claim_batch(batch_size)
+    if not emails:
+        return 0, 0
+
+    connection = connection or get_connection(fail_silently=False)
+    sent = failed = 0
+    now = timezone.now()
+    for email in emails:
+        email.attempts += 1
+    try:
+        connection.open()
+    except Exception as e:
+        for email in emails:
+            _mark_failed(email, e, now)
+        failed = len(emails)
+    else:
+        try:
+            for email in emails:
+                message = EmailMessage(email.subject, email.body, from_email=email.from_email, to=email.to,
+                                       connection=connection)
+                try:
+                    connection.send_messages([message])
+                except Exception as e:
+                    failed += 1
+                    _mark_failed(email, e, now)
+                else:
+                    sent += 1
+                    email.status = OutgoingEmail.STATUS_SENT
+                    email.sent_at = now
+                    email.last_error = ''
+        finally:
+            connection.close()
+    OutgoingEmail.objects.bulk_update(emails, ('status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at'))
+    return sent, failed
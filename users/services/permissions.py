@@ -0,0 +1,48 @@
+"""
+Действующие права пользователя.
+
+Права пользователя и его групп загружаются одним запросом и кешируются
+в общем кеше под поколением 'permissions': сигналы users.signals увеличивают
+его при изменении групп, прав групп и прав пользователей. В пределах запроса
+права хранятся на объекте пользователя (users.backends.CachedModelBackend),
+так что повторные has_perm в представлениях и шаблонах не обращаются ни к БД,
+ни к кешу.
+"""
+from django.conf import settings
+from django.contrib.auth.models import Permission
+from django.core.cache import cache
+from django.db.models import Q
+
+from catalog.caching import bump_generation, get_generations
+
+GENERATION = 'permissions'
+CACHE_TTL = 60 * 60
+
+
+def load_permissions(user):
+    """Права пользователя из БД: {'app_label.codename'}."""
+    permissions = Permission.objects.all()
+    if not user.is_superuser:
+        permissions = permissions.filter(Q(custom_user_permissions=user) | Q(group__custom_user_set=user))
+    rows = permissions.values_list('content_type__app_label', 'codename').distinct()
+    return {f'{app_label}.{codename}' for app_label, codename in rows}
+
+
+def get_permissions(user):
+    """Права активного пользователя, из кеша или load_permissions()."""
+    if not user.is_active or user.is_anonymous:
+        return set()
+    if not settings.CACHE_ENABLED:
+        return load_permissions(user)
+    generation, = get_generations([GENERATION])
+    # Признак суперпользователя в ключе: его смена не требует отдельной инвалидации
+    key = f'permissions:{user.pk}:{int(user.is_superuser)}:{generation}'
+    permissions = cache.get(key)
+    if permissions is None:
+        permissions = load_permissions(user)
+        cache.set(key, permissions, CACHE_TTL)
+    return permissions
+
+
+def invalidate_permissions():
+    bump_generation(GENERATION)
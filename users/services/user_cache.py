@@ -0,0 +1,32 @@
+"""
+Пользователь сессии из кеша.
+
+AuthenticationMiddleware на каждом запросе загружает пользователя по id из
+сессии. CachedModelBackend.get_user берет его из кеша, запись сбрасывается
+сигналами post_save/post_delete пользователя (смена пароля, блокировка,
+last_login при входе) и в любом случае живет не дольше USER_CACHE_TTL.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from users.models import User
+
+
+def _key(user_id):
+    return f'users:user:{user_id}'
+
+
+def get_cached_user(user_id):
+    """Пользователь по id или None."""
+    if not settings.CACHE_ENABLED or not settings.USER_CACHE_TTL:
+        return User._default_manager.filter(pk=user_id).first()
+    user = cache.get(_key(user_id))
+    if user is None:
+        user = User._default_manager.filter(pk=user_id).first()
+        if user is not None:
+            cache.set(_key(user_id), user, settings.USER_CACHE_TTL)
+    return user
+
+
+def invalidate_user(user_id):
+    cache.delete(_key(user_id))
@@ -0,0 +1,18 @@
+from django.db.models import Min
+from django.utils import timezone
+
+from tasks.queue import enqueue, task
+from users.models import OutgoingEmail
+from users.services.outbox import send_batch
+
+
+@task(timeout=10 * 60, concurrency=1)
+def send_outbox(batch_size=100):
+    """Отправляет письма из очереди, пока они есть; неотправленные - следующей задачей после паузы outbox."""
+    while any(send_batch(batch_size)):
+        pass
+    next_attempt_at = (OutgoingEmail.objects.filter(status=OutgoingEmail.STATUS_PENDING)
+                       .aggregate(next_attempt_at=Min('next_attempt_at'))['next_attempt_at'])
+    if next_attempt_at is not None:
+        delay = max((next_attempt_at - timezone.now()).total_seconds(), 0)
+        enqueue(send_outbox, kwargs={'batch_size': batch_size}, delay=delay, unique=True)
@@ -1,7 +1,25 @@
-from django.test import TestCase
+from datetime import timedelta
+from io import StringIO
+from smtplib import SMTPException
+from unittest import mock
+
+from django.contrib.auth.models import Group, Permission
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail import get_connection
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from catalog.models import Category, Product
-from users.models import User
+from tasks.models import Task
+from tasks.worker import Worker
+from users.models import User, OutgoingEmail
+from users.services.outbox import enqueue_email, send_batch
+from users.services.permissions import get_permissions
+from users.tasks import send_outbox
 
 
 class UserModelTests(TestCase):
@@ -66,3 +84,184 @@ class ProductTestCase(TestCase):
         self.assertEqual(response.status_code, 302)
         product.refresh_from_db()
         self.assertEqual(product.name, 'Updated Smartphone')
+
+
+class OutboxTests(TestCase):
+
+    def test_registration_queues_verification_email(self):
+        response = self.client.post(reverse('users:register'), {
+            'username': 'newuser',
+            'email': 'new@example.com',
+            'phone': '+79990000000',
+            'password1': 'Str0ng-Passw0rd!',
+            'password2': 'Str0ng-Passw0rd!',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(len(mail.outbox), 0)
+        email = OutgoingEmail.objects.get()
+        self.assertEqual(email.to, ['new@example.com'])
+        self.assertIn('verify_email', email.body)
+
+        call_command('send_outbox', stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['new@example.com'])
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutgoingEmail.STATUS_SENT)
+
+    def test_registration_rolled_back_if_email_not_queued(self):
+        with mock.patch('users.views.send_mail_for_verify', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.client.post(reverse('users:register'), {
+                    'username': 'newuser',
+                    'email': 'new@example.com',
+                    'phone': '+79990000000',
+                    'password1': 'Str0ng-Passw0rd!',
+                    'password2': 'Str0ng-Passw0rd!',
+                })
+        self.assertFalse(User.objects.filter(email='new@example.com').exists())
+
+    def test_batch_uses_one_connection(self):
+        for i in range(5):
+            enqueue_email('Subject', 'Body', [f'user{i}@example.com'])
+        connection = get_connection()
+        with mock.patch.object(connection, 'open', wraps=connection.open) as open_connection:
+            self.assertEqual(send_batch(batch_size=3, connection=connection), (3, 0))
+        open_connection.assert_called_once()
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(send_batch(batch_size=3), (2, 0))
+        self.assertEqual(send_batch(batch_size=3), (0, 0))
+
+    @override_settings(OUTBOX_MAX_ATTEMPTS=2, OUTBOX_RETRY_BACKOFF=10)
+    def test_retry_with_backoff_then_fail(self):
+        email = enqueue_email('Subject', 'Body', ['user@example.com'])
+        connection = get_connection()
+        with mock.patch.object(connection, 'send_messages', side_effect=SMTPException('down')):
+            self.assertEqual(send_batch(connection=connection), (0, 1))
+            email.refresh_from_db()
+            self.assertEqual((email.status, email.attempts), (OutgoingEmail.STATUS_PENDING, 1))
+            self.assertGreater(email.next_attempt_at, timezone.now() + timedelta(seconds=5))
+
+            # До истечения паузы письмо не берется повторно
+            self.assertEqual(send_batch(connection=connection), (0, 0))
+            OutgoingEmail.objects.update(next_attempt_at=timezone.now())
+            self.assertEqual(send_batch(connection=connection), (0, 1))
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutgoingEmail.STATUS_FAILED)
+        self.assertIn('down', email.last_error)
+
+    def test_send_task_queued_with_email(self):
+        enqueue_email('Subject', 'Body', ['user@example.com'])
+        enqueue_email('Subject', 'Body', ['other@example.com'])
+        self.assertEqual(Task.objects.filter(name=send_outbox.task_name).count(), 2)
+        Worker(processes=0, burst=True).run()
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(Task.objects.filter(status=Task.STATUS_DONE).count(), 2)
+
+    @override_settings(OUTBOX_RETRY_BACKOFF=10)
+    def test_send_task_reschedules_failed(self):
+        enqueue_email('Subject', 'Body', ['user@example.com'])
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages',
+                        side_effect=SMTPException('down')):
+            Worker(processes=0, burst=True).run()
+        retry = Task.objects.get(status=Task.STATUS_PENDING)
+        self.assertGreater(retry.run_after, timezone.now() + timedelta(seconds=5))
+
+    def test_stale_claim_is_retried(self):
+        email = enqueue_email('Subject', 'Body', ['user@example.com'])
+        OutgoingEmail.objects.filter(pk=email.pk).update(status=OutgoingEmail.STATUS_SENDING,
+                                                         next_attempt_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(send_batch(), (1, 0))
+
+
+class PermissionCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='user@example.com', password='password')
+        self.group = Group.objects.create(name='Модераторы')
+        self.change = Permission.objects.get(codename='can_change_product')
+        self.delete = Permission.objects.get(codename='can_delete_product')
+
+    def fresh_user(self):
+        return User.objects.get(pk=self.user.pk)
+
+    def test_user_and_group_permissions_in_one_query(self):
+        self.user.user_permissions.add(self.delete)
+        self.group.permissions.add(self.change)
+        self.user.groups.add(self.group)
+        user = self.fresh_user()
+        with self.assertNumQueries(1):
+            self.assertTrue(user.has_perm('catalog.can_change_product'))
+            self.assertTrue(user.has_perm('catalog.can_delete_product'))
+            self.assertFalse(user.has_perm('catalog.can_change_category'))
+        self.assertEqual(get_permissions(user), {'catalog.can_change_product', 'catalog.can_delete_product'})
+
+    def test_cached_between_requests(self):
+        self.user.user_permissions.add(self.change)
+        self.assertTrue(self.fresh_user().has_perm('catalog.can_change_product'))
+        user = self.fresh_user()
+        with self.assertNumQueries(0):
+            self.assertTrue(user.has_perm('catalog.can_change_product'))
+
+    def test_invalidated_when_groups_or_permissions_change(self):
+        self.user.groups.add(self.group)
+        self.assertFalse(self.fresh_user().has_perm('catalog.can_change_product'))
+        self.group.permissions.add(self.change)
+        self.assertTrue(self.fresh_user().has_perm('catalog.can_change_product'))
+        self.user.groups.remove(self.group)
+        self.assertFalse(self.fresh_user().has_perm('catalog.can_change_product'))
+        self.user.user_permissions.add(self.change)
+        self.assertTrue(self.fresh_user().has_perm('catalog.can_change_product'))
+        self.user.user_permissions.clear()
+        self.assertFalse(self.fresh_user().has_perm('catalog.can_change_product'))
+
+    def test_superuser_and_inactive(self):
+        self.user.is_superuser = True
+        self.user.save()
+        self.assertTrue(self.fresh_user().has_perm('catalog.can_delete_product'))
+        self.user.is_active = False
+        self.user.save()
+        self.assertFalse(self.fresh_user().has_perm('catalog.can_delete_product'))
+
+
+class AuthHotPathTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='user@example.com', password='password')
+        category = Category.objects.create(name='Еда', description='')
+        product = Product.objects.create(name='Хлеб', description='хлеб', category=category, price_per_unit=10,
+                                         owner=self.user)
+        self.url = reverse('catalog:product_detail', args=[product.pk])
+
+    def test_password_rehashed_on_login(self):
+        with override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.PBKDF2PasswordHasher']):
+            self.user.set_password('password')
+            self.user.save()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$'))
+        with override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.ScryptPasswordHasher',
+                                                 'django.contrib.auth.hashers.PBKDF2PasswordHasher']):
+            response = self.client.post(reverse('users:login'), {'username': self.user.email, 'password': 'password'})
+        self.assertEqual(response.status_code, 302)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('scrypt$'))
+
+    def test_session_user_is_cached(self):
+        self.client.force_login(self.user)
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.assertFalse([q for q in context.captured_queries if 'users_user' in q['sql']])
+
+    def test_cached_user_invalidated_on_save(self):
+        self.client.force_login(self.user)
+        self.client.get(self.url)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get(self.url).status_code, 302)
+
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.cached_db')
+    def test_cached_db_sessions(self):
+        self.client.force_login(self.user)
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.assertFalse([q for q in context.captured_queries if 'django_session' in q['sql']])
@@ -4,7 +4,7 @@ from django.views.decorators.cache import never_cache
 from django.views.generic import TemplateView
 from users.apps import UsersConfig
 from users.views import ProfileUpdateView, RegisterView, CustomPasswordResetView, \
-    CustomPasswordResetConfirmView, CustomPasswordResetDoneView, CustomPasswordResetCompleteView
+    CustomPasswordResetConfirmView, CustomPasswordResetDoneView, CustomPasswordResetCompleteView, EmailVerify
 
 app_name = 'user'
 
@@ -13,6 +13,7 @@ urlpatterns = [
     path('logout/', LogoutView.as_view(), name='logout'),
     path('profile/', ProfileUpdateView.as_view(), name='profile'),
     path('register/', RegisterView.as_view(), name='register'),
+    path('verify_email/<uidb64>/<token>/', EmailVerify.as_view(), name='verify_email'),
     path('password/reset/', CustomPasswordResetView.as_view(), name='password_reset'),
     path('confirm_email/', TemplateView.as_view(template_name='users/confirm_email.html'), name='confirm_email'),
     path('invalid_verify/', TemplateView.as_view(template_name='users/invalid_verify.html'), name='invalid_verify'),
@@ -4,6 +4,7 @@ from django.contrib.auth.tokens import default_token_generator
 from django.contrib.auth.views import PasswordResetConfirmView, PasswordResetView, PasswordResetDoneView, \
     PasswordResetCompleteView
 from django.core.exceptions import ValidationError
+from django.db import transaction
 from django.http import Http404
 from django.shortcuts import redirect
 from django.urls import reverse_lazy
@@ -53,8 +54,11 @@ class RegisterView(CreateView):
         return reverse_lazy('users:login')
 
     def form_valid(self, form):
-        user = form.save()
-        return super().form_valid(form)
+        # Пользователь и письмо подтверждения сохраняются вместе или не сохраняются вовсе
+        with transaction.atomic():
+            response = super().form_valid(form)
+            send_mail_for_verify(self.request, self.object)
+        return response
 
 
 class EmailVerify(generic.View):